@@ -0,0 +1,49 @@
+"""store timestamps as timestamptz
+
+Revision ID: 3c9e1f7a2b44
+Revises: af50e9f22322
+Create Date: 2026-10-18 09:12:41.208315
+
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "3c9e1f7a2b44"
+down_revision: Union[str, None] = "af50e9f22322"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# The async driver (asyncpg) refuses timezone-aware values for naive columns,
+# and every timestamp the application writes is UTC-aware (helpers.utc_now).
+TABLES = ("team", "user", "wastelog")
+COLUMNS = ("created_at", "updated_at")
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    for table in TABLES:
+        for column in COLUMNS:
+            op.alter_column(
+                table,
+                column,
+                type_=sa.DateTime(timezone=True),
+                existing_nullable=False,
+                postgresql_using=f"{column} AT TIME ZONE 'UTC'",
+            )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    for table in TABLES:
+        for column in COLUMNS:
+            op.alter_column(
+                table,
+                column,
+                type_=sa.DateTime(),
+                existing_nullable=False,
+                postgresql_using=f"{column} AT TIME ZONE 'UTC'",
+            )
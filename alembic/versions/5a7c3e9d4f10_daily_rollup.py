@@ -0,0 +1,131 @@
+"""daily waste rollup table and triggers
+
+Revision ID: 5a7c3e9d4f10
+Revises: 8d2f6b0c1e57
+Create Date: 2026-10-18 11:26:52.830417
+
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "5a7c3e9d4f10"
+down_revision: Union[str, None] = "8d2f6b0c1e57"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        "wastelog_daily_rollup",
+        sa.Column("team_id", sa.Integer(), nullable=False),
+        sa.Column("day", sa.Date(), nullable=False),
+        sa.Column(
+            "waste_type",
+            postgresql.ENUM(name="wastetype", create_type=False),
+            nullable=False,
+        ),
+        sa.Column("entry_count", sa.Integer(), nullable=False),
+        sa.Column("total_kg", sa.Float(), nullable=False),
+        sa.ForeignKeyConstraint(
+            ["team_id"],
+            ["team.id"],
+        ),
+        sa.PrimaryKeyConstraint("team_id", "day", "waste_type"),
+    )
+
+    op.execute(
+        """
+        CREATE OR REPLACE FUNCTION wastelog_rollup_apply(
+            p_team_id integer,
+            p_day date,
+            p_waste_type wastetype,
+            p_count integer,
+            p_kg double precision
+        ) RETURNS void AS $$
+        BEGIN
+            INSERT INTO wastelog_daily_rollup AS r
+                (team_id, day, waste_type, entry_count, total_kg)
+            VALUES (p_team_id, p_day, p_waste_type, p_count, p_kg)
+            ON CONFLICT (team_id, day, waste_type) DO UPDATE
+                SET entry_count = r.entry_count + EXCLUDED.entry_count,
+                    total_kg = r.total_kg + EXCLUDED.total_kg;
+            IF p_count < 0 THEN
+                DELETE FROM wastelog_daily_rollup
+                WHERE team_id = p_team_id
+                  AND day = p_day
+                  AND waste_type = p_waste_type
+                  AND entry_count <= 0;
+            END IF;
+        END;
+        $$ LANGUAGE plpgsql
+        """
+    )
+    op.execute(
+        """
+        CREATE OR REPLACE FUNCTION wastelog_rollup_trigger() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                PERFORM wastelog_rollup_apply(
+                    OLD.team_id,
+                    (OLD.created_at AT TIME ZONE 'UTC')::date,
+                    OLD.waste_type,
+                    -1,
+                    -OLD.weight_kg
+                );
+            END IF;
+            IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                PERFORM wastelog_rollup_apply(
+                    NEW.team_id,
+                    (NEW.created_at AT TIME ZONE 'UTC')::date,
+                    NEW.waste_type,
+                    1,
+                    NEW.weight_kg
+                );
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+        """
+    )
+
+    # Backfill and install the trigger with writes blocked, so nothing is
+    # counted twice or missed
+    op.execute("LOCK TABLE wastelog IN SHARE ROW EXCLUSIVE MODE")
+    op.execute(
+        """
+        INSERT INTO wastelog_daily_rollup
+            (team_id, day, waste_type, entry_count, total_kg)
+        SELECT team_id,
+               (created_at AT TIME ZONE 'UTC')::date,
+               waste_type,
+               count(*),
+               sum(weight_kg)
+        FROM wastelog
+        GROUP BY 1, 2, 3
+        """
+    )
+    op.execute(
+        """
+        CREATE TRIGGER wastelog_rollup
+        AFTER INSERT OR DELETE OR UPDATE OF team_id, created_at, waste_type, weight_kg
+        ON wastelog
+        FOR EACH ROW EXECUTE FUNCTION wastelog_rollup_trigger()
+        """
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute("DROP TRIGGER IF EXISTS wastelog_rollup ON wastelog")
+    op.execute("DROP FUNCTION IF EXISTS wastelog_rollup_trigger()")
+    op.execute(
+        "DROP FUNCTION IF EXISTS "
+        "wastelog_rollup_apply(integer, date, wastetype, integer, double precision)"
+    )
+    op.drop_table("wastelog_daily_rollup")
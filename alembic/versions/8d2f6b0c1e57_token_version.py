@@ -0,0 +1,38 @@
+"""replace stored auth tokens with a token version
+
+Revision ID: 8d2f6b0c1e57
+Revises: 3c9e1f7a2b44
+Create Date: 2026-10-18 10:03:17.554102
+
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+import sqlmodel
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "8d2f6b0c1e57"
+down_revision: Union[str, None] = "3c9e1f7a2b44"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # adding a column with a constant default doesn't rewrite the table
+    op.add_column(
+        "user",
+        sa.Column("token_version", sa.Integer(), server_default="0", nullable=False),
+    )
+    op.drop_column("user", "auth_token")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.add_column(
+        "user",
+        sa.Column("auth_token", sqlmodel.sql.sqltypes.AutoString(), nullable=True),
+    )
+    op.drop_column("user", "token_version")
@@ -0,0 +1,41 @@
+"""index wastelog on (team_id, created_at)
+
+Revision ID: b7e2d4a91c36
+Revises: 5a7c3e9d4f10
+Create Date: 2026-10-18 12:40:09.371926
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "b7e2d4a91c36"
+down_revision: Union[str, None] = "5a7c3e9d4f10"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # built without blocking writes, which needs to run outside a transaction
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_wastelog_team_id_created_at",
+            "wastelog",
+            ["team_id", "created_at"],
+            unique=False,
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            "ix_wastelog_team_id_created_at",
+            table_name="wastelog",
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
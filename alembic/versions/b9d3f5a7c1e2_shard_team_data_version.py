@@ -0,0 +1,127 @@
+"""shard the teams' data versions to avoid a hot row per team
+
+Revision ID: b9d3f5a7c1e2
+Revises: a4c8e2f6b913
+Create Date: 2026-10-19 09:14:52.207316
+
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "b9d3f5a7c1e2"
+down_revision: Union[str, None] = "a4c8e2f6b913"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# app/db/data_version.py
+DATA_VERSION_SHARDS = 16
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        "team_data_version",
+        sa.Column("team_id", sa.Integer(), nullable=False),
+        sa.Column("shard", sa.Integer(), nullable=False),
+        sa.Column("version", sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(["team_id"], ["team.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("team_id", "shard"),
+    )
+    # carry the versions over, so the ETags handed out so far stay valid
+    op.execute(
+        """
+        INSERT INTO team_data_version (team_id, shard, version)
+        SELECT id, 0, data_version FROM team WHERE data_version > 0
+        """
+    )
+    op.execute(
+        f"""
+        CREATE OR REPLACE FUNCTION team_data_version_bump(p_team_ids integer[])
+        RETURNS void AS $$
+        BEGIN
+            INSERT INTO team_data_version AS v (team_id, shard, version)
+            SELECT team_id, pg_backend_pid() % {DATA_VERSION_SHARDS}, 1
+            FROM unnest(p_team_ids) AS team_id
+            ORDER BY team_id
+            ON CONFLICT (team_id, shard) DO UPDATE SET version = v.version + 1;
+        END;
+        $$ LANGUAGE plpgsql
+        """
+    )
+    op.execute(
+        """
+        CREATE OR REPLACE FUNCTION wastelog_team_version_trigger()
+        RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP = 'INSERT' THEN
+                PERFORM team_data_version_bump(
+                    ARRAY(SELECT DISTINCT team_id FROM new_rows)
+                );
+            ELSIF TG_OP = 'DELETE' THEN
+                PERFORM team_data_version_bump(
+                    ARRAY(SELECT DISTINCT team_id FROM old_rows)
+                );
+            ELSE
+                PERFORM team_data_version_bump(
+                    ARRAY(
+                        SELECT team_id FROM new_rows
+                        UNION
+                        SELECT team_id FROM old_rows
+                    )
+                );
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+        """
+    )
+    op.drop_column("team", "data_version")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.add_column(
+        "team",
+        sa.Column("data_version", sa.Integer(), server_default="0", nullable=False),
+    )
+    op.execute(
+        """
+        UPDATE team SET data_version = versions.version
+        FROM (
+            SELECT team_id, sum(version) AS version
+            FROM team_data_version
+            GROUP BY team_id
+        ) AS versions
+        WHERE team.id = versions.team_id
+        """
+    )
+    op.execute(
+        """
+        CREATE OR REPLACE FUNCTION wastelog_team_version_trigger()
+        RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP = 'INSERT' THEN
+                UPDATE team SET data_version = data_version + 1
+                WHERE id IN (SELECT team_id FROM new_rows);
+            ELSIF TG_OP = 'DELETE' THEN
+                UPDATE team SET data_version = data_version + 1
+                WHERE id IN (SELECT team_id FROM old_rows);
+            ELSE
+                UPDATE team SET data_version = data_version + 1
+                WHERE id IN (
+                    SELECT team_id FROM new_rows
+                    UNION
+                    SELECT team_id FROM old_rows
+                );
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+        """
+    )
+    op.execute("DROP FUNCTION team_data_version_bump(integer[])")
+    op.drop_table("team_data_version")
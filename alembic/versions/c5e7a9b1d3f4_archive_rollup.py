@@ -0,0 +1,47 @@
+"""daily totals of archived waste logs
+
+Revision ID: c5e7a9b1d3f4
+Revises: b9d3f5a7c1e2
+Create Date: 2026-10-20 10:41:06.318254
+
+Logs archived before this revision are only in their Parquet files: run
+`python -m app.db.archive --rebuild-totals` once to count them again.
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "c5e7a9b1d3f4"
+down_revision: Union[str, None] = "b9d3f5a7c1e2"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        "wastelog_archive_rollup",
+        sa.Column("team_id", sa.Integer(), nullable=False),
+        sa.Column("day", sa.Date(), nullable=False),
+        sa.Column(
+            "waste_type",
+            postgresql.ENUM(name="wastetype", create_type=False),
+            nullable=False,
+        ),
+        sa.Column("entry_count", sa.Integer(), nullable=False),
+        sa.Column("total_kg", sa.Float(), nullable=False),
+        sa.ForeignKeyConstraint(
+            ["team_id"],
+            ["team.id"],
+        ),
+        sa.PrimaryKeyConstraint("team_id", "day", "waste_type"),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table("wastelog_archive_rollup")
@@ -0,0 +1,154 @@
+"""apply rollup inserts and deletes per statement
+
+Revision ID: c93a5f1e7b08
+Revises: e41f0c8b5d27
+Create Date: 2026-10-18 14:31:05.662813
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "c93a5f1e7b08"
+down_revision: Union[str, None] = "e41f0c8b5d27"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # swap the triggers with writes blocked, so nothing is counted twice or missed
+    op.execute("LOCK TABLE wastelog IN SHARE ROW EXCLUSIVE MODE")
+    op.execute("DROP TRIGGER wastelog_rollup ON wastelog")
+
+    op.execute(
+        """
+        CREATE OR REPLACE FUNCTION wastelog_rollup_statement_trigger()
+        RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP = 'INSERT' THEN
+                PERFORM wastelog_rollup_apply(
+                    team_id, day, waste_type, entry_count, total_kg
+                )
+                FROM (
+                    SELECT team_id,
+                           (created_at AT TIME ZONE 'UTC')::date AS day,
+                           waste_type,
+                           count(*)::integer AS entry_count,
+                           sum(weight_kg) AS total_kg
+                    FROM new_rows
+                    GROUP BY 1, 2, 3
+                ) AS deltas;
+            ELSIF TG_OP = 'DELETE' THEN
+                PERFORM wastelog_rollup_apply(
+                    team_id, day, waste_type, -entry_count, -total_kg
+                )
+                FROM (
+                    SELECT team_id,
+                           (created_at AT TIME ZONE 'UTC')::date AS day,
+                           waste_type,
+                           count(*)::integer AS entry_count,
+                           sum(weight_kg) AS total_kg
+                    FROM old_rows
+                    GROUP BY 1, 2, 3
+                ) AS deltas;
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+        """
+    )
+    op.execute(
+        """
+        CREATE OR REPLACE FUNCTION wastelog_rollup_trigger() RETURNS trigger AS $$
+        BEGIN
+            PERFORM wastelog_rollup_apply(
+                OLD.team_id,
+                (OLD.created_at AT TIME ZONE 'UTC')::date,
+                OLD.waste_type,
+                -1,
+                -OLD.weight_kg
+            );
+            PERFORM wastelog_rollup_apply(
+                NEW.team_id,
+                (NEW.created_at AT TIME ZONE 'UTC')::date,
+                NEW.waste_type,
+                1,
+                NEW.weight_kg
+            );
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+        """
+    )
+
+    op.execute(
+        """
+        CREATE TRIGGER wastelog_rollup_insert
+        AFTER INSERT ON wastelog
+        REFERENCING NEW TABLE AS new_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION wastelog_rollup_statement_trigger()
+        """
+    )
+    op.execute(
+        """
+        CREATE TRIGGER wastelog_rollup_delete
+        AFTER DELETE ON wastelog
+        REFERENCING OLD TABLE AS old_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION wastelog_rollup_statement_trigger()
+        """
+    )
+    op.execute(
+        """
+        CREATE TRIGGER wastelog_rollup_update
+        AFTER UPDATE OF team_id, created_at, waste_type, weight_kg
+        ON wastelog
+        FOR EACH ROW EXECUTE FUNCTION wastelog_rollup_trigger()
+        """
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute("LOCK TABLE wastelog IN SHARE ROW EXCLUSIVE MODE")
+    op.execute("DROP TRIGGER wastelog_rollup_insert ON wastelog")
+    op.execute("DROP TRIGGER wastelog_rollup_delete ON wastelog")
+    op.execute("DROP TRIGGER wastelog_rollup_update ON wastelog")
+    op.execute("DROP FUNCTION wastelog_rollup_statement_trigger()")
+
+    op.execute(
+        """
+        CREATE OR REPLACE FUNCTION wastelog_rollup_trigger() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                PERFORM wastelog_rollup_apply(
+                    OLD.team_id,
+                    (OLD.created_at AT TIME ZONE 'UTC')::date,
+                    OLD.waste_type,
+                    -1,
+                    -OLD.weight_kg
+                );
+            END IF;
+            IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                PERFORM wastelog_rollup_apply(
+                    NEW.team_id,
+                    (NEW.created_at AT TIME ZONE 'UTC')::date,
+                    NEW.waste_type,
+                    1,
+                    NEW.weight_kg
+                );
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+        """
+    )
+    op.execute(
+        """
+        CREATE TRIGGER wastelog_rollup
+        AFTER INSERT OR DELETE OR UPDATE OF team_id, created_at, waste_type, weight_kg
+        ON wastelog
+        FOR EACH ROW EXECUTE FUNCTION wastelog_rollup_trigger()
+        """
+    )
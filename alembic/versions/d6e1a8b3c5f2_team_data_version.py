@@ -0,0 +1,84 @@
+"""version every team's waste log data for conditional GETs
+
+Revision ID: d6e1a8b3c5f2
+Revises: f2b8d6a4c190
+Create Date: 2026-10-18 21:12:40.318224
+
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "d6e1a8b3c5f2"
+down_revision: Union[str, None] = "f2b8d6a4c190"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # adding a column with a constant default doesn't rewrite the table
+    op.add_column(
+        "team",
+        sa.Column("data_version", sa.Integer(), server_default="0", nullable=False),
+    )
+    op.execute(
+        """
+        CREATE OR REPLACE FUNCTION wastelog_team_version_trigger()
+        RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP = 'INSERT' THEN
+                UPDATE team SET data_version = data_version + 1
+                WHERE id IN (SELECT team_id FROM new_rows);
+            ELSIF TG_OP = 'DELETE' THEN
+                UPDATE team SET data_version = data_version + 1
+                WHERE id IN (SELECT team_id FROM old_rows);
+            ELSE
+                UPDATE team SET data_version = data_version + 1
+                WHERE id IN (
+                    SELECT team_id FROM new_rows
+                    UNION
+                    SELECT team_id FROM old_rows
+                );
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+        """
+    )
+    op.execute(
+        """
+        CREATE TRIGGER wastelog_team_version_insert
+        AFTER INSERT ON wastelog
+        REFERENCING NEW TABLE AS new_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION wastelog_team_version_trigger()
+        """
+    )
+    op.execute(
+        """
+        CREATE TRIGGER wastelog_team_version_delete
+        AFTER DELETE ON wastelog
+        REFERENCING OLD TABLE AS old_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION wastelog_team_version_trigger()
+        """
+    )
+    op.execute(
+        """
+        CREATE TRIGGER wastelog_team_version_update
+        AFTER UPDATE ON wastelog
+        REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION wastelog_team_version_trigger()
+        """
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute("DROP TRIGGER wastelog_team_version_insert ON wastelog")
+    op.execute("DROP TRIGGER wastelog_team_version_delete ON wastelog")
+    op.execute("DROP TRIGGER wastelog_team_version_update ON wastelog")
+    op.execute("DROP FUNCTION wastelog_team_version_trigger()")
+    op.drop_column("team", "data_version")
@@ -0,0 +1,90 @@
+"""upsert the daily rollup rows in key order
+
+Revision ID: d8f4a2c6e0b7
+Revises: c5e7a9b1d3f4
+Create Date: 2026-10-21 09:37:14.602581
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "d8f4a2c6e0b7"
+down_revision: Union[str, None] = "c5e7a9b1d3f4"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+ORDER_BY = "\n            ORDER BY team_id, day, waste_type"
+
+# concurrent writes that overlap lock the rollup rows in the same order, so
+# they don't deadlock (app/db/rollup.py)
+STATEMENT_TRIGGER_FUNCTION = """
+CREATE OR REPLACE FUNCTION wastelog_rollup_statement_trigger() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        PERFORM wastelog_rollup_apply(team_id, day, waste_type, entry_count, total_kg)
+        FROM (
+            SELECT team_id,
+                   (created_at AT TIME ZONE 'UTC')::date AS day,
+                   waste_type,
+                   count(*)::integer AS entry_count,
+                   sum(weight_kg) AS total_kg
+            FROM new_rows
+            GROUP BY 1, 2, 3
+            ORDER BY team_id, day, waste_type
+        ) AS deltas;
+    ELSIF TG_OP = 'DELETE' THEN
+        PERFORM wastelog_rollup_apply(team_id, day, waste_type, -entry_count, -total_kg)
+        FROM (
+            SELECT team_id,
+                   (created_at AT TIME ZONE 'UTC')::date AS day,
+                   waste_type,
+                   count(*)::integer AS entry_count,
+                   sum(weight_kg) AS total_kg
+            FROM old_rows
+            GROUP BY 1, 2, 3
+            ORDER BY team_id, day, waste_type
+        ) AS deltas;
+    ELSE
+        PERFORM wastelog_rollup_apply(team_id, day, waste_type, entry_count, total_kg)
+        FROM (
+            SELECT team_id,
+                   day,
+                   waste_type,
+                   sum(entry_count)::integer AS entry_count,
+                   sum(total_kg) AS total_kg
+            FROM (
+                SELECT team_id,
+                       (created_at AT TIME ZONE 'UTC')::date AS day,
+                       waste_type,
+                       1 AS entry_count,
+                       weight_kg AS total_kg
+                FROM new_rows
+                UNION ALL
+                SELECT team_id,
+                       (created_at AT TIME ZONE 'UTC')::date,
+                       waste_type,
+                       -1,
+                       -weight_kg
+                FROM old_rows
+            ) AS changes
+            GROUP BY 1, 2, 3
+            ORDER BY team_id, day, waste_type
+        ) AS deltas
+        WHERE entry_count <> 0 OR total_kg <> 0;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql
+"""
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute(STATEMENT_TRIGGER_FUNCTION)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute(STATEMENT_TRIGGER_FUNCTION.replace(ORDER_BY, ""))
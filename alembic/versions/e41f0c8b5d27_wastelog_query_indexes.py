@@ -0,0 +1,95 @@
+"""index wastelog for team/time and time ordered queries
+
+Revision ID: e41f0c8b5d27
+Revises: b7e2d4a91c36
+Create Date: 2026-10-18 13:52:36.104458
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "e41f0c8b5d27"
+down_revision: Union[str, None] = "b7e2d4a91c36"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Built and dropped without blocking writes, which needs to run outside a
+    # transaction. If a concurrent build fails it leaves an INVALID index
+    # behind: drop it and run the upgrade again.
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_wastelog_team_id_created_at_id",
+            "wastelog",
+            ["team_id", "created_at", "id"],
+            unique=False,
+            postgresql_include=["waste_type", "weight_kg"],
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+        op.create_index(
+            "ix_wastelog_created_at_id",
+            "wastelog",
+            ["created_at", "id"],
+            unique=False,
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+        op.create_index(
+            "brin_wastelog_created_at",
+            "wastelog",
+            ["created_at"],
+            unique=False,
+            postgresql_using="brin",
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+        # both are prefixes of ix_wastelog_team_id_created_at_id
+        op.drop_index(
+            "ix_wastelog_team_id_created_at",
+            table_name="wastelog",
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
+        op.drop_index(
+            "ix_wastelog_team_id",
+            table_name="wastelog",
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_wastelog_team_id",
+            "wastelog",
+            ["team_id"],
+            unique=False,
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+        op.create_index(
+            "ix_wastelog_team_id_created_at",
+            "wastelog",
+            ["team_id", "created_at"],
+            unique=False,
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+        for index_name in (
+            "brin_wastelog_created_at",
+            "ix_wastelog_created_at_id",
+            "ix_wastelog_team_id_created_at_id",
+        ):
+            op.drop_index(
+                index_name,
+                table_name="wastelog",
+                postgresql_concurrently=True,
+                if_exists=True,
+            )
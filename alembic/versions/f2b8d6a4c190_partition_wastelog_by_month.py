@@ -0,0 +1,355 @@
+"""partition wastelog by month of created_at
+
+Revision ID: f2b8d6a4c190
+Revises: c93a5f1e7b08
+Create Date: 2026-10-18 15:47:21.930274
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "f2b8d6a4c190"
+down_revision: Union[str, None] = "c93a5f1e7b08"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+COLUMNS = (
+    "id, waste_type, weight_kg, description, team_id, created_by_id, "
+    "created_at, updated_at"
+)
+
+# the rollup trigger function that applies inserts, deletes and (net) updates
+# per statement; row-level UPDATE triggers don't fire for rows that move to
+# another partition
+STATEMENT_TRIGGER_FUNCTION = """
+CREATE OR REPLACE FUNCTION wastelog_rollup_statement_trigger() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        PERFORM wastelog_rollup_apply(team_id, day, waste_type, entry_count, total_kg)
+        FROM (
+            SELECT team_id,
+                   (created_at AT TIME ZONE 'UTC')::date AS day,
+                   waste_type,
+                   count(*)::integer AS entry_count,
+                   sum(weight_kg) AS total_kg
+            FROM new_rows
+            GROUP BY 1, 2, 3
+        ) AS deltas;
+    ELSIF TG_OP = 'DELETE' THEN
+        PERFORM wastelog_rollup_apply(team_id, day, waste_type, -entry_count, -total_kg)
+        FROM (
+            SELECT team_id,
+                   (created_at AT TIME ZONE 'UTC')::date AS day,
+                   waste_type,
+                   count(*)::integer AS entry_count,
+                   sum(weight_kg) AS total_kg
+            FROM old_rows
+            GROUP BY 1, 2, 3
+        ) AS deltas;
+    ELSE
+        PERFORM wastelog_rollup_apply(team_id, day, waste_type, entry_count, total_kg)
+        FROM (
+            SELECT team_id,
+                   day,
+                   waste_type,
+                   sum(entry_count)::integer AS entry_count,
+                   sum(total_kg) AS total_kg
+            FROM (
+                SELECT team_id,
+                       (created_at AT TIME ZONE 'UTC')::date AS day,
+                       waste_type,
+                       1 AS entry_count,
+                       weight_kg AS total_kg
+                FROM new_rows
+                UNION ALL
+                SELECT team_id,
+                       (created_at AT TIME ZONE 'UTC')::date,
+                       waste_type,
+                       -1,
+                       -weight_kg
+                FROM old_rows
+            ) AS changes
+            GROUP BY 1, 2, 3
+        ) AS deltas
+        WHERE entry_count <> 0 OR total_kg <> 0;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql
+"""
+
+# the state before this revision: inserts and deletes per statement, updates
+# per row
+PREVIOUS_STATEMENT_TRIGGER_FUNCTION = """
+CREATE OR REPLACE FUNCTION wastelog_rollup_statement_trigger() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        PERFORM wastelog_rollup_apply(team_id, day, waste_type, entry_count, total_kg)
+        FROM (
+            SELECT team_id,
+                   (created_at AT TIME ZONE 'UTC')::date AS day,
+                   waste_type,
+                   count(*)::integer AS entry_count,
+                   sum(weight_kg) AS total_kg
+            FROM new_rows
+            GROUP BY 1, 2, 3
+        ) AS deltas;
+    ELSIF TG_OP = 'DELETE' THEN
+        PERFORM wastelog_rollup_apply(team_id, day, waste_type, -entry_count, -total_kg)
+        FROM (
+            SELECT team_id,
+                   (created_at AT TIME ZONE 'UTC')::date AS day,
+                   waste_type,
+                   count(*)::integer AS entry_count,
+                   sum(weight_kg) AS total_kg
+            FROM old_rows
+            GROUP BY 1, 2, 3
+        ) AS deltas;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql
+"""
+
+PREVIOUS_ROW_TRIGGER_FUNCTION = """
+CREATE OR REPLACE FUNCTION wastelog_rollup_trigger() RETURNS trigger AS $$
+BEGIN
+    PERFORM wastelog_rollup_apply(
+        OLD.team_id,
+        (OLD.created_at AT TIME ZONE 'UTC')::date,
+        OLD.waste_type,
+        -1,
+        -OLD.weight_kg
+    );
+    PERFORM wastelog_rollup_apply(
+        NEW.team_id,
+        (NEW.created_at AT TIME ZONE 'UTC')::date,
+        NEW.waste_type,
+        1,
+        NEW.weight_kg
+    );
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql
+"""
+
+# Creates the monthly partitions wastelog_yYYYYmMM for every month from
+# p_first_month through p_last_month that doesn't have one yet, and returns
+# their names. A new partition is filled and attached as a separate table;
+# rows for that month that went to the default partition move in. ATTACH
+# PARTITION only takes a SHARE UPDATE EXCLUSIVE lock on wastelog, but it
+# locks wastelog_default ACCESS EXCLUSIVE and scans it to check that no row
+# belongs to the new range, blocking writes that land there meanwhile. The
+# default partition is meant to stay empty (see app/db/partitions.py), which
+# makes that check trivial.
+ENSURE_PARTITIONS_FUNCTION = """
+CREATE OR REPLACE FUNCTION wastelog_ensure_partitions(
+    p_first_month date,
+    p_last_month date
+) RETURNS SETOF text AS $$
+DECLARE
+    v_month date := date_trunc('month', p_first_month)::date;
+    v_lower timestamptz;
+    v_upper timestamptz;
+    v_name text;
+BEGIN
+    -- every API worker runs this; one at a time
+    PERFORM pg_advisory_xact_lock(hashtext('wastelog_ensure_partitions'));
+    WHILE v_month <= p_last_month LOOP
+        v_name := 'wastelog_' || to_char(v_month, '"y"YYYY"m"MM');
+        IF to_regclass(v_name) IS NULL THEN
+            v_lower := v_month::timestamp AT TIME ZONE 'UTC';
+            v_upper := (v_month + interval '1 month')::timestamp AT TIME ZONE 'UTC';
+            EXECUTE format(
+                'CREATE TABLE %I (LIKE wastelog'
+                '    INCLUDING DEFAULTS INCLUDING CONSTRAINTS)',
+                v_name
+            );
+            EXECUTE format(
+                'WITH moved AS ('
+                '    DELETE FROM wastelog_default'
+                '    WHERE created_at >= $1 AND created_at < $2'
+                '    RETURNING *'
+                ') INSERT INTO %I SELECT * FROM moved',
+                v_name
+            ) USING v_lower, v_upper;
+            EXECUTE format(
+                'ALTER TABLE wastelog ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+                v_name, v_lower, v_upper
+            );
+            RETURN NEXT v_name;
+        END IF;
+        v_month := (v_month + interval '1 month')::date;
+    END LOOP;
+END;
+$$ LANGUAGE plpgsql
+"""
+
+
+def create_indexes() -> None:
+    op.execute(
+        "CREATE INDEX ix_wastelog_team_id_created_at_id ON wastelog "
+        "(team_id, created_at, id) INCLUDE (waste_type, weight_kg)"
+    )
+    op.execute("CREATE INDEX ix_wastelog_created_at_id ON wastelog (created_at, id)")
+    op.execute(
+        "CREATE INDEX brin_wastelog_created_at ON wastelog USING brin (created_at)"
+    )
+    op.execute("CREATE INDEX ix_wastelog_created_by_id ON wastelog (created_by_id)")
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # The table is rebuilt, so writes (and reads) wait until this commits
+    op.execute("LOCK TABLE wastelog IN ACCESS EXCLUSIVE MODE")
+    op.execute("ALTER TABLE wastelog RENAME TO wastelog_unpartitioned")
+    for index_name in (
+        "ix_wastelog_team_id_created_at_id",
+        "ix_wastelog_created_at_id",
+        "brin_wastelog_created_at",
+        "ix_wastelog_created_by_id",
+    ):
+        op.execute(f"DROP INDEX {index_name}")
+    op.execute(
+        "ALTER TABLE wastelog_unpartitioned "
+        "RENAME CONSTRAINT wastelog_pkey TO wastelog_unpartitioned_pkey"
+    )
+
+    # The primary key of a partitioned table has to include the partition
+    # key; ids stay unique as they all come from the one sequence
+    op.execute(
+        """
+        CREATE TABLE wastelog (
+            id integer NOT NULL DEFAULT nextval('wastelog_id_seq'),
+            waste_type wastetype NOT NULL,
+            weight_kg double precision NOT NULL,
+            description character varying,
+            team_id integer NOT NULL,
+            created_by_id integer NOT NULL,
+            created_at timestamp with time zone NOT NULL,
+            updated_at timestamp with time zone NOT NULL,
+            CONSTRAINT wastelog_pkey PRIMARY KEY (id, created_at),
+            CONSTRAINT wastelog_team_id_fkey FOREIGN KEY (team_id)
+                REFERENCES team (id),
+            CONSTRAINT wastelog_created_by_id_fkey FOREIGN KEY (created_by_id)
+                REFERENCES "user" (id)
+        ) PARTITION BY RANGE (created_at)
+        """
+    )
+    op.execute("ALTER SEQUENCE wastelog_id_seq OWNED BY wastelog.id")
+    op.execute("CREATE TABLE wastelog_default PARTITION OF wastelog DEFAULT")
+    op.execute(ENSURE_PARTITIONS_FUNCTION)
+    # a partition for every month with logs, through a few months from now
+    op.execute(
+        """
+        SELECT wastelog_ensure_partitions(
+            coalesce(
+                (SELECT min(created_at) AT TIME ZONE 'UTC' FROM wastelog_unpartitioned),
+                now() AT TIME ZONE 'UTC'
+            )::date,
+            (greatest(
+                (SELECT max(created_at) FROM wastelog_unpartitioned),
+                now() + interval '3 months'
+            ) AT TIME ZONE 'UTC')::date
+        )
+        """
+    )
+
+    # the rollup already counts these rows, so the triggers come after the copy
+    op.execute(
+        f"INSERT INTO wastelog ({COLUMNS}) "
+        f"SELECT {COLUMNS} FROM wastelog_unpartitioned"
+    )
+    create_indexes()
+    op.execute("DROP TABLE wastelog_unpartitioned")
+
+    op.execute(STATEMENT_TRIGGER_FUNCTION)
+    op.execute("DROP FUNCTION wastelog_rollup_trigger()")
+    for operation, transition_tables in (
+        ("INSERT", "NEW TABLE AS new_rows"),
+        ("DELETE", "OLD TABLE AS old_rows"),
+        ("UPDATE", "OLD TABLE AS old_rows NEW TABLE AS new_rows"),
+    ):
+        op.execute(
+            f"""
+            CREATE TRIGGER wastelog_rollup_{operation.lower()}
+            AFTER {operation} ON wastelog
+            REFERENCING {transition_tables}
+            FOR EACH STATEMENT EXECUTE FUNCTION wastelog_rollup_statement_trigger()
+            """
+        )
+    op.execute("ANALYZE wastelog")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute("LOCK TABLE wastelog IN ACCESS EXCLUSIVE MODE")
+    op.execute("ALTER TABLE wastelog RENAME TO wastelog_partitioned")
+    for index_name in (
+        "ix_wastelog_team_id_created_at_id",
+        "ix_wastelog_created_at_id",
+        "brin_wastelog_created_at",
+        "ix_wastelog_created_by_id",
+    ):
+        op.execute(f"DROP INDEX {index_name}")
+    op.execute(
+        "ALTER TABLE wastelog_partitioned "
+        "RENAME CONSTRAINT wastelog_pkey TO wastelog_partitioned_pkey"
+    )
+
+    op.execute(
+        """
+        CREATE TABLE wastelog (
+            id integer NOT NULL DEFAULT nextval('wastelog_id_seq'),
+            waste_type wastetype NOT NULL,
+            weight_kg double precision NOT NULL,
+            description character varying,
+            team_id integer NOT NULL,
+            created_by_id integer NOT NULL,
+            created_at timestamp with time zone NOT NULL,
+            updated_at timestamp with time zone NOT NULL,
+            CONSTRAINT wastelog_pkey PRIMARY KEY (id),
+            CONSTRAINT wastelog_team_id_fkey FOREIGN KEY (team_id)
+                REFERENCES team (id),
+            CONSTRAINT wastelog_created_by_id_fkey FOREIGN KEY (created_by_id)
+                REFERENCES "user" (id)
+        )
+        """
+    )
+    op.execute("ALTER SEQUENCE wastelog_id_seq OWNED BY wastelog.id")
+    op.execute(
+        f"INSERT INTO wastelog ({COLUMNS}) "
+        f"SELECT {COLUMNS} FROM wastelog_partitioned"
+    )
+    create_indexes()
+    op.execute("DROP TABLE wastelog_partitioned")
+    op.execute("DROP FUNCTION wastelog_ensure_partitions(date, date)")
+
+    op.execute(PREVIOUS_STATEMENT_TRIGGER_FUNCTION)
+    op.execute(PREVIOUS_ROW_TRIGGER_FUNCTION)
+    op.execute(
+        """
+        CREATE TRIGGER wastelog_rollup_insert
+        AFTER INSERT ON wastelog
+        REFERENCING NEW TABLE AS new_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION wastelog_rollup_statement_trigger()
+        """
+    )
+    op.execute(
+        """
+        CREATE TRIGGER wastelog_rollup_delete
+        AFTER DELETE ON wastelog
+        REFERENCING OLD TABLE AS old_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION wastelog_rollup_statement_trigger()
+        """
+    )
+    op.execute(
+        """
+        CREATE TRIGGER wastelog_rollup_update
+        AFTER UPDATE OF team_id, created_at, waste_type, weight_kg
+        ON wastelog
+        FOR EACH ROW EXECUTE FUNCTION wastelog_rollup_trigger()
+        """
+    )
@@ -0,0 +1,334 @@
+"""
+Admission control: bounded concurrency per route class, and per-user rate
+limits, enforced before a request reaches its handler.
+
+When Postgres slows down, requests otherwise pile up waiting for a pooled
+connection inside the handlers until clients give up, and every endpoint of
+the worker gets slow. Here each class of routes (`auth`, `writes`,
+`analytics`, `reads`) may run a limited number of requests at once and
+queue a limited number more, for at most `ADMISSION_QUEUE_TIMEOUT_SECONDS`;
+anything beyond that is shed at once with a `503` and `Retry-After`, so a
+saturated class doesn't hold up the others. Health checks, `/metrics` and
+`/users/me` are never queued.
+
+Optionally (`RATE_LIMIT_PER_SECOND` > 0), authenticated users also get a
+token bucket each (`RATE_LIMIT_PER_SECOND`, `RATE_LIMIT_BURST`); requests
+beyond it get a `429` with `Retry-After`. The user is taken from the bearer
+token's signed claims, without the database; a request with an invalid
+token is left to the handler to reject.
+"""
+
+import asyncio
+import math
+import time
+from collections import deque
+from typing import Dict, Optional, Tuple
+
+from fastapi import status
+from fastapi.responses import JSONResponse
+from jose import JWTError, jwt
+
+from app.cache import TTLCache
+from app.config import settings
+from app.metrics import Counter, Gauge
+
+ROUTE_CLASSES = ("auth", "writes", "analytics", "reads")
+
+# cheap endpoints that must answer while the others are saturated
+EXEMPT_PATHS = frozenset(
+    ("/", "/health", "/health/ready", "/metrics", "/docs", "/openapi.json")
+)
+EXEMPT_GET_PATHS = frozenset(("/users/me",))
+
+ADMISSION_IN_FLIGHT = Gauge(
+    "admission_in_flight",
+    "Requests admitted and running, by route class.",
+    ("route_class",),
+)
+ADMISSION_QUEUED = Gauge(
+    "admission_queued",
+    "Requests waiting to be admitted, by route class.",
+    ("route_class",),
+)
+ADMISSION_REJECTED = Counter(
+    "admission_rejected_total",
+    "Requests turned away, by route class and reason (queue_full, queue_timeout, "
+    "rate_limited).",
+    ("route_class", "reason"),
+)
+
+
+def route_class(method: str, path: str) -> Optional[str]:
+    """The class a request is admitted in, or None if it's exempt."""
+    if path in EXEMPT_PATHS or (method == "GET" and path in EXEMPT_GET_PATHS):
+        return None
+    if path.startswith("/auth/"):
+        return "auth"
+    if method not in ("GET", "HEAD"):
+        return "writes"
+    if path.startswith("/analytics/") or path == "/waste-logs/export":
+        return "analytics"
+    return "reads"
+
+
+def parse_limits(spec: str) -> Dict[str, Tuple[int, int]]:
+    """
+    Parses `ADMISSION_LIMITS`, e.g. `analytics=4:16,writes=10:50`: per route
+    class, how many requests may run at once and how many more may queue.
+    """
+    limits = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        try:
+            name, values = item.split("=")
+            concurrency, queue = (int(value) for value in values.split(":"))
+        except ValueError:
+            raise ValueError(f"Invalid ADMISSION_LIMITS entry: {item!r}") from None
+        if name not in ROUTE_CLASSES:
+            raise ValueError(
+                "ADMISSION_LIMITS route class must be one of "
+                f"{', '.join(ROUTE_CLASSES)}"
+            )
+        if concurrency < 1 or queue < 0:
+            raise ValueError(f"Invalid ADMISSION_LIMITS entry: {item!r}")
+        limits[name] = (concurrency, queue)
+    return limits
+
+
+class ConcurrencyLimiter:
+    """
+    Lets `max_concurrency` requests run at once and up to `max_queue` more
+    wait, first come first served, for at most `queue_timeout_seconds`.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        max_concurrency: int,
+        max_queue: int,
+        queue_timeout_seconds: float,
+    ):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout_seconds = queue_timeout_seconds
+        self.in_flight = 0
+        self._waiters: deque = deque()
+
+        # metrics
+        self.admitted = 0
+        self.queued_total = 0
+        self.queue_full = 0
+        self.queue_timeouts = 0
+        self.peak_queued = 0
+        self._in_flight_gauge = ADMISSION_IN_FLIGHT.labels(name)
+        self._queued_gauge = ADMISSION_QUEUED.labels(name)
+
+    async def acquire(self) -> Optional[str]:
+        """Waits for a slot; returns None once admitted, or why it wasn't."""
+        if self.in_flight < self.max_concurrency and not self._waiters:
+            self._admit()
+            return None
+        if len(self._waiters) >= self.max_queue:
+            self.queue_full += 1
+            return "queue_full"
+
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.append(future)
+        self.queued_total += 1
+        self.peak_queued = max(self.peak_queued, len(self._waiters))
+        self._queued_gauge.set(len(self._waiters))
+        try:
+            # `release` hands its slot over by resolving the future
+            await asyncio.wait_for(future, self.queue_timeout_seconds)
+        except asyncio.TimeoutError:
+            self._forget(future)
+            self.queue_timeouts += 1
+            return "queue_timeout"
+        except asyncio.CancelledError:
+            self._forget(future)
+            if future.done() and not future.cancelled():
+                self.release()
+            raise
+        self.admitted += 1
+        return None
+
+    def _admit(self) -> None:
+        self.in_flight += 1
+        self.admitted += 1
+        self._in_flight_gauge.set(self.in_flight)
+
+    def _forget(self, future: asyncio.Future) -> None:
+        try:
+            self._waiters.remove(future)
+        except ValueError:
+            pass
+        self._queued_gauge.set(len(self._waiters))
+
+    def release(self) -> None:
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                self._queued_gauge.set(len(self._waiters))
+                return
+        self.in_flight -= 1
+        self._in_flight_gauge.set(self.in_flight)
+
+    def stats(self) -> dict:
+        return {
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "in_flight": self.in_flight,
+            "queued": len(self._waiters),
+            "peak_queued": self.peak_queued,
+            "admitted": self.admitted,
+            "queued_total": self.queued_total,
+            "queue_full": self.queue_full,
+            "queue_timeouts": self.queue_timeouts,
+        }
+
+
+class RateLimiter:
+    """
+    A token bucket per key: `rate` tokens a second, up to `burst`. Buckets
+    of keys that were idle long enough to be full again are dropped.
+    """
+
+    def __init__(self, rate: float, burst: float, max_size: int):
+        self.rate = rate
+        self.burst = burst
+        self._buckets = TTLCache(max_size, burst / rate)
+        self.limited = 0
+
+    def take(self, key) -> float:
+        """Takes a token; returns 0, or the seconds until one is available."""
+        now = time.monotonic()
+        tokens, updated_at = self._buckets.get(key, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - updated_at) * self.rate)
+        if tokens < 1:
+            self._buckets.set(key, (tokens, now))
+            self.limited += 1
+            return (1 - tokens) / self.rate
+        self._buckets.set(key, (tokens - 1, now))
+        return 0.0
+
+    def stats(self) -> dict:
+        return {
+            "rate_per_second": self.rate,
+            "burst": self.burst,
+            "tracked_users": len(self._buckets),
+            "limited": self.limited,
+        }
+
+
+def _principal(scope) -> Optional[int]:
+    """The user id in the request's bearer token, if it has a valid one."""
+    for name, value in scope["headers"]:
+        if name == b"authorization":
+            scheme, _, token = value.decode("latin-1").partition(" ")
+            if scheme.lower() != "bearer":
+                return None
+            try:
+                claims = jwt.decode(
+                    token, settings.API_KEY, algorithms=[settings.ALGORITHM]
+                )
+            except JWTError:
+                return None
+            return claims.get("user_id")
+    return None
+
+
+class AdmissionControl:
+    def __init__(
+        self,
+        limits: Dict[str, Tuple[int, int]],
+        queue_timeout_seconds: float,
+        retry_after_seconds: float,
+        rate_limiter: Optional[RateLimiter] = None,
+    ):
+        self.limiters = {
+            name: ConcurrencyLimiter(name, *limit, queue_timeout_seconds)
+            for name, limit in limits.items()
+        }
+        self.retry_after_seconds = retry_after_seconds
+        self.rate_limiter = rate_limiter
+
+    def stats(self) -> dict:
+        return {
+            "route_classes": {
+                name: limiter.stats() for name, limiter in self.limiters.items()
+            },
+            "rate_limit": self.rate_limiter.stats() if self.rate_limiter else None,
+        }
+
+
+def _rejection(status_code: int, detail: str, retry_after: float) -> JSONResponse:
+    return JSONResponse(
+        status_code=status_code,
+        content={"detail": detail},
+        headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+    )
+
+
+class AdmissionControlMiddleware:
+    """Plain ASGI, so shed requests cost as little as possible."""
+
+    def __init__(self, app, admission: AdmissionControl):
+        self.app = app
+        self.admission = admission
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        name = route_class(scope["method"], scope["path"])
+        if name is None:
+            await self.app(scope, receive, send)
+            return
+
+        rate_limiter = self.admission.rate_limiter
+        if rate_limiter is not None:
+            user_id = _principal(scope)
+            wait = rate_limiter.take(user_id) if user_id is not None else 0.0
+            if wait:
+                ADMISSION_REJECTED.labels(name, "rate_limited").inc()
+                response = _rejection(
+                    status.HTTP_429_TOO_MANY_REQUESTS, "Rate limit exceeded", wait
+                )
+                await response(scope, receive, send)
+                return
+
+        limiter = self.admission.limiters.get(name)
+        if limiter is None:
+            await self.app(scope, receive, send)
+            return
+        reason = await limiter.acquire()
+        if reason is not None:
+            ADMISSION_REJECTED.labels(name, reason).inc()
+            response = _rejection(
+                status.HTTP_503_SERVICE_UNAVAILABLE,
+                "The server is busy. Please try again later.",
+                self.admission.retry_after_seconds,
+            )
+            await response(scope, receive, send)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            limiter.release()
+
+
+admission_control = AdmissionControl(
+    parse_limits(settings.ADMISSION_LIMITS) if settings.ADMISSION_CONTROL else {},
+    settings.ADMISSION_QUEUE_TIMEOUT_SECONDS,
+    settings.ADMISSION_RETRY_AFTER_SECONDS,
+    (
+        RateLimiter(
+            settings.RATE_LIMIT_PER_SECOND,
+            settings.RATE_LIMIT_BURST,
+            settings.RATE_LIMIT_MAX_USERS,
+        )
+        if settings.ADMISSION_CONTROL and settings.RATE_LIMIT_PER_SECOND > 0
+        else None
+    ),
+)
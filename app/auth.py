@@ -1,17 +1,20 @@
 from datetime import timedelta
 from typing import Optional
+from uuid import uuid4
 
-import bcrypt
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
-from sqlmodel import Session, select
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
 
 from app.config import settings
-from app.db.session import get_session
+from app.db.session import get_primary_session
 from app.exceptions import AuthenticationError, AuthorizationError
+from app.hashing import check_password, hash_password, password_hasher
 from app.helpers import utc_now
 from app.models.user import User, UserRole
+from app.principal_cache import principal_cache
 from app.schemas.auth import TokenData
 
 # OAuth2 scheme
@@ -19,23 +22,29 @@ oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/token")
 
 
 # Authentication functions
+# The synchronous versions block the caller; request handlers use `password_hasher`.
 def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return bcrypt.checkpw(
-        plain_password.encode("utf-8"), hashed_password.encode("utf-8")
-    )
+    return check_password(plain_password, hashed_password)
 
 
 def get_password_hash(password: str) -> str:
-    hashed = bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt())
-    return hashed.decode("utf-8")
+    return hash_password(password, settings.BCRYPT_ROUNDS)
 
 
-def authenticate_user(session: Session, username: str, password: str):
-    user = session.exec(select(User).where(User.username == username)).first()
+async def authenticate_user(session: AsyncSession, username: str, password: str):
+    result = await session.exec(select(User).where(User.username == username))
+    user = result.first()
     if not user:
         return False
-    if not verify_password(password, user.hashed_password):
+    if not await password_hasher.verify(password, user.hashed_password):
         return False
+
+    # Transparently upgrade hashes made with a different work factor
+    if password_hasher.needs_rehash(user.hashed_password):
+        user.hashed_password = await password_hasher.rehash(password)
+        session.add(user)
+        await session.commit()
+
     return user
 
 
@@ -47,56 +56,129 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     return encoded_jwt
 
 
-async def get_current_user(
-    token: str = Depends(oauth2_scheme), session: Session = Depends(get_session)
-):
+def create_user_access_token(user: User, expires_delta: Optional[timedelta] = None):
+    """
+    Issues a token carrying everything role and team checks need, so they can
+    be authorized from the claims alone. `ver` ties the token to the user's
+    current token_version; bumping that revokes it.
+    """
+    return create_access_token(
+        data={
+            "sub": user.username,
+            "user_id": user.id,
+            "role": user.role.value,
+            "team_id": user.team_id,
+            "ver": user.token_version,
+            "jti": uuid4().hex,
+        },
+        expires_delta=expires_delta,
+    )
+
+
+async def get_current_claims(
+    token: str = Depends(oauth2_scheme),
+    session: AsyncSession = Depends(get_primary_session),
+) -> TokenData:
+    """
+    Validates the token and returns its claims. A token is decoded once, then
+    its claims are cached per worker until it expires. The only state checked
+    is the user's token_version, which is cached per worker too, so this
+    normally doesn't touch the database. It's looked up on the primary: a
+    version read from a lagging replica after a revocation would be cached,
+    and the revoked token accepted, until the cache entry expires.
+    """
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
 
-    try:
-        payload = jwt.decode(token, settings.API_KEY, algorithms=[settings.ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
+    token_data = principal_cache.get_claims(token)
+    if token_data is None:
+        try:
+            payload = jwt.decode(
+                token, settings.API_KEY, algorithms=[settings.ALGORITHM]
+            )
+            token_data = TokenData(
+                username=payload.get("sub"),
+                user_id=payload.get("user_id"),
+                role=payload.get("role"),
+                team_id=payload.get("team_id"),
+                token_version=payload.get("ver"),
+                jti=payload.get("jti"),
+            )
+        except (JWTError, ValueError):
             raise credentials_exception
-        token_data = TokenData(username=username)
-    except JWTError:
-        raise credentials_exception
-
-    user = session.exec(
-        select(User).where(User.username == token_data.username)
-    ).first()
-    if user is None:
-        raise credentials_exception
+        if None in (token_data.user_id, token_data.role, token_data.token_version):
+            raise credentials_exception
+        principal_cache.put_claims(token, token_data, payload.get("exp"))
+
+    token_version = principal_cache.get_token_version(token_data.user_id)
+    if token_version is None:
+        cache_epoch = principal_cache.epoch
+        result = await session.exec(
+            select(User.token_version).where(User.id == token_data.user_id)
+        )
+        token_version = result.first()
+        if token_version is None:
+            # the user has been deleted
+            raise credentials_exception
+        principal_cache.put_token_version(
+            token_data.user_id, token_version, epoch=cache_epoch
+        )
 
     # Check if token has been invalidated
-    if user.auth_token != token:
+    if token_data.token_version != token_version:
         raise AuthenticationError("Session expired. Please login again.")
 
-    return user
+    return token_data
 
 
-async def get_current_active_employee(current_user: User = Depends(get_current_user)):
+async def get_current_user(
+    claims: TokenData = Depends(get_current_claims),
+    session: AsyncSession = Depends(get_primary_session),
+) -> User:
+    """
+    Returns the full user behind the token, for handlers that need more than
+    the claims carry. Looked up on the primary, like the token version.
+    """
+    principal = principal_cache.get_user(claims.user_id)
+    if principal is not None and principal.token_version == claims.token_version:
+        return principal
+
+    cache_epoch = principal_cache.epoch
+    user = await session.get(User, claims.user_id)
+    if user is None or user.token_version != claims.token_version:
+        raise AuthenticationError("Session expired. Please login again.")
+
+    return principal_cache.put_user(user, epoch=cache_epoch)
+
+
+async def get_current_active_employee(
+    current_user: TokenData = Depends(get_current_claims),
+):
     if current_user.role not in [UserRole.EMPLOYEE, UserRole.MANAGER, UserRole.ADMIN]:
         raise AuthorizationError("Invalid role")
     return current_user
 
 
-async def get_current_active_manager(current_user: User = Depends(get_current_user)):
+async def get_current_active_manager(
+    current_user: TokenData = Depends(get_current_claims),
+):
     if current_user.role not in [UserRole.MANAGER, UserRole.ADMIN]:
         raise AuthorizationError("Manager or admin role required")
     return current_user
 
 
-async def get_current_active_admin(current_user: User = Depends(get_current_user)):
+async def get_current_active_admin(
+    current_user: TokenData = Depends(get_current_claims),
+):
     if current_user.role != UserRole.ADMIN:
         raise AuthorizationError("Admin role required")
     return current_user
 
 
-def enforce_team_id_for_user(team_id: Optional[int], current_user: User) -> int:
+def enforce_team_id_for_user(team_id: Optional[int], current_user: TokenData) -> int:
     """
     Enforces that the team_id provided matches the user's team_id, or that
     they are an admin and have provided a team_id.
@@ -0,0 +1,105 @@
+"""
+Conditional GETs: validators on read responses and `304 Not Modified`.
+
+Single resources are validated by their `updated_at` (a strong ETag with
+its microseconds, and `Last-Modified`); analytics by the team's data version
+(see app/db/data_version.py), which is all a handler needs to look up before
+deciding that the client's copy is current, so the aggregation is skipped.
+
+Responses depend on who asks (e.g. a manager's default team), hence
+`Vary: Authorization`, and may only be reused after revalidation.
+"""
+
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Optional
+
+from fastapi import Request, Response, status
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+VALIDATOR_HEADERS = ("ETag", "Last-Modified", "Cache-Control", "Vary")
+
+
+def updated_at_etag(updated_at: datetime) -> str:
+    microseconds = (updated_at - EPOCH) // timedelta(microseconds=1)
+    return f'"{microseconds:x}"'
+
+
+def team_data_etag(team_id: int, data_version: int) -> str:
+    return f'"team-{team_id}-v{data_version}"'
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    # If-None-Match uses the weak comparison
+    if if_none_match.strip() == "*":
+        return True
+    return any(
+        candidate.strip().removeprefix("W/") == etag
+        for candidate in if_none_match.split(",")
+    )
+
+
+def _not_modified_since(if_modified_since: str, last_modified: datetime) -> bool:
+    try:
+        since = parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False
+    if since.tzinfo is None:
+        since = since.replace(tzinfo=timezone.utc)
+    # HTTP dates have whole seconds
+    return last_modified.replace(microsecond=0) <= since
+
+
+def set_validators(
+    response: Response, etag: str, last_modified: Optional[datetime] = None
+) -> None:
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "private, no-cache"
+    response.headers["Vary"] = "Authorization"
+    if last_modified is not None:
+        response.headers["Last-Modified"] = format_datetime(
+            last_modified.astimezone(timezone.utc), usegmt=True
+        )
+
+
+def is_fresh(
+    request: Request, etag: str, last_modified: Optional[datetime] = None
+) -> bool:
+    """
+    Whether the request's `If-None-Match` (or, without one,
+    `If-Modified-Since`) shows that the client's copy is current.
+    """
+    if_none_match = request.headers.get("if-none-match")
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_none_match is not None:
+        return _etag_matches(if_none_match, etag)
+    if if_modified_since is not None and last_modified is not None:
+        return _not_modified_since(if_modified_since, last_modified)
+    return False
+
+
+def not_modified(response: Response) -> Response:
+    """A 304 with the validators of `response`."""
+    headers = {
+        name: response.headers[name]
+        for name in VALIDATOR_HEADERS
+        if name in response.headers
+    }
+    return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+
+def conditional_response(
+    request: Request,
+    response: Response,
+    etag: str,
+    last_modified: Optional[datetime] = None,
+) -> Optional[Response]:
+    """
+    Sets the validators on the handler's `response`, and returns a 304 when
+    the client's copy is current; None if the body is needed.
+    """
+    set_validators(response, etag, last_modified)
+    if is_fresh(request, etag, last_modified):
+        return not_modified(response)
+    return None
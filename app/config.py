@@ -13,6 +13,10 @@ class Settings:
     POSTGRES_PORT: int = int(os.getenv("POSTGRES_PORT", 5432))
 
     DATABASE_URL: str = f"postgresql://{POSTGRES_USER}:{POSTGRES_PASSWORD}@{POSTGRES_HOST}:{POSTGRES_PORT}/{POSTGRES_DB}"
+    ASYNC_DATABASE_URL: str = (
+        f"postgresql+asyncpg://{POSTGRES_USER}:{POSTGRES_PASSWORD}"
+        f"@{POSTGRES_HOST}:{POSTGRES_PORT}/{POSTGRES_DB}"
+    )
 
     API_KEY: str = os.getenv("API_KEY", "mysecretapikey")
     DEBUG: bool = (
@@ -30,5 +34,131 @@ class Settings:
 
     ALGORITHM: str = "HS256"
 
+    # connection pool of each engine, per worker: persistent connections, extra
+    # connections under load, max connection age, and how long a request waits
+    # for a free connection before failing
+    DB_POOL_SIZE: int = int(os.getenv("DB_POOL_SIZE", 5))
+    DB_MAX_OVERFLOW: int = int(os.getenv("DB_MAX_OVERFLOW", 10))
+    DB_POOL_RECYCLE_SECONDS: float = float(os.getenv("DB_POOL_RECYCLE_SECONDS", 1800))
+    DB_POOL_TIMEOUT_SECONDS: float = float(os.getenv("DB_POOL_TIMEOUT_SECONDS", 30))
+    # check connections before use: "always", "idle" (only connections idle for
+    # longer than DB_POOL_PRE_PING_IDLE_SECONDS) or "never"
+    DB_POOL_PRE_PING: str = os.getenv("DB_POOL_PRE_PING", "idle").lower()
+    DB_POOL_PRE_PING_IDLE_SECONDS: float = float(
+        os.getenv("DB_POOL_PRE_PING_IDLE_SECONDS", 30)
+    )
+
+    # /health/ready fails when the database doesn't answer within the timeout,
+    # or when this share of the worker's connections (incl. overflow) is in use
+    READINESS_TIMEOUT_SECONDS: float = float(os.getenv("READINESS_TIMEOUT_SECONDS", 1))
+    READINESS_MAX_POOL_SATURATION: float = float(
+        os.getenv("READINESS_MAX_POOL_SATURATION", 1.0)
+    )
+
+    # per worker, a token's validated claims are cached per token (until it
+    # expires), and its user's token version and row per user id
+    PRINCIPAL_CACHE_MAX_SIZE: int = int(os.getenv("PRINCIPAL_CACHE_MAX_SIZE", 10000))
+    PRINCIPAL_CACHE_TTL_SECONDS: float = float(
+        os.getenv("PRINCIPAL_CACHE_TTL_SECONDS", 60)
+    )
+
+    # results of frequently polled reads (analytics, team lists), cached per
+    # worker ("memory"), in a directory all workers share ("file", e.g. under
+    # /dev/shm), or not at all ("none"); writes invalidate them per team
+    RESULT_CACHE_BACKEND: str = os.getenv("RESULT_CACHE_BACKEND", "memory").lower()
+    RESULT_CACHE_DIR: str = os.getenv("RESULT_CACHE_DIR", "")
+    RESULT_CACHE_MAX_SIZE: int = int(os.getenv("RESULT_CACHE_MAX_SIZE", 1000))
+    RESULT_CACHE_TTL_SECONDS: float = float(os.getenv("RESULT_CACHE_TTL_SECONDS", 30))
+
+    # bcrypt work factor (log2 rounds); existing hashes are upgraded on next login
+    BCRYPT_ROUNDS: int = int(os.getenv("BCRYPT_ROUNDS", 12))
+    # size of the process pool that runs bcrypt, and how many hashes may run at once
+    BCRYPT_WORKERS: int = int(os.getenv("BCRYPT_WORKERS", os.cpu_count() or 1))
+    BCRYPT_MAX_CONCURRENCY: int = int(
+        os.getenv("BCRYPT_MAX_CONCURRENCY", BCRYPT_WORKERS)
+    )
+
+    # admission control (see app/admission.py): per route class, how many
+    # requests run at once and how many more may queue ("class=running:queued"),
+    # how long they may queue, and the Retry-After of shed requests
+    ADMISSION_CONTROL: bool = os.getenv("ADMISSION_CONTROL", "true").lower() == "true"
+    ADMISSION_LIMITS: str = os.getenv(
+        "ADMISSION_LIMITS", "auth=8:32,writes=10:50,analytics=4:16,reads=10:50"
+    )
+    ADMISSION_QUEUE_TIMEOUT_SECONDS: float = float(
+        os.getenv("ADMISSION_QUEUE_TIMEOUT_SECONDS", 2)
+    )
+    ADMISSION_RETRY_AFTER_SECONDS: float = float(
+        os.getenv("ADMISSION_RETRY_AFTER_SECONDS", 1)
+    )
+    # opt-in per-user token bucket, with ADMISSION_CONTROL: sustained requests
+    # per second (0, the default, disables it) and burst
+    RATE_LIMIT_PER_SECOND: float = float(os.getenv("RATE_LIMIT_PER_SECOND", 0))
+    RATE_LIMIT_BURST: float = float(os.getenv("RATE_LIMIT_BURST", 100))
+    RATE_LIMIT_MAX_USERS: int = int(os.getenv("RATE_LIMIT_MAX_USERS", 100000))
+
+    # list endpoints: page size when none is given, and the most a client may ask for
+    DEFAULT_PAGE_SIZE: int = int(os.getenv("DEFAULT_PAGE_SIZE", 100))
+    MAX_PAGE_SIZE: int = int(os.getenv("MAX_PAGE_SIZE", 1000))
+
+    # most items accepted by one POST /waste-logs/bulk request
+    BULK_MAX_ITEMS: int = int(os.getenv("BULK_MAX_ITEMS", 5000))
+
+    # group commit of POST /waste-logs/: rows are queued and written together,
+    # every WRITE_BATCH_MAX_ROWS rows or WRITE_BATCH_MAX_DELAY_MS after the first
+    WRITE_BATCHING: bool = os.getenv("WRITE_BATCHING", "false").lower() == "true"
+    WRITE_BATCH_MAX_ROWS: int = int(os.getenv("WRITE_BATCH_MAX_ROWS", 100))
+    WRITE_BATCH_MAX_DELAY_MS: float = float(os.getenv("WRITE_BATCH_MAX_DELAY_MS", 5))
+
+    # rows fetched from the server-side cursor per batch of a streaming export
+    EXPORT_BATCH_SIZE: int = int(os.getenv("EXPORT_BATCH_SIZE", 1000))
+
+    # wastelog partitions (when partitioned): how many months ahead each worker
+    # keeps created, and how often it checks
+    PARTITION_MONTHS_AHEAD: int = int(os.getenv("PARTITION_MONTHS_AHEAD", 3))
+    PARTITION_MAINTENANCE_INTERVAL_SECONDS: float = float(
+        os.getenv("PARTITION_MAINTENANCE_INTERVAL_SECONDS", 6 * 60 * 60)
+    )
+
+    # archival of old logs to Parquet files (see app/db/archive.py): the
+    # directory (unset disables reading archives), the age at which logs are
+    # archived, and how many are moved per transaction
+    ARCHIVE_DIR: str = os.getenv("ARCHIVE_DIR", "")
+    ARCHIVE_AFTER_DAYS: float = float(os.getenv("ARCHIVE_AFTER_DAYS", 365))
+    ARCHIVE_BATCH_SIZE: int = int(os.getenv("ARCHIVE_BATCH_SIZE", 10000))
+
+    # read replicas ("host" or "host:port", comma separated; same credentials and
+    # database as the primary) that serve GET requests. Replicas more than
+    # READ_REPLICA_MAX_LAG_BYTES of WAL behind are taken out of rotation.
+    READ_REPLICA_HOSTS: list = [
+        host.strip()
+        for host in os.getenv("READ_REPLICA_HOSTS", "").split(",")
+        if host.strip()
+    ]
+    READ_REPLICA_MAX_LAG_BYTES: int = int(
+        os.getenv("READ_REPLICA_MAX_LAG_BYTES", 16 * 1024 * 1024)
+    )
+    READ_REPLICA_CHECK_INTERVAL_SECONDS: float = float(
+        os.getenv("READ_REPLICA_CHECK_INTERVAL_SECONDS", 1)
+    )
+    # how long a client's reads wait for replicas to catch up with its last write
+    READ_YOUR_WRITES_SECONDS: float = float(os.getenv("READ_YOUR_WRITES_SECONDS", 5))
+
+    # directory shared by the workers for /metrics snapshots (with several uvicorn
+    # workers); without it /metrics reports the worker that serves the scrape
+    METRICS_DIR: str = os.getenv("METRICS_DIR", "")
+    METRICS_FLUSH_INTERVAL_SECONDS: float = float(
+        os.getenv("METRICS_FLUSH_INTERVAL_SECONDS", 5)
+    )
+
+    # per request: warn above this many SQL statements, or when the same SELECT
+    # runs this many times (N+1); report DB time in a Server-Timing header
+    QUERY_BUDGET: int = int(os.getenv("QUERY_BUDGET", 20))
+    QUERY_REPEAT_THRESHOLD: int = int(os.getenv("QUERY_REPEAT_THRESHOLD", 5))
+    SERVER_TIMING: bool = os.getenv("SERVER_TIMING", "true").lower() == "true"
+
+    # upper bound on the number of buckets a single timeseries request may span
+    TIMESERIES_MAX_BUCKETS: int = int(os.getenv("TIMESERIES_MAX_BUCKETS", 2000))
+
 
 settings = Settings()
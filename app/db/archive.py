@@ -0,0 +1,452 @@
+"""
+Archival of old waste logs to compressed Parquet files.
+
+Logs created more than `ARCHIVE_AFTER_DAYS` ago are rarely read but bloat
+`wastelog` and its indexes. The archival job moves them, a team at a time
+and `ARCHIVE_BATCH_SIZE` logs per transaction, into zstd compressed Parquet
+files under `ARCHIVE_DIR`, laid out by team and UTC month:
+
+    <ARCHIVE_DIR>/team_id=<id>/month=<YYYY-MM>/<first id>-<last id>.parquet
+
+Each batch's files are written and synced before the transaction that
+deletes the logs and lists the files in `wastelog_archive` commits; a file
+left over by a failed batch isn't listed, so it is never read (and is
+overwritten when the batch is retried). The usual triggers run for the
+deletes, so the daily rollup and the teams' data versions follow, and the
+same transaction adds the logs' per day and waste type totals to
+`wastelog_archive_rollup`, so team summaries still count them.
+
+    python -m app.db.archive [--older-than-days N] [--batch-size N]
+    python -m app.db.archive --rebuild-totals
+
+`--rebuild-totals` recomputes `wastelog_archive_rollup` from the listed
+files (e.g. for logs archived before it existed).
+
+The timeseries endpoint adds the archived logs of the months its range
+covers (see `archived_buckets`), reading just the columns it needs. A
+team's log list and export continue with its archived logs a file at a time
+(see `read_archived_logs`): archival moves a team's oldest logs, so they
+come after all of its logs in Postgres, newest first, and before them,
+oldest first.
+"""
+
+import argparse
+import os
+from collections import defaultdict, namedtuple
+from datetime import date, datetime, timedelta, timezone
+from typing import Dict, Iterator, List, Optional, Sequence
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from sqlalchemy import Date, cast, delete, insert, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlmodel import Session, func, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.config import settings
+from app.db.session import engine
+from app.models.team import Team
+from app.models.waste import WasteLog, WasteLogArchive, WasteLogArchiveRollup, WasteType
+from app.result_cache import result_cache
+
+ARCHIVE_COLUMNS = [
+    WasteLog.id,
+    WasteLog.team_id,
+    WasteLog.created_by_id,
+    WasteLog.waste_type,
+    WasteLog.weight_kg,
+    WasteLog.description,
+    WasteLog.created_at,
+    WasteLog.updated_at,
+]
+
+TIMESTAMP = pa.timestamp("us", tz="UTC")
+ARCHIVE_SCHEMA = pa.schema(
+    [
+        ("id", pa.int64()),
+        ("team_id", pa.int64()),
+        ("created_by_id", pa.int64()),
+        ("waste_type", pa.dictionary(pa.int8(), pa.string())),
+        ("weight_kg", pa.float64()),
+        ("description", pa.string()),
+        ("created_at", TIMESTAMP),
+        ("updated_at", TIMESTAMP),
+    ]
+)
+
+# a log read back from an archive file
+ArchivedLog = namedtuple("ArchivedLog", ARCHIVE_SCHEMA.names)
+
+
+def _month(value: datetime) -> date:
+    return value.astimezone(timezone.utc).date().replace(day=1)
+
+
+def _write_file(directory: str, relative_path: str, rows: list) -> None:
+    columns = {name: [] for name in ARCHIVE_SCHEMA.names}
+    for row in rows:
+        for name, value in zip(ARCHIVE_SCHEMA.names, row):
+            columns[name].append(value.value if name == "waste_type" else value)
+    table = pa.table(columns, schema=ARCHIVE_SCHEMA)
+
+    path = os.path.join(directory, relative_path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temporary = f"{path}.tmp"
+    pq.write_table(table, temporary, compression="zstd")
+    with open(temporary, "rb") as file:
+        os.fsync(file.fileno())
+    os.replace(temporary, path)
+
+
+def archive_team_batch(
+    session: Session, team_id: int, before: datetime, batch_size: int, directory: str
+) -> int:
+    """
+    Moves up to `batch_size` of the team's oldest logs created before
+    `before` to Parquet files, in the session's transaction (which the
+    caller commits). Returns the number of logs archived.
+    """
+    rows = session.exec(
+        select(*ARCHIVE_COLUMNS)
+        .where(WasteLog.team_id == team_id, WasteLog.created_at < before)
+        .order_by(WasteLog.created_at, WasteLog.id)
+        .limit(batch_size)
+    ).all()
+    if not rows:
+        return 0
+
+    by_month = defaultdict(list)
+    for row in rows:
+        by_month[_month(row.created_at)].append(row)
+    written = []
+    try:
+        for month, month_rows in by_month.items():
+            ids = [row.id for row in month_rows]
+            relative_path = os.path.join(
+                f"team_id={team_id}",
+                f"month={month:%Y-%m}",
+                f"{min(ids)}-{max(ids)}.parquet",
+            )
+            _write_file(directory, relative_path, month_rows)
+            written.append(relative_path)
+            session.exec(
+                insert(WasteLogArchive).values(
+                    team_id=team_id,
+                    month=month,
+                    path=relative_path,
+                    entry_count=len(month_rows),
+                    total_kg=sum(row.weight_kg for row in month_rows),
+                    first_created_at=month_rows[0].created_at,
+                    last_created_at=month_rows[-1].created_at,
+                )
+            )
+        # the time bounds let a partitioned wastelog skip the newer partitions
+        archived = (
+            WasteLog.team_id == team_id,
+            WasteLog.created_at >= rows[0].created_at,
+            WasteLog.created_at <= rows[-1].created_at,
+            WasteLog.id.in_([row.id for row in rows]),
+        )
+        session.exec(_add_to_archive_rollup(archived))
+        session.exec(delete(WasteLog).where(*archived))
+        # Core deletes don't run the ORM hooks that invalidate cached results
+        result_cache.invalidate_on_commit(session, [team_id])
+        session.flush()
+    except BaseException:
+        for relative_path in written:
+            os.remove(os.path.join(directory, relative_path))
+        raise
+    return len(rows)
+
+
+def _add_to_archive_rollup(archived: tuple):
+    """Adds the totals of the logs matching `archived` to the archive rollup."""
+    day = cast(func.timezone("UTC", WasteLog.created_at), Date)
+    totals = (
+        select(
+            WasteLog.team_id,
+            day,
+            WasteLog.waste_type,
+            func.count(),
+            func.sum(WasteLog.weight_kg),
+        )
+        .where(*archived)
+        .group_by(WasteLog.team_id, day, WasteLog.waste_type)
+    )
+    statement = pg_insert(WasteLogArchiveRollup).from_select(
+        ["team_id", "day", "waste_type", "entry_count", "total_kg"], totals
+    )
+    return statement.on_conflict_do_update(
+        index_elements=["team_id", "day", "waste_type"],
+        set_={
+            "entry_count": WasteLogArchiveRollup.entry_count
+            + statement.excluded.entry_count,
+            "total_kg": WasteLogArchiveRollup.total_kg + statement.excluded.total_kg,
+        },
+    )
+
+
+def archive_logs(
+    before: datetime,
+    batch_size: int = settings.ARCHIVE_BATCH_SIZE,
+    directory: str = settings.ARCHIVE_DIR,
+) -> Dict[int, int]:
+    """
+    Archives every team's logs created before `before`, one transaction per
+    batch. Returns the number of logs archived per team.
+    """
+    if not directory:
+        raise ValueError("Archiving needs ARCHIVE_DIR")
+    archived = {}
+    with Session(engine) as session:
+        team_ids = session.exec(select(Team.id).order_by(Team.id)).all()
+        for team_id in team_ids:
+            total = 0
+            while True:
+                count = archive_team_batch(
+                    session, team_id, before, batch_size, directory
+                )
+                session.commit()
+                total += count
+                if count < batch_size:
+                    break
+            if total:
+                archived[team_id] = total
+    return archived
+
+
+def rebuild_archive_rollup(
+    session: Session, directory: str = settings.ARCHIVE_DIR
+) -> int:
+    """
+    Recomputes `wastelog_archive_rollup` from the archive files listed in
+    `wastelog_archive`, in the session's transaction (which the caller
+    commits). Returns the number of rollup rows written.
+    """
+    if not directory:
+        raise ValueError("Rebuilding the archive totals needs ARCHIVE_DIR")
+    # archiving waits, so no file is added meanwhile
+    session.execute(text("LOCK TABLE wastelog_archive IN SHARE MODE"))
+    session.exec(delete(WasteLogArchiveRollup))
+    paths = session.exec(select(WasteLogArchive.path)).all()
+    if not paths:
+        return 0
+    table = ds.dataset(
+        [os.path.join(directory, path) for path in paths],
+        schema=ARCHIVE_SCHEMA,
+        format="parquet",
+    ).to_table(columns=["team_id", "created_at", "waste_type", "weight_kg"])
+    grouped = (
+        pa.table(
+            {
+                "team_id": table["team_id"],
+                # UTC days, as the rollups count them
+                "day": table["created_at"].cast(pa.timestamp("us")).cast(pa.date32()),
+                "waste_type": table["waste_type"].cast(pa.string()),
+                "weight_kg": table["weight_kg"],
+            }
+        )
+        .group_by(["team_id", "day", "waste_type"])
+        .aggregate([("weight_kg", "count"), ("weight_kg", "sum")])
+    )
+    rows = [
+        {
+            "team_id": row["team_id"],
+            "day": row["day"],
+            "waste_type": WasteType(row["waste_type"]),
+            "entry_count": row["weight_kg_count"],
+            "total_kg": row["weight_kg_sum"],
+        }
+        for row in grouped.to_pylist()
+    ]
+    session.exec(insert(WasteLogArchiveRollup), params=rows)
+    return len(rows)
+
+
+async def archived_files(
+    session: AsyncSession,
+    team_id: int,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    before: Optional[Sequence] = None,
+    newest_first: bool = False,
+) -> List[str]:
+    """
+    The archive files with the team's logs created in [start, end) (either
+    end optional) and before the sort key `before` (created_at, id), in the
+    order of their logs: oldest first, or newest first. Archival moves a
+    team's logs in order, so files don't overlap.
+    """
+    query = select(WasteLogArchive.path).where(WasteLogArchive.team_id == team_id)
+    if start is not None:
+        query = query.where(
+            WasteLogArchive.month >= _month(start),
+            WasteLogArchive.last_created_at >= start,
+        )
+    if end is not None:
+        query = query.where(
+            WasteLogArchive.month <= _month(end),
+            WasteLogArchive.first_created_at < end,
+        )
+    if before is not None:
+        query = query.where(WasteLogArchive.first_created_at <= before[0])
+    if newest_first:
+        query = query.order_by(
+            WasteLogArchive.last_created_at.desc(), WasteLogArchive.id.desc()
+        )
+    else:
+        query = query.order_by(WasteLogArchive.first_created_at, WasteLogArchive.id)
+    return list((await session.exec(query)).all())
+
+
+def read_archived_logs(
+    paths: List[str],
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    before: Optional[Sequence] = None,
+    newest_first: bool = False,
+    directory: str = settings.ARCHIVE_DIR,
+) -> Iterator[List[ArchivedLog]]:
+    """
+    The archived logs in `paths` (as `archived_files` orders them) created in
+    [start, end), and before the sort key `before` (created_at, id) if given,
+    a file at a time, each ordered on (created_at, id), oldest or newest
+    first.
+    """
+    order = "descending" if newest_first else "ascending"
+    for path in paths:
+        table = pq.read_table(os.path.join(directory, path))
+        created_at = table["created_at"]
+        mask = pa.array([True] * len(table))
+        if start is not None:
+            mask = pc.and_(
+                mask, pc.greater_equal(created_at, pa.scalar(start, TIMESTAMP))
+            )
+        if end is not None:
+            mask = pc.and_(mask, pc.less(created_at, pa.scalar(end, TIMESTAMP)))
+        if before is not None:
+            before_at = pa.scalar(before[0], TIMESTAMP)
+            mask = pc.and_(
+                mask,
+                pc.or_(
+                    pc.less(created_at, before_at),
+                    pc.and_(
+                        pc.equal(created_at, before_at),
+                        pc.less(table["id"], before[1]),
+                    ),
+                ),
+            )
+        table = table.filter(mask).sort_by([("created_at", order), ("id", order)])
+        yield [ArchivedLog(**row) for row in table.to_pylist()]
+
+
+def archived_logs_page(
+    paths: List[str],
+    limit: int,
+    before: Optional[Sequence] = None,
+    skip: int = 0,
+    directory: str = settings.ARCHIVE_DIR,
+) -> List[ArchivedLog]:
+    """
+    Up to `limit` of the archived logs in `paths` (newest first, see
+    `archived_files`) before the sort key `before`, after skipping `skip` of
+    them, newest first. Only the files up to the page's last log are read.
+    """
+    rows: List[ArchivedLog] = []
+    for file_rows in read_archived_logs(
+        paths, before=before, newest_first=True, directory=directory
+    ):
+        rows.extend(file_rows)
+        if len(rows) >= skip + limit:
+            break
+    return rows[skip:][:limit]
+
+
+def archived_buckets(
+    paths: List[str],
+    start: datetime,
+    end: datetime,
+    bucket: str,
+    tz: str,
+    directory: str = settings.ARCHIVE_DIR,
+) -> Dict[datetime, dict]:
+    """
+    Entry counts and kg per waste type of the archived logs created in
+    [start, end) in `paths`, per `bucket` ("hour", "day", "week" or "month")
+    of local time in `tz`, keyed by the bucket's start (naive, local time),
+    as `date_trunc` computes them. Hours are keyed by the start of the local
+    hour in UTC (naive), as the timeseries endpoint computes them.
+    """
+    dataset = ds.dataset(
+        [os.path.join(directory, path) for path in paths],
+        schema=ARCHIVE_SCHEMA,
+        format="parquet",
+    )
+    table = dataset.to_table(
+        columns=["created_at", "waste_type", "weight_kg"],
+        filter=(ds.field("created_at") >= pa.scalar(start, TIMESTAMP))
+        & (ds.field("created_at") < pa.scalar(end, TIMESTAMP)),
+    )
+    local_time = pc.local_timestamp(table["created_at"].cast(pa.timestamp("us", tz=tz)))
+    local_bucket = pc.floor_temporal(local_time, unit=bucket)
+    if bucket == "hour":
+        # minus the zone's offset at the log's creation
+        utc_time = table["created_at"].cast(pa.timestamp("us"))
+        local_bucket = pc.subtract(local_bucket, pc.subtract(local_time, utc_time))
+    grouped = (
+        pa.table(
+            {
+                "bucket": local_bucket,
+                "waste_type": table["waste_type"].cast(pa.string()),
+                "weight_kg": table["weight_kg"],
+            }
+        )
+        .group_by(["bucket", "waste_type"])
+        .aggregate([("weight_kg", "count"), ("weight_kg", "sum")])
+    )
+
+    buckets: Dict[datetime, dict] = {}
+    for row in grouped.to_pylist():
+        totals = buckets.setdefault(
+            row["bucket"], {"entries": 0, "total_waste_kg": 0.0, "by_type": {}}
+        )
+        totals["entries"] += row["weight_kg_count"]
+        totals["total_waste_kg"] += row["weight_kg_sum"]
+        totals["by_type"][row["waste_type"]] = row["weight_kg_sum"]
+    return buckets
+
+
+def run(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(
+        description="Move old waste logs to Parquet files in ARCHIVE_DIR."
+    )
+    parser.add_argument(
+        "--older-than-days", type=float, default=settings.ARCHIVE_AFTER_DAYS
+    )
+    parser.add_argument("--batch-size", type=int, default=settings.ARCHIVE_BATCH_SIZE)
+    parser.add_argument(
+        "--rebuild-totals",
+        action="store_true",
+        help="recompute the archived logs' totals from the files instead",
+    )
+    args = parser.parse_args(argv)
+
+    if args.rebuild_totals:
+        with Session(engine) as session:
+            rows = rebuild_archive_rollup(session)
+            session.commit()
+        print(f"Rebuilt wastelog_archive_rollup: {rows} rows.")
+        return
+
+    before = datetime.now(timezone.utc) - timedelta(days=args.older_than_days)
+    archived = archive_logs(before, args.batch_size)
+    print(
+        f"Archived {sum(archived.values())} logs created before "
+        f"{before:%Y-%m-%d %H:%M} UTC, of {len(archived)} teams."
+    )
+
+
+if __name__ == "__main__":
+    run()
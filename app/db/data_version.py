@@ -0,0 +1,106 @@
+"""
+A per-team version number of the team's waste logs.
+
+Statement-level triggers on `wastelog` bump the version of every team whose
+logs a statement inserted, updated or deleted, so (like the rollup) every
+write path is covered and a bulk write bumps it once. Analytics responses
+carry the version in their ETag (see app/conditional.py), which lets a
+client's `If-None-Match` be answered without running the aggregation.
+
+A single counter per team would be a row that every write to the team's
+logs locks until it commits, so concurrent writers of a team would commit
+one at a time. Instead the version is the sum of `DATA_VERSION_SHARDS`
+counters in `team_data_version`, and a write bumps the shard of its
+connection's backend process, so writers on different connections rarely
+wait for each other. The sum only grows, and it includes every committed
+bump whatever order the writers commit in.
+"""
+
+from typing import Optional
+
+from sqlalchemy import DDL, ColumnElement
+from sqlmodel import func, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.models.team import Team, TeamDataVersion
+
+DATA_VERSION_SHARDS = 16
+
+# Bumps the versions of the given (distinct) teams, in team order so that
+# concurrent multi-team writes lock their shards in the same order (`%%` is
+# a literal `%` in DDL)
+BUMP_FUNCTION = DDL(
+    f"""
+CREATE OR REPLACE FUNCTION team_data_version_bump(p_team_ids integer[])
+RETURNS void AS $$
+BEGIN
+    INSERT INTO team_data_version AS v (team_id, shard, version)
+    SELECT team_id, pg_backend_pid() %% {DATA_VERSION_SHARDS}, 1
+    FROM unnest(p_team_ids) AS team_id
+    ORDER BY team_id
+    ON CONFLICT (team_id, shard) DO UPDATE SET version = v.version + 1;
+END;
+$$ LANGUAGE plpgsql
+"""
+)
+
+VERSION_TRIGGER_FUNCTION = DDL(
+    """
+CREATE OR REPLACE FUNCTION wastelog_team_version_trigger() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        PERFORM team_data_version_bump(ARRAY(SELECT DISTINCT team_id FROM new_rows));
+    ELSIF TG_OP = 'DELETE' THEN
+        PERFORM team_data_version_bump(ARRAY(SELECT DISTINCT team_id FROM old_rows));
+    ELSE
+        PERFORM team_data_version_bump(
+            ARRAY(SELECT team_id FROM new_rows UNION SELECT team_id FROM old_rows)
+        );
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql
+"""
+)
+
+VERSION_TRIGGERS = [
+    DDL(
+        f"""
+CREATE TRIGGER wastelog_team_version_{operation.lower()}
+AFTER {operation} ON wastelog
+REFERENCING {transition_tables}
+FOR EACH STATEMENT EXECUTE FUNCTION wastelog_team_version_trigger()
+"""
+    )
+    for operation, transition_tables in (
+        ("INSERT", "NEW TABLE AS new_rows"),
+        ("DELETE", "OLD TABLE AS old_rows"),
+        ("UPDATE", "OLD TABLE AS old_rows NEW TABLE AS new_rows"),
+    )
+]
+
+DATA_VERSION_DDL = (BUMP_FUNCTION, VERSION_TRIGGER_FUNCTION, *VERSION_TRIGGERS)
+
+# The triggers go with the table
+DROP_DATA_VERSION_DDL = (
+    DDL("DROP FUNCTION IF EXISTS wastelog_team_version_trigger()"),
+    DDL("DROP FUNCTION IF EXISTS team_data_version_bump(integer[])"),
+)
+
+# Bumps every team's version, for changes that fire no triggers
+BUMP_ALL_TEAMS = "SELECT team_data_version_bump(ARRAY(SELECT id FROM team))"
+
+
+def team_data_version(team_id: ColumnElement) -> ColumnElement:
+    """The data version of the team `team_id`, as a scalar subquery."""
+    return (
+        select(func.coalesce(func.sum(TeamDataVersion.version), 0))
+        .where(TeamDataVersion.team_id == team_id)
+        .scalar_subquery()
+    )
+
+
+async def get_team_data_version(session: AsyncSession, team_id: int) -> Optional[int]:
+    """The team's data version, or None if there is no such team."""
+    query = select(team_data_version(Team.id)).where(Team.id == team_id)
+    return (await session.exec(query)).first()
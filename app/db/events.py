@@ -1,9 +1,18 @@
-from sqlalchemy import event
+import time
 
+from sqlalchemy import Engine, event, inspect
+from sqlalchemy.orm import object_session
+
+from app.db.data_version import DATA_VERSION_DDL, DROP_DATA_VERSION_DDL
+from app.db.rollup import DROP_ROLLUP_DDL, ROLLUP_DDL
+from app.db.session import async_engine, read_router
 from app.helpers import utc_now
+from app.metrics import DB_QUERY_ERRORS, DB_QUERY_SECONDS
 from app.models.team import Team
 from app.models.user import User
 from app.models.waste import WasteLog
+from app.query_tracking import current_queries
+from app.result_cache import ALL_TEAMS, result_cache
 
 
 # This function will automatically update the `updated_at` field before any update operation on the model.
@@ -17,3 +26,71 @@ def auto_update_timestamp(model_class):
 auto_update_timestamp(User)
 auto_update_timestamp(Team)
 auto_update_timestamp(WasteLog)
+
+
+# Keep wastelog_daily_rollup exact with triggers on wastelog, whenever the
+# schema is created from the models (migrations install the same triggers)
+for ddl in ROLLUP_DDL:
+    event.listen(WasteLog.__table__, "after_create", ddl)
+for ddl in DROP_ROLLUP_DDL:
+    event.listen(WasteLog.__table__, "after_drop", ddl)
+# ...and the teams' data versions (see app/db/data_version.py)
+for ddl in DATA_VERSION_DDL:
+    event.listen(WasteLog.__table__, "after_create", ddl)
+for ddl in DROP_DATA_VERSION_DDL:
+    event.listen(WasteLog.__table__, "after_drop", ddl)
+
+
+# Drop the cached results (see app/result_cache.py) of the teams whose data a
+# write through the ORM changes, once it commits
+def invalidate_cached_results(model_class, team_ids):
+    def _invalidate(mapper, connection, target):
+        session = object_session(target)
+        if session is not None:
+            result_cache.invalidate_on_commit(session, team_ids(target))
+
+    for name in ("after_insert", "after_update", "after_delete"):
+        event.listen(model_class, name, _invalidate)
+
+
+def _waste_log_team_ids(log: WasteLog) -> set:
+    # an update may move the log to another team
+    return {log.team_id, *inspect(log).attrs.team_id.history.deleted}
+
+
+invalidate_cached_results(WasteLog, _waste_log_team_ids)
+# team lists over all teams include the team too
+invalidate_cached_results(Team, lambda team: {team.id, ALL_TEAMS})
+
+
+# Count and time every statement of the API's engines for /metrics, and add
+# it to the current request's queries (see app/query_tracking.py)
+QUERY_OPERATIONS = ("SELECT", "INSERT", "UPDATE", "DELETE")
+
+
+def record_query_metrics(engine: Engine, name: str):
+    errors = DB_QUERY_ERRORS.labels(name)
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(connection, cursor, statement, parameters, context, executemany):
+        context.query_started = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(connection, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - context.query_started
+        operation = statement.lstrip()[:6].upper()
+        if operation not in QUERY_OPERATIONS:
+            operation = "OTHER"
+        DB_QUERY_SECONDS.labels(name, operation).observe(elapsed)
+        request_queries = current_queries.get()
+        if request_queries is not None:
+            request_queries.record(statement, elapsed)
+
+    @event.listens_for(engine, "handle_error")
+    def _error(exception_context):
+        errors.inc()
+
+
+record_query_metrics(async_engine.sync_engine, "primary")
+for replica in read_router.replicas:
+    record_query_metrics(replica.engine.sync_engine, f"replica {replica.name}")
@@ -0,0 +1,95 @@
+import asyncio
+import logging
+from collections import defaultdict
+from typing import Callable, Optional
+
+import asyncpg
+from sqlalchemy import text
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+async def notify(session: AsyncSession, channel: str, payload: str) -> None:
+    """
+    Queues a Postgres NOTIFY on the session's transaction. Listeners (in every
+    worker, including this one) receive it once the transaction commits, and
+    never if it rolls back.
+    """
+    await session.exec(
+        text("SELECT pg_notify(:channel, :payload)"),
+        params={"channel": channel, "payload": payload},
+    )
+
+
+class NotificationListener:
+    """
+    Holds one dedicated connection per worker that LISTENs on the subscribed
+    channels and dispatches payloads to callbacks. If the connection drops it
+    reconnects in the background; since notifications sent in the meantime are
+    lost, the `on_connect` callbacks run after every (re)connect so that caches
+    can be reset.
+    """
+
+    def __init__(self, dsn: str, retry_seconds: float = 1.0):
+        self.dsn = dsn
+        self.retry_seconds = retry_seconds
+        self._subscriptions = defaultdict(list)
+        self._on_connect = []
+        self._task: Optional[asyncio.Task] = None
+        self.is_connected = False
+
+    def subscribe(self, channel: str, callback: Callable[[str], None]) -> None:
+        self._subscriptions[channel].append(callback)
+
+    def on_connect(self, callback: Callable[[], None]) -> None:
+        self._on_connect.append(callback)
+
+    def _dispatch(self, connection, pid, channel, payload) -> None:
+        for callback in self._subscriptions[channel]:
+            try:
+                callback(payload)
+            except Exception:
+                logger.exception("Notification handler for %s failed", channel)
+
+    async def _listen_forever(self) -> None:
+        while True:
+            connection = None
+            try:
+                connection = await asyncpg.connect(self.dsn)
+                lost = asyncio.Event()
+                connection.add_termination_listener(lambda _: lost.set())
+                for channel in self._subscriptions:
+                    await connection.add_listener(channel, self._dispatch)
+                for callback in self._on_connect:
+                    callback()
+                self.is_connected = True
+                await lost.wait()
+                logger.warning("Notification listener connection lost")
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Notification listener failed to connect")
+            finally:
+                self.is_connected = False
+                if connection is not None and not connection.is_closed():
+                    await connection.close()
+            await asyncio.sleep(self.retry_seconds)
+
+    async def start(self) -> None:
+        if self._task is None and self._subscriptions:
+            self._task = asyncio.create_task(self._listen_forever())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+listener = NotificationListener(settings.DATABASE_URL)
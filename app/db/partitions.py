@@ -0,0 +1,240 @@
+"""
+Maintenance of the monthly partitions of `wastelog`.
+
+After migration `f2b8d6a4c190`, `wastelog` is range partitioned on
+`created_at`, with one partition per UTC month named `wastelog_yYYYYmMM` and
+a `wastelog_default` partition that catches rows outside all of them. Each
+API worker creates the coming months' partitions at startup and then every
+`PARTITION_MAINTENANCE_INTERVAL_SECONDS`. Retention removes whole months
+instead of deleting rows:
+
+    python -m app.db.partitions ensure [--months-ahead N]
+    python -m app.db.partitions retain --before 2025-01-01 [--drop] [--keep-rollup]
+
+Attaching a partition locks `wastelog_default` and scans it for rows that
+belong to the new month, blocking writes that land there meanwhile, so the
+default partition should stay empty: partitions are created well ahead, and
+maintenance logs a warning and sets the `wastelog_default_partition_rows`
+gauge whenever it holds rows (e.g. logs dated far in the future), which
+should be alerted on.
+
+Databases created from the models (tests, local dev) have a plain table;
+everything here is then a no-op.
+"""
+
+import argparse
+import asyncio
+import logging
+import re
+from datetime import date, datetime, timezone
+from typing import List, Optional, Tuple
+
+from sqlalchemy import Connection, text
+
+from app.config import settings
+from app.db.data_version import BUMP_ALL_TEAMS
+from app.db.session import async_engine, engine
+from app.metrics import Gauge
+from app.result_cache import result_cache
+
+logger = logging.getLogger(__name__)
+
+PARTITION_NAME = re.compile(r"^wastelog_y(\d{4})m(\d{2})$")
+
+# counted up to this many, so the check stays cheap
+DEFAULT_PARTITION_COUNT_LIMIT = 1000
+
+DEFAULT_PARTITION_ROWS = Gauge(
+    "wastelog_default_partition_rows",
+    "Rows in the default partition of wastelog (counted up to "
+    f"{DEFAULT_PARTITION_COUNT_LIMIT}); should be 0.",
+)
+
+
+def _add_months(month: date, months: int) -> date:
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def is_partitioned(connection: Connection) -> bool:
+    return connection.execute(
+        text(
+            "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table "
+            "WHERE partrelid = to_regclass('wastelog'))"
+        )
+    ).scalar_one()
+
+
+def list_partitions(connection: Connection) -> List[Tuple[date, str]]:
+    """
+    Returns the attached monthly partitions as (first day of month, name),
+    oldest first.
+    """
+    names = connection.execute(
+        text(
+            "SELECT inhrelid::regclass::text FROM pg_inherits "
+            "WHERE inhparent = 'wastelog'::regclass"
+        )
+    ).scalars()
+    partitions = []
+    for name in names:
+        match = PARTITION_NAME.match(name)
+        if match:
+            partitions.append((date(int(match[1]), int(match[2]), 1), name))
+    return sorted(partitions)
+
+
+def ensure_partitions_between(
+    connection: Connection, first_month: date, last_month: date
+) -> List[str]:
+    """
+    Creates any missing partitions for the months from `first_month` through
+    `last_month`, and returns their names.
+    """
+    if not is_partitioned(connection):
+        return []
+    return list(
+        connection.execute(
+            text("SELECT wastelog_ensure_partitions(:first_month, :last_month)"),
+            {
+                "first_month": first_month.replace(day=1),
+                "last_month": last_month.replace(day=1),
+            },
+        ).scalars()
+    )
+
+
+def ensure_partitions(
+    connection: Connection, months_ahead: int = settings.PARTITION_MONTHS_AHEAD
+) -> List[str]:
+    """
+    Creates any missing partitions from the current month up to
+    `months_ahead` months from now, and returns their names.
+    """
+    this_month = datetime.now(timezone.utc).date().replace(day=1)
+    return ensure_partitions_between(
+        connection, this_month, _add_months(this_month, months_ahead)
+    )
+
+
+def default_partition_rows(connection: Connection) -> int:
+    """
+    The number of rows in `wastelog_default`, up to
+    `DEFAULT_PARTITION_COUNT_LIMIT` (0 for a plain table).
+    """
+    if not is_partitioned(connection):
+        return 0
+    return connection.execute(
+        text(
+            "SELECT count(*) FROM "
+            "(SELECT 1 FROM wastelog_default LIMIT :limit) AS default_rows"
+        ),
+        {"limit": DEFAULT_PARTITION_COUNT_LIMIT},
+    ).scalar_one()
+
+
+def detach_partitions_before(
+    connection: Connection,
+    before: date,
+    drop: bool = False,
+    keep_rollup: bool = False,
+) -> List[str]:
+    """
+    Detaches (and with `drop`, drops) every monthly partition that ends on or
+    before `before`, and returns their names. Unless `keep_rollup` is set, the
+    daily rollup forgets those months too, so analytics match the remaining
+    logs.
+    """
+    if not is_partitioned(connection):
+        return []
+    removed = []
+    for month, name in list_partitions(connection):
+        next_month = _add_months(month, 1)
+        if next_month > before:
+            break
+        connection.execute(text(f'ALTER TABLE wastelog DETACH PARTITION "{name}"'))
+        if not keep_rollup:
+            connection.execute(
+                text(
+                    "DELETE FROM wastelog_daily_rollup "
+                    "WHERE day >= :month AND day < :next_month"
+                ),
+                {"month": month, "next_month": next_month},
+            )
+        if drop:
+            connection.execute(text(f'DROP TABLE "{name}"'))
+        removed.append(name)
+    if removed:
+        # detaching fires no triggers: invalidate every team's analytics ETags
+        # and cached results
+        connection.execute(text(BUMP_ALL_TEAMS))
+        result_cache.invalidate_all_on_commit(connection)
+    return removed
+
+
+async def maintain_partitions(
+    interval_seconds: float = settings.PARTITION_MAINTENANCE_INTERVAL_SECONDS,
+) -> None:
+    """
+    Runs `ensure_partitions` now and then every `interval_seconds`, until
+    cancelled, and checks that the default partition is empty. Failures are
+    logged and retried on the next round; the default partition takes any
+    rows for a missing month in the meantime.
+    """
+    while True:
+        try:
+            async with async_engine.begin() as connection:
+                created = await connection.run_sync(ensure_partitions)
+                default_rows = await connection.run_sync(default_partition_rows)
+            if created:
+                logger.info("Created wastelog partitions: %s", ", ".join(created))
+            DEFAULT_PARTITION_ROWS.set(default_rows)
+            if default_rows:
+                logger.warning(
+                    "wastelog_default holds %s%d rows; attaching partitions "
+                    "scans it and blocks writes to it",
+                    "at least "
+                    if default_rows >= DEFAULT_PARTITION_COUNT_LIMIT
+                    else "",
+                    default_rows,
+                )
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("wastelog partition maintenance failed")
+        await asyncio.sleep(interval_seconds)
+
+
+def run(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Manage wastelog's partitions.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    ensure = commands.add_parser("ensure", help="create upcoming monthly partitions")
+    ensure.add_argument(
+        "--months-ahead", type=int, default=settings.PARTITION_MONTHS_AHEAD
+    )
+    retain = commands.add_parser(
+        "retain", help="detach (or drop) months that end on or before a date"
+    )
+    retain.add_argument("--before", type=date.fromisoformat, required=True)
+    retain.add_argument("--drop", action="store_true", help="drop, not just detach")
+    retain.add_argument(
+        "--keep-rollup",
+        action="store_true",
+        help="keep the removed months in the analytics rollup",
+    )
+    args = parser.parse_args(argv)
+
+    with engine.begin() as connection:
+        if args.command == "ensure":
+            names = ensure_partitions(connection, args.months_ahead)
+            print(f"Created {len(names)} partitions: {', '.join(names) or '-'}")
+        else:
+            names = detach_partitions_before(
+                connection, args.before, drop=args.drop, keep_rollup=args.keep_rollup
+            )
+            action = "Dropped" if args.drop else "Detached"
+            print(f"{action} {len(names)} partitions: {', '.join(names) or '-'}")
+
+
+if __name__ == "__main__":
+    run()
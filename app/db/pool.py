@@ -0,0 +1,224 @@
+"""
+Connection pool configuration and instrumentation.
+
+Pools are sized by the `DB_POOL_*` settings. `DB_POOL_PRE_PING` picks how
+connections are checked before use:
+
+- `always`: a round trip on every checkout (SQLAlchemy's `pool_pre_ping`)
+- `idle`: only connections that sat in the pool for more than
+  `DB_POOL_PRE_PING_IDLE_SECONDS`, which are the ones likely to have been
+  dropped by the server or a proxy in the meantime
+- `never`: rely on `DB_POOL_RECYCLE_SECONDS`; a dead connection fails its
+  request and is then replaced
+
+The API's pools are `InstrumentedAsyncPool`s, which time every checkout
+(including opening a new connection) into a histogram, kept with the other
+counters by a `PoolMonitor`.
+"""
+
+import asyncio
+import time
+from typing import Optional
+
+from sqlalchemy import Engine, event, exc, text
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from app.config import settings
+from app.metrics import REGISTRY, Counter, Gauge, Histogram, HistogramValue
+
+PRE_PING_STRATEGIES = ("always", "idle", "never")
+
+# upper bounds (seconds) of the checkout wait histogram's buckets
+WAIT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+DB_POOL_CONNECTIONS = Gauge(
+    "db_pool_connections",
+    "Pooled connections by engine and state (checked_out, checked_in, overflow).",
+    ("engine", "state"),
+)
+DB_POOL_WAITING = Gauge(
+    "db_pool_waiting", "Checkouts waiting for a connection, by engine.", ("engine",)
+)
+DB_POOL_EVENTS = Counter(
+    "db_pool_events_total",
+    "Connections opened and invalidated, and checkout timeouts, by engine.",
+    ("engine", "event"),
+)
+DB_POOL_WAIT_SECONDS = Histogram(
+    "db_pool_checkout_wait_seconds",
+    "Time to check a connection out of the pool, by engine.",
+    ("engine",),
+    buckets=WAIT_BUCKETS,
+)
+
+
+def pool_options() -> dict:
+    """`create_engine` / `create_async_engine` arguments from the settings."""
+    if settings.DB_POOL_PRE_PING not in PRE_PING_STRATEGIES:
+        raise ValueError(
+            f"DB_POOL_PRE_PING must be one of {', '.join(PRE_PING_STRATEGIES)}"
+        )
+    return {
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_recycle": settings.DB_POOL_RECYCLE_SECONDS,
+        "pool_timeout": settings.DB_POOL_TIMEOUT_SECONDS,
+        "pool_pre_ping": settings.DB_POOL_PRE_PING == "always",
+    }
+
+
+def ping_idle_connections(engine: Engine, idle_seconds: float) -> None:
+    """
+    Pings connections that were idle for longer than `idle_seconds` when they
+    are checked out; a connection that fails is replaced by a new one.
+    """
+
+    @event.listens_for(engine, "checkin")
+    def _checked_in(dbapi_connection, connection_record):
+        connection_record.info["checked_in_at"] = time.monotonic()
+
+    @event.listens_for(engine, "checkout")
+    def _checked_out(dbapi_connection, connection_record, connection_proxy):
+        checked_in_at = connection_record.info.get("checked_in_at")
+        if checked_in_at is None or time.monotonic() - checked_in_at < idle_seconds:
+            return
+        try:
+            is_alive = engine.dialect.do_ping(dbapi_connection)
+        except Exception as error:
+            if not engine.dialect.is_disconnect(error, dbapi_connection, None):
+                raise
+            is_alive = False
+        if not is_alive:
+            # makes the pool discard the connection and check out another one
+            raise exc.DisconnectionError()
+
+
+def configure_pre_ping(engine: Engine) -> None:
+    if settings.DB_POOL_PRE_PING == "idle":
+        ping_idle_connections(engine, settings.DB_POOL_PRE_PING_IDLE_SECONDS)
+
+
+class PoolMonitor:
+    """
+    Statistics of an engine's pool. For the checkout wait times the pool must
+    be an `InstrumentedAsyncPool`. `max_overflow` is the one the engine was
+    created with (`create_pooled_async_engine` uses `DB_MAX_OVERFLOW`).
+    Monitors with a `name` are exported to /metrics, labelled with it.
+    """
+
+    def __init__(
+        self,
+        engine: AsyncEngine,
+        name: Optional[str] = None,
+        max_overflow: int = settings.DB_MAX_OVERFLOW,
+    ):
+        self.engine = engine
+        self.name = name
+        self.max_overflow = max_overflow
+        if name is None:
+            self.wait_seconds = HistogramValue(WAIT_BUCKETS)
+        else:
+            self.wait_seconds = DB_POOL_WAIT_SECONDS.labels(name)
+            REGISTRY.on_collect(self._collect)
+        self.waiting = 0
+        self.timeouts = 0
+        self.connects = 0
+        self.invalidations = 0
+
+        engine.sync_engine.pool.monitor = self
+        event.listen(engine.sync_engine, "connect", self._on_connect)
+        event.listen(engine.sync_engine, "invalidate", self._on_invalidate)
+
+    def _on_connect(self, dbapi_connection, connection_record):
+        self.connects += 1
+
+    def _on_invalidate(self, dbapi_connection, connection_record, exception):
+        self.invalidations += 1
+
+    def _collect(self) -> None:
+        pool = self.engine.sync_engine.pool
+        for state, count in (
+            ("checked_out", pool.checkedout()),
+            ("checked_in", pool.checkedin()),
+            ("overflow", max(0, pool.overflow())),
+        ):
+            DB_POOL_CONNECTIONS.labels(self.name, state).set(count)
+        DB_POOL_WAITING.labels(self.name).set(self.waiting)
+        for event_name, count in (
+            ("connect", self.connects),
+            ("invalidate", self.invalidations),
+            ("timeout", self.timeouts),
+        ):
+            DB_POOL_EVENTS.labels(self.name, event_name).value = count
+
+    def saturation(self) -> float:
+        """Checked out connections over the most the pool will open (0-1)."""
+        pool = self.engine.sync_engine.pool
+        if self.max_overflow < 0:
+            return 0.0
+        capacity = pool.size() + self.max_overflow
+        return min(1.0, pool.checkedout() / capacity) if capacity else 1.0
+
+    def stats(self) -> dict:
+        pool = self.engine.sync_engine.pool
+        return {
+            "size": pool.size(),
+            "max_overflow": self.max_overflow,
+            "checked_out": pool.checkedout(),
+            "checked_in": pool.checkedin(),
+            "overflow": max(0, pool.overflow()),
+            "waiting": self.waiting,
+            "saturation": self.saturation(),
+            "connects": self.connects,
+            "invalidations": self.invalidations,
+            "timeouts": self.timeouts,
+            "wait_seconds": self.wait_seconds.stats(),
+        }
+
+
+class InstrumentedAsyncPool(AsyncAdaptedQueuePool):
+    """An `AsyncAdaptedQueuePool` that reports checkouts to its `monitor`."""
+
+    monitor: Optional[PoolMonitor] = None
+
+    def _do_get(self):
+        if self.monitor is None:
+            return super()._do_get()
+        self.monitor.waiting += 1
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            self.monitor.timeouts += 1
+            raise
+        finally:
+            self.monitor.waiting -= 1
+            self.monitor.wait_seconds.observe(time.perf_counter() - started)
+
+    def recreate(self):
+        # engine.dispose() replaces the pool; keep reporting to the same monitor
+        pool = super().recreate()
+        pool.monitor = self.monitor
+        return pool
+
+
+def create_pooled_async_engine(url: str, echo: bool = False) -> AsyncEngine:
+    """An async engine with an `InstrumentedAsyncPool` configured by the settings."""
+    engine = create_async_engine(
+        url, echo=echo, poolclass=InstrumentedAsyncPool, **pool_options()
+    )
+    configure_pre_ping(engine.sync_engine)
+    return engine
+
+
+async def measure_latency(engine: AsyncEngine, timeout_seconds: float) -> float:
+    """Seconds for a `SELECT 1` round trip, including the pool checkout."""
+
+    async def select_one():
+        async with engine.connect() as connection:
+            await connection.execute(text("SELECT 1"))
+
+    started = time.perf_counter()
+    await asyncio.wait_for(select_one(), timeout_seconds)
+    return time.perf_counter() - started
@@ -0,0 +1,226 @@
+"""
+Maintenance of the `wastelog_daily_rollup` table.
+
+The rollup is kept exact by triggers on `wastelog`, so every write
+path (ORM, Core bulk inserts, COPY, manual SQL) is covered. `rebuild_rollup`
+recomputes it from scratch, e.g. after a TRUNCATE or a load with triggers
+disabled (`deferred_rollup` does both for bulk loads):
+
+    python -m app.db.rollup [--team-id N]
+"""
+
+import argparse
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+from sqlalchemy import DDL, Connection, text
+
+from app.db.session import engine
+
+# Adds a delta to one rollup row, dropping the row when no entries are left
+APPLY_FUNCTION = DDL(
+    """
+CREATE OR REPLACE FUNCTION wastelog_rollup_apply(
+    p_team_id integer,
+    p_day date,
+    p_waste_type wastetype,
+    p_count integer,
+    p_kg double precision
+) RETURNS void AS $$
+BEGIN
+    INSERT INTO wastelog_daily_rollup AS r
+        (team_id, day, waste_type, entry_count, total_kg)
+    VALUES (p_team_id, p_day, p_waste_type, p_count, p_kg)
+    ON CONFLICT (team_id, day, waste_type) DO UPDATE
+        SET entry_count = r.entry_count + EXCLUDED.entry_count,
+            total_kg = r.total_kg + EXCLUDED.total_kg;
+    IF p_count < 0 THEN
+        DELETE FROM wastelog_daily_rollup
+        WHERE team_id = p_team_id
+          AND day = p_day
+          AND waste_type = p_waste_type
+          AND entry_count <= 0;
+    END IF;
+END;
+$$ LANGUAGE plpgsql
+"""
+)
+
+# Changes are applied once per statement, aggregated over all of its rows, so
+# multi-row writes don't pay for a rollup upsert per row. Updates apply the
+# net change per (team, day, type): those that don't touch the aggregated
+# columns (e.g. description) cancel out. (Statement-level triggers also see
+# updates that move a row to another partition, which row-level UPDATE
+# triggers don't.) The rollup rows are upserted in key order, so concurrent
+# writes that overlap lock them in the same order instead of deadlocking.
+STATEMENT_TRIGGER_FUNCTION = DDL(
+    """
+CREATE OR REPLACE FUNCTION wastelog_rollup_statement_trigger() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        PERFORM wastelog_rollup_apply(team_id, day, waste_type, entry_count, total_kg)
+        FROM (
+            SELECT team_id,
+                   (created_at AT TIME ZONE 'UTC')::date AS day,
+                   waste_type,
+                   count(*)::integer AS entry_count,
+                   sum(weight_kg) AS total_kg
+            FROM new_rows
+            GROUP BY 1, 2, 3
+            ORDER BY team_id, day, waste_type
+        ) AS deltas;
+    ELSIF TG_OP = 'DELETE' THEN
+        PERFORM wastelog_rollup_apply(team_id, day, waste_type, -entry_count, -total_kg)
+        FROM (
+            SELECT team_id,
+                   (created_at AT TIME ZONE 'UTC')::date AS day,
+                   waste_type,
+                   count(*)::integer AS entry_count,
+                   sum(weight_kg) AS total_kg
+            FROM old_rows
+            GROUP BY 1, 2, 3
+            ORDER BY team_id, day, waste_type
+        ) AS deltas;
+    ELSE
+        PERFORM wastelog_rollup_apply(team_id, day, waste_type, entry_count, total_kg)
+        FROM (
+            SELECT team_id,
+                   day,
+                   waste_type,
+                   sum(entry_count)::integer AS entry_count,
+                   sum(total_kg) AS total_kg
+            FROM (
+                SELECT team_id,
+                       (created_at AT TIME ZONE 'UTC')::date AS day,
+                       waste_type,
+                       1 AS entry_count,
+                       weight_kg AS total_kg
+                FROM new_rows
+                UNION ALL
+                SELECT team_id,
+                       (created_at AT TIME ZONE 'UTC')::date,
+                       waste_type,
+                       -1,
+                       -weight_kg
+                FROM old_rows
+            ) AS changes
+            GROUP BY 1, 2, 3
+            ORDER BY team_id, day, waste_type
+        ) AS deltas
+        WHERE entry_count <> 0 OR total_kg <> 0;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql
+"""
+)
+
+INSERT_TRIGGER = DDL(
+    """
+CREATE TRIGGER wastelog_rollup_insert
+AFTER INSERT ON wastelog
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION wastelog_rollup_statement_trigger()
+"""
+)
+
+DELETE_TRIGGER = DDL(
+    """
+CREATE TRIGGER wastelog_rollup_delete
+AFTER DELETE ON wastelog
+REFERENCING OLD TABLE AS old_rows
+FOR EACH STATEMENT EXECUTE FUNCTION wastelog_rollup_statement_trigger()
+"""
+)
+
+UPDATE_TRIGGER = DDL(
+    """
+CREATE TRIGGER wastelog_rollup_update
+AFTER UPDATE ON wastelog
+REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION wastelog_rollup_statement_trigger()
+"""
+)
+
+ROLLUP_DDL = (
+    APPLY_FUNCTION,
+    STATEMENT_TRIGGER_FUNCTION,
+    INSERT_TRIGGER,
+    DELETE_TRIGGER,
+    UPDATE_TRIGGER,
+)
+
+ROLLUP_TRIGGERS = (
+    "wastelog_rollup_insert",
+    "wastelog_rollup_delete",
+    "wastelog_rollup_update",
+)
+
+# The triggers go with the table, but the functions hold on to the enum type
+DROP_ROLLUP_DDL = (
+    DDL("DROP FUNCTION IF EXISTS wastelog_rollup_statement_trigger()"),
+    DDL(
+        "DROP FUNCTION IF EXISTS "
+        "wastelog_rollup_apply(integer, date, wastetype, integer, double precision)"
+    ),
+)
+
+
+def rebuild_rollup(connection: Connection, team_id: Optional[int] = None) -> int:
+    """
+    Recomputes the rollup (for one team, or all of them) from `wastelog`.
+    Writes to `wastelog` are blocked until the caller's transaction ends, so
+    the result is exact. Returns the number of rollup rows written.
+    """
+    team_filter = "" if team_id is None else "WHERE team_id = :team_id"
+    params = {} if team_id is None else {"team_id": team_id}
+
+    connection.execute(text("LOCK TABLE wastelog IN SHARE MODE"))
+    connection.execute(text(f"DELETE FROM wastelog_daily_rollup {team_filter}"), params)
+    result = connection.execute(
+        text(
+            f"""
+            INSERT INTO wastelog_daily_rollup
+                (team_id, day, waste_type, entry_count, total_kg)
+            SELECT team_id,
+                   (created_at AT TIME ZONE 'UTC')::date,
+                   waste_type,
+                   count(*),
+                   sum(weight_kg)
+            FROM wastelog
+            {team_filter}
+            GROUP BY 1, 2, 3
+            """
+        ),
+        params,
+    )
+    return result.rowcount
+
+
+@contextmanager
+def deferred_rollup(connection: Connection) -> Iterator[None]:
+    """
+    Disables the rollup triggers for a bulk load into `wastelog` within the
+    caller's transaction, and rebuilds the rollup once afterwards. Cheaper
+    than maintaining it per statement for millions of rows.
+    """
+    for trigger in ROLLUP_TRIGGERS:
+        connection.execute(text(f"ALTER TABLE wastelog DISABLE TRIGGER {trigger}"))
+    yield
+    for trigger in ROLLUP_TRIGGERS:
+        connection.execute(text(f"ALTER TABLE wastelog ENABLE TRIGGER {trigger}"))
+    rebuild_rollup(connection)
+
+
+def run():
+    parser = argparse.ArgumentParser(description="Rebuild the daily waste rollup.")
+    parser.add_argument("--team-id", type=int, help="only rebuild this team")
+    args = parser.parse_args()
+
+    with engine.begin() as connection:
+        rows = rebuild_rollup(connection, args.team_id)
+    print(f"Rebuilt wastelog_daily_rollup: {rows} rows.")
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,271 @@
+"""
+Routing of reads to Postgres read replicas.
+
+GET and HEAD requests run on a replica (round robin over the healthy ones),
+everything else on the primary. Every `READ_REPLICA_CHECK_INTERVAL_SECONDS`
+each replica's replay position is compared to the primary's WAL position;
+replicas that fail the check or lag more than `READ_REPLICA_MAX_LAG_BYTES`
+behind are ejected until a later check passes.
+
+Clients read their own writes: when a request commits on the primary, the
+commit's WAL position (LSN) is sent back in the `db_lsn` cookie and, in this
+worker, remembered for the request's Authorization header, both for
+`READ_YOUR_WRITES_SECONDS`. Until then that client's reads only go to
+replicas that had replayed at least that far at their last check, and
+otherwise to the primary.
+
+Without `READ_REPLICA_HOSTS` everything runs on the primary.
+"""
+
+import asyncio
+import itertools
+import logging
+from typing import List, Optional
+
+from fastapi import Request
+from sqlalchemy import text
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, async_sessionmaker
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.cache import TTLCache
+from app.db.pool import PoolMonitor, create_pooled_async_engine
+
+logger = logging.getLogger(__name__)
+
+LSN_COOKIE = "db_lsn"
+READ_METHODS = ("GET", "HEAD")
+
+CURRENT_LSN_QUERY = text("SELECT pg_current_wal_lsn()::text")
+# a server that isn't in recovery is its own up-to-date replica
+REPLAY_LSN_QUERY = text(
+    "SELECT CASE WHEN pg_is_in_recovery() THEN pg_last_wal_replay_lsn() "
+    "ELSE pg_current_wal_lsn() END::text"
+)
+
+
+def parse_lsn(value: Optional[str]) -> int:
+    """Converts an LSN like `16/B374D848` to an integer; anything else is 0."""
+    try:
+        high, low = value.split("/")
+        return (int(high, 16) << 32) | int(low, 16)
+    except (AttributeError, ValueError):
+        return 0
+
+
+def format_lsn(lsn: int) -> str:
+    return f"{lsn >> 32:X}/{lsn & 0xFFFFFFFF:X}"
+
+
+class Replica:
+    def __init__(self, url: str, echo: bool = False):
+        self.url = url
+        self.engine = create_pooled_async_engine(url, echo=echo)
+        parsed_url = make_url(url)
+        self.name = f"{parsed_url.host}:{parsed_url.port or 5432}"
+        self.pool = PoolMonitor(self.engine, name=f"replica {self.name}")
+        self.session_maker = async_sessionmaker(
+            self.engine, class_=AsyncSession, expire_on_commit=False
+        )
+        # unusable until the first check passes
+        self.healthy = False
+        self.replay_lsn = 0
+        self.lag_bytes: Optional[int] = None
+        self.last_error: Optional[str] = None
+
+        # metrics
+        self.reads = 0
+        self.ejections = 0
+
+    def stats(self) -> dict:
+        return {
+            "host": self.name,
+            "healthy": self.healthy,
+            "replay_lsn": format_lsn(self.replay_lsn),
+            "lag_bytes": self.lag_bytes,
+            "last_error": self.last_error,
+            "reads": self.reads,
+            "ejections": self.ejections,
+            "pool": self.pool.stats(),
+        }
+
+
+class ReadRouter:
+    """
+    Picks the engine a request's reads run on; see the module docstring.
+    """
+
+    def __init__(
+        self,
+        primary_engine: AsyncEngine,
+        replica_urls: List[str],
+        max_lag_bytes: int,
+        check_interval_seconds: float,
+        read_your_writes_seconds: float,
+        echo: bool = False,
+    ):
+        self.primary_engine = primary_engine
+        self.replicas = [Replica(url, echo=echo) for url in replica_urls]
+        self.max_lag_bytes = max_lag_bytes
+        self.check_interval_seconds = check_interval_seconds
+        self.read_your_writes_seconds = read_your_writes_seconds
+        self._round_robin = itertools.count()
+        # Authorization header -> LSN of that client's latest write
+        self._recent_writes = TTLCache(10000, read_your_writes_seconds)
+        self._task: Optional[asyncio.Task] = None
+
+        # metrics
+        self.primary_reads = 0
+        self.pinned_reads = 0
+
+    def min_lsn(self, request: Request) -> int:
+        """The WAL position the request's reads must see (its client's writes)."""
+        lsn = parse_lsn(request.cookies.get(LSN_COOKIE))
+        authorization = request.headers.get("authorization")
+        if authorization:
+            lsn = max(lsn, self._recent_writes.get(authorization, 0))
+        return lsn
+
+    def choose_replica(self, request: Request) -> Optional[Replica]:
+        """
+        Returns the replica to serve the request from, or None for the
+        primary.
+        """
+        if not self.replicas or request.method not in READ_METHODS:
+            return None
+        min_lsn = self.min_lsn(request)
+        candidates = [
+            replica
+            for replica in self.replicas
+            if replica.healthy and replica.replay_lsn >= min_lsn
+        ]
+        if not candidates:
+            self.primary_reads += 1
+            if min_lsn and any(replica.healthy for replica in self.replicas):
+                self.pinned_reads += 1
+            return None
+        replica = candidates[next(self._round_robin) % len(candidates)]
+        replica.reads += 1
+        return replica
+
+    async def record_write(self, request: Request, session: AsyncSession) -> None:
+        """
+        Remembers the primary's WAL position after the request's commit, for
+        the client's following reads. `ReadYourWritesMiddleware` sends it.
+        """
+        if not self.replicas:
+            return
+        lsn = parse_lsn((await session.exec(CURRENT_LSN_QUERY)).scalar_one())
+        authorization = request.headers.get("authorization")
+        if authorization:
+            self._recent_writes.set(authorization, lsn)
+        request.state.write_lsn = lsn
+
+    def _set_health(
+        self, replica: Replica, healthy: bool, error: Optional[str] = None
+    ) -> None:
+        if replica.healthy and not healthy:
+            replica.ejections += 1
+            logger.warning("Ejected read replica %s: %s", replica.name, error)
+        elif healthy and not replica.healthy:
+            logger.info("Read replica %s is in service", replica.name)
+        replica.healthy = healthy
+        replica.last_error = error
+
+    async def _replay_lsn(self, replica: Replica) -> int:
+        async with replica.engine.connect() as connection:
+            return parse_lsn(await connection.scalar(REPLAY_LSN_QUERY))
+
+    async def check_replicas(self) -> None:
+        """Measures every replica's lag, ejecting or restoring it."""
+        async with self.primary_engine.connect() as connection:
+            primary_lsn = parse_lsn(await connection.scalar(CURRENT_LSN_QUERY))
+        for replica in self.replicas:
+            try:
+                replay_lsn = await asyncio.wait_for(
+                    self._replay_lsn(replica), self.check_interval_seconds
+                )
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:
+                self._set_health(replica, False, repr(exc))
+                continue
+            replica.replay_lsn = replay_lsn
+            replica.lag_bytes = max(0, primary_lsn - replay_lsn)
+            if replica.lag_bytes > self.max_lag_bytes:
+                self._set_health(
+                    replica, False, f"{replica.lag_bytes} bytes behind the primary"
+                )
+            else:
+                self._set_health(replica, True)
+
+    async def _check_forever(self) -> None:
+        while True:
+            await asyncio.sleep(self.check_interval_seconds)
+            try:
+                await self.check_replicas()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                # the primary is down; keep the replicas' last known state
+                logger.exception("Read replica check failed")
+
+    async def start(self) -> None:
+        if not self.replicas:
+            return
+        try:
+            await self.check_replicas()
+        except Exception:
+            logger.exception("Read replica check failed")
+        self._task = asyncio.create_task(self._check_forever())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        for replica in self.replicas:
+            await replica.engine.dispose()
+
+    def stats(self) -> dict:
+        return {
+            "primary_reads": self.primary_reads,
+            "pinned_reads": self.pinned_reads,
+            "replicas": [replica.stats() for replica in self.replicas],
+        }
+
+
+class ReadYourWritesMiddleware:
+    """
+    Sends the `db_lsn` cookie for requests that committed a write, whatever
+    their handler returns: the request's session records the LSN in the
+    request state when it commits (see app/db/session.py).
+    """
+
+    def __init__(self, app, max_age_seconds: float):
+        self.app = app
+        self.max_age_seconds = max(1, int(max_age_seconds))
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        async def send_with_cookie(message):
+            if message["type"] == "http.response.start":
+                lsn = scope.get("state", {}).get("write_lsn")
+                if lsn:
+                    cookie = (
+                        f"{LSN_COOKIE}={format_lsn(lsn)}; "
+                        f"Max-Age={self.max_age_seconds}; Path=/; HttpOnly; "
+                        "SameSite=lax"
+                    )
+                    message["headers"] = list(message.get("headers", [])) + [
+                        (b"set-cookie", cookie.encode("latin-1"))
+                    ]
+            await send(message)
+
+        await self.app(scope, receive, send_with_cookie)
@@ -1,14 +1,75 @@
 import logging
 
-from sqlmodel import Session, SQLModel, create_engine
+from fastapi import Request
+from sqlalchemy.ext.asyncio import AsyncEngine, async_sessionmaker
+from sqlmodel import SQLModel, create_engine
+from sqlmodel.ext.asyncio.session import AsyncSession
 
 from app.config import settings
+from app.db.pool import (
+    PoolMonitor,
+    configure_pre_ping,
+    create_pooled_async_engine,
+    pool_options,
+)
+from app.db.routing import ReadRouter
 
 # Configure logging
 logger = logging.getLogger(__name__)
 
-# Create database engine
-engine = create_engine(settings.DATABASE_URL, echo=settings.DEBUG, pool_pre_ping=True)
+# Create database engine (synchronous, for migrations, scripts and schema setup)
+engine = create_engine(settings.DATABASE_URL, echo=settings.DEBUG, **pool_options())
+configure_pre_ping(engine)
+
+# Create async database engine (used by the API request handlers)
+async_engine = create_pooled_async_engine(
+    settings.ASYNC_DATABASE_URL, echo=settings.DEBUG
+)
+pool_monitor = PoolMonitor(async_engine, name="primary")
+
+
+class PrimaryAsyncSession(AsyncSession):
+    """
+    A session on the primary. When it commits for a request (see
+    `get_session`), the commit's WAL position is recorded for the client's
+    following reads, before the handler returns its response.
+    """
+
+    async def commit(self) -> None:
+        await super().commit()
+        await self.record_write()
+
+    async def record_write(self) -> None:
+        """Records a write of the session's request that committed on the primary."""
+        request = self.info.get("request")
+        if request is not None:
+            await read_router.record_write(request, self)
+
+
+# Objects stay usable after commit, so handlers can return them without a reload
+async_session_maker = async_sessionmaker(
+    async_engine, class_=PrimaryAsyncSession, expire_on_commit=False
+)
+
+
+def _replica_url(host: str) -> str:
+    if ":" not in host:
+        host = f"{host}:{settings.POSTGRES_PORT}"
+    return (
+        f"postgresql+asyncpg://{settings.POSTGRES_USER}:{settings.POSTGRES_PASSWORD}"
+        f"@{host}/{settings.POSTGRES_DB}"
+    )
+
+
+# GET requests read from the replicas, if any are configured
+read_router = ReadRouter(
+    async_engine,
+    [_replica_url(host) for host in settings.READ_REPLICA_HOSTS],
+    max_lag_bytes=settings.READ_REPLICA_MAX_LAG_BYTES,
+    check_interval_seconds=settings.READ_REPLICA_CHECK_INTERVAL_SECONDS,
+    read_your_writes_seconds=settings.READ_YOUR_WRITES_SECONDS,
+    echo=settings.DEBUG,
+)
 
 
 def create_db_and_tables():
@@ -17,7 +78,35 @@ def create_db_and_tables():
     SQLModel.metadata.create_all(engine)
 
 
-def get_session():
-    """Get a database session"""
-    with Session(engine) as session:
+async def get_session(request: Request):
+    """
+    Get an async database session: on a read replica for GET requests when
+    one is usable, otherwise on the primary.
+    """
+    replica = read_router.choose_replica(request)
+    # how fresh the request's reads have to be, and are at least (see
+    # app/result_cache.py): a replica has replayed at least as far as at its
+    # last check, and the primary at least as far as the client's writes
+    request.state.min_lsn = read_router.min_lsn(request)
+    request.state.read_lsn = replica.replay_lsn if replica else request.state.min_lsn
+    session_maker = replica.session_maker if replica else async_session_maker
+    async with session_maker() as session:
+        if replica is None:
+            # its commits are the client's writes (see PrimaryAsyncSession)
+            session.info["request"] = request
+        yield session
+
+
+async def get_primary_session():
+    """
+    Get an async database session on the primary, whatever the request
+    method, for reads that must not see a lagging replica.
+    """
+    async with async_session_maker() as session:
         yield session
+
+
+def get_read_engine(request: Request) -> AsyncEngine:
+    """The engine for reads outside a session, e.g. streaming exports."""
+    replica = read_router.choose_replica(request)
+    return replica.engine if replica else async_engine
@@ -1,7 +1,23 @@
+import functools
+
 from fastapi import Request
 from fastapi.responses import JSONResponse
 from sqlalchemy.exc import DataError, IntegrityError, OperationalError
 
+from app.metrics import EXCEPTIONS_HANDLED
+
+
+def counted(handler):
+    """Counts the calls of an exception handler in /metrics."""
+    calls = EXCEPTIONS_HANDLED.labels(handler.__name__)
+
+    @functools.wraps(handler)
+    async def wrapper(request: Request, exc: Exception):
+        calls.inc()
+        return await handler(request, exc)
+
+    return wrapper
+
 
 def format_detail(exc: Exception) -> str:
     message = str(exc.orig) if hasattr(exc, "orig") else str(exc)
@@ -10,6 +26,7 @@ def format_detail(exc: Exception) -> str:
     return message
 
 
+@counted
 async def db_integrity_error_handler(request: Request, exc: IntegrityError):
     return JSONResponse(
         status_code=400,
@@ -17,6 +34,7 @@ async def db_integrity_error_handler(request: Request, exc: IntegrityError):
     )
 
 
+@counted
 async def db_operational_error_handler(request: Request, exc: OperationalError):
     return JSONResponse(
         status_code=503,
@@ -26,6 +44,7 @@ async def db_operational_error_handler(request: Request, exc: OperationalError):
     )
 
 
+@counted
 async def db_data_error_handler(request: Request, exc: DataError):
     return JSONResponse(
         status_code=400,
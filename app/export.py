@@ -0,0 +1,148 @@
+"""
+Streaming exports of waste logs as NDJSON or CSV.
+
+Rows are read from a server-side cursor in batches of `EXPORT_BATCH_SIZE`
+and every batch is encoded (and compressed) and handed to the socket before
+the next one is fetched, so memory use doesn't depend on the number of rows.
+The export runs on its own connection (to a read replica, if one is usable):
+the request's session is closed before a streaming body is sent. Archived
+logs (see app/db/archive.py) are read a file at a time, off the event loop,
+and sent first.
+"""
+
+import asyncio
+import csv
+import io
+import json
+import zlib
+from datetime import datetime
+from enum import Enum
+from typing import AsyncIterator, Iterator, List, Optional, Sequence
+
+from fastapi import Request
+from fastapi.responses import StreamingResponse
+from sqlalchemy import Row
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlmodel.sql.expression import Select
+
+from app.config import settings
+from app.db.archive import ArchivedLog
+from app.db.session import get_read_engine
+from app.models.waste import WasteLog
+from app.schemas.waste import WasteLogRead
+
+# exported columns, the same as a WasteLogRead
+EXPORT_COLUMNS = [getattr(WasteLog, field) for field in WasteLogRead.model_fields]
+
+
+class ExportFormat(str, Enum):
+    NDJSON = "ndjson"
+    CSV = "csv"
+
+
+MEDIA_TYPES = {
+    ExportFormat.NDJSON: "application/x-ndjson",
+    ExportFormat.CSV: "text/csv",
+}
+
+
+def _plain(value):
+    if isinstance(value, Enum):
+        return value.value
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def _encode_ndjson(rows: Sequence[Row]) -> str:
+    return "".join(
+        json.dumps(dict(zip(WasteLogRead.model_fields, map(_plain, row)))) + "\n"
+        for row in rows
+    )
+
+
+def _encode_csv(rows: Sequence[Row]) -> str:
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows([map(_plain, row) for row in rows])
+    return buffer.getvalue()
+
+
+def _export_row(log: ArchivedLog) -> tuple:
+    return tuple(getattr(log, column.key) for column in EXPORT_COLUMNS)
+
+
+def accepts_gzip(request: Request) -> bool:
+    for coding in request.headers.get("accept-encoding", "").split(","):
+        name, _, params = coding.partition(";")
+        if name.strip().lower() == "gzip":
+            return params.replace(" ", "") not in ("q=0", "q=0.0", "q=0.00")
+    return False
+
+
+async def _stream(
+    engine: AsyncEngine,
+    query: Select,
+    export_format: ExportFormat,
+    compress: bool,
+    archived: Optional[Iterator[List[ArchivedLog]]] = None,
+) -> AsyncIterator[bytes]:
+    compressor = zlib.compressobj(wbits=zlib.MAX_WBITS | 16) if compress else None
+
+    def chunk(text: str) -> bytes:
+        data = text.encode("utf-8")
+        if not compressor:
+            return data
+        # a sync flush per batch, so each batch reaches the client as soon as
+        # it's read rather than when the compressor's buffer fills up
+        return compressor.compress(data) + compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    if export_format == ExportFormat.CSV:
+        yield chunk(_encode_csv([list(WasteLogRead.model_fields)]))
+    encode = _encode_csv if export_format == ExportFormat.CSV else _encode_ndjson
+
+    if archived is not None:
+        while True:
+            logs = await asyncio.to_thread(next, archived, None)
+            if logs is None:
+                break
+            for start in range(0, len(logs), settings.EXPORT_BATCH_SIZE):
+                end = start + settings.EXPORT_BATCH_SIZE
+                yield chunk(encode([_export_row(log) for log in logs[start:end]]))
+
+    async with engine.connect() as connection:
+        result = await connection.stream(
+            query.execution_options(yield_per=settings.EXPORT_BATCH_SIZE)
+        )
+        async for rows in result.partitions():
+            yield chunk(encode(rows))
+
+    if compressor:
+        yield compressor.flush()
+
+
+def export_waste_logs(
+    request: Request,
+    query: Select,
+    export_format: ExportFormat,
+    filename: str,
+    archived: Optional[Iterator[List[ArchivedLog]]] = None,
+) -> StreamingResponse:
+    """
+    Streams the rows of `query` (a select of `EXPORT_COLUMNS`), after the
+    `archived` logs if given (see `read_archived_logs`), gzipped if the
+    client accepts it.
+    """
+    compress = accepts_gzip(request)
+    headers = {
+        "Content-Disposition": (
+            f'attachment; filename="{filename}.{export_format.value}"'
+        ),
+        "Vary": "Accept-Encoding",
+    }
+    if compress:
+        headers["Content-Encoding"] = "gzip"
+    return StreamingResponse(
+        _stream(get_read_engine(request), query, export_format, compress, archived),
+        media_type=MEDIA_TYPES[export_format],
+        headers=headers,
+    )
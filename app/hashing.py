@@ -0,0 +1,147 @@
+import asyncio
+import multiprocessing
+import time
+import weakref
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+
+import bcrypt
+
+from app.config import settings
+from app.metrics import PASSWORD_HASHING_SECONDS
+
+
+def hash_password(password: str, rounds: int) -> str:
+    """
+    Hashes a password with bcrypt using the given work factor (log2 rounds).
+    """
+    hashed = bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt(rounds))
+    return hashed.decode("utf-8")
+
+
+def check_password(plain_password: str, hashed_password: str) -> bool:
+    """
+    Checks a password against a bcrypt hash.
+    """
+    return bcrypt.checkpw(
+        plain_password.encode("utf-8"), hashed_password.encode("utf-8")
+    )
+
+
+def hash_rounds(hashed_password: str) -> Optional[int]:
+    """
+    Returns the work factor a bcrypt hash was created with, e.g. 12 for
+    `$2b$12$...`, or None if the hash isn't in the expected format.
+    """
+    try:
+        return int(hashed_password.split("$")[2])
+    except (IndexError, ValueError):
+        return None
+
+
+class PasswordHasher:
+    """
+    Runs bcrypt on a bounded process pool so that the CPU-heavy hashing never
+    blocks the event loop. At most `max_concurrency` operations are handed to
+    the pool at once; everything else waits (and is counted) in the queue.
+    """
+
+    def __init__(self, workers: int, max_concurrency: int, rounds: int):
+        self.workers = workers
+        self.max_concurrency = max_concurrency
+        self.rounds = rounds
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._semaphores = weakref.WeakKeyDictionary()
+
+        # metrics
+        self.queued = 0
+        self.peak_queued = 0
+        self.in_flight = 0
+        self.completed = 0
+        self.rehashed = 0
+        self.total_seconds = 0.0
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # spawn rather than fork: the API process runs threads and an event loop
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return self._executor
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        # one semaphore per event loop (tests run one loop per client)
+        loop = asyncio.get_running_loop()
+        if loop not in self._semaphores:
+            self._semaphores[loop] = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphores[loop]
+
+    async def _run(self, fn, *args):
+        semaphore = self._get_semaphore()
+        self.queued += 1
+        self.peak_queued = max(self.peak_queued, self.queued)
+        try:
+            await semaphore.acquire()
+        finally:
+            self.queued -= 1
+
+        self.in_flight += 1
+        started = time.perf_counter()
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._get_executor(), fn, *args)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.total_seconds += elapsed
+            PASSWORD_HASHING_SECONDS.labels(fn.__name__).observe(elapsed)
+            self.completed += 1
+            self.in_flight -= 1
+            semaphore.release()
+
+    async def hash(self, password: str) -> str:
+        return await self._run(hash_password, password, self.rounds)
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        return await self._run(check_password, plain_password, hashed_password)
+
+    async def rehash(self, password: str) -> str:
+        """Hashes a password whose stored hash `needs_rehash`, counting it."""
+        hashed_password = await self.hash(password)
+        self.rehashed += 1
+        return hashed_password
+
+    def needs_rehash(self, hashed_password: str) -> bool:
+        """
+        True if the hash was made with a different work factor than the
+        configured one, in either direction.
+        """
+        return hash_rounds(hashed_password) != self.rounds
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "max_concurrency": self.max_concurrency,
+            "rounds": self.rounds,
+            "queued": self.queued,
+            "peak_queued": self.peak_queued,
+            "in_flight": self.in_flight,
+            "completed": self.completed,
+            "rehashed": self.rehashed,
+            "avg_ms": (
+                self.total_seconds / self.completed * 1000 if self.completed else 0.0
+            ),
+        }
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+        self._semaphores.clear()
+
+
+password_hasher = PasswordHasher(
+    workers=settings.BCRYPT_WORKERS,
+    max_concurrency=settings.BCRYPT_MAX_CONCURRENCY,
+    rounds=settings.BCRYPT_ROUNDS,
+)
@@ -1,19 +1,56 @@
+import asyncio
+from contextlib import asynccontextmanager, suppress
+
 from fastapi import FastAPI, Request, status
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response
 from sqlalchemy.exc import DataError, IntegrityError, OperationalError
 
+from app.admission import AdmissionControlMiddleware, admission_control
+from app.config import settings
+from app.db.notifications import listener
+from app.db.partitions import maintain_partitions
+from app.db.pool import measure_latency
+from app.db.routing import ReadYourWritesMiddleware
+from app.db.session import async_engine, pool_monitor, read_router
 from app.exception_handlers import (
+    counted,
     db_data_error_handler,
     db_integrity_error_handler,
     db_operational_error_handler,
 )
 from app.exceptions import BaseAppException
+from app.hashing import password_hasher
+from app.metrics import CONTENT_TYPE, REGISTRY, MetricsMiddleware, flush_metrics
+from app.query_tracking import QueryTrackingMiddleware
 from app.routers import register_routers, router
+from app.routers.waste_log import write_batcher
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await listener.start()
+    await read_router.start()
+    partition_maintenance = asyncio.create_task(maintain_partitions())
+    metrics_flush = asyncio.create_task(flush_metrics())
+    yield
+    for task in (partition_maintenance, metrics_flush):
+        task.cancel()
+        with suppress(asyncio.CancelledError):
+            await task
+    # write what is still queued before the connections go
+    await write_batcher.drain()
+    await listener.stop()
+    await read_router.stop()
+    # close pooled connections so they don't outlive the event loop
+    await async_engine.dispose()
+    password_hasher.shutdown()
+
 
 app = FastAPI(
     title="Waste Management Logging API",
     description="Example package for a containerised waste management logging API using FastAPI, SQLModel, PostgreSQL, and nginx.",
     version="0.1.0",
+    lifespan=lifespan,
 )
 
 # init the db hooks e.g. add automatic updated_at to before_update trigger
@@ -22,12 +59,22 @@ from app.db import events as _events
 register_routers()
 app.include_router(router)
 
+app.add_middleware(
+    ReadYourWritesMiddleware, max_age_seconds=settings.READ_YOUR_WRITES_SECONDS
+)
+app.add_middleware(QueryTrackingMiddleware)
+# sheds load before anything else runs (but is still counted by the metrics)
+app.add_middleware(AdmissionControlMiddleware, admission=admission_control)
+# outermost, so it times everything else
+app.add_middleware(MetricsMiddleware)
+
 app.add_exception_handler(IntegrityError, db_integrity_error_handler)
 app.add_exception_handler(OperationalError, db_operational_error_handler)
 app.add_exception_handler(DataError, db_data_error_handler)
 
 
 @app.exception_handler(BaseAppException)
+@counted
 async def base_exception_handler(request: Request, exc: BaseAppException):
     return JSONResponse(
         status_code=status.HTTP_400_BAD_REQUEST,
@@ -49,3 +96,40 @@ async def health_check():
         status_code=status.HTTP_200_OK,
         content={"status": "healthy"},
     )
+
+
+@app.get("/health/ready")
+async def readiness_check():
+    """
+    Whether this worker can serve requests: the database answers within
+    `READINESS_TIMEOUT_SECONDS` and the connection pool isn't exhausted.
+    """
+    pool = pool_monitor.stats()
+    database = {}
+    ready = pool["saturation"] < settings.READINESS_MAX_POOL_SATURATION
+    # an exhausted pool would only make the probe queue for a connection
+    if ready:
+        try:
+            latency = await measure_latency(
+                async_engine, settings.READINESS_TIMEOUT_SECONDS
+            )
+            database["latency_ms"] = round(latency * 1000, 3)
+        except Exception as exc:
+            database["error"] = repr(exc)
+            ready = False
+    return JSONResponse(
+        status_code=(
+            status.HTTP_200_OK if ready else status.HTTP_503_SERVICE_UNAVAILABLE
+        ),
+        content={
+            "status": "ready" if ready else "unavailable",
+            "database": database,
+            "pool": pool,
+        },
+    )
+
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Prometheus metrics, of all workers when `METRICS_DIR` is set."""
+    return Response(REGISTRY.render(settings.METRICS_DIR), media_type=CONTENT_TYPE)
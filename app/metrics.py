@@ -0,0 +1,379 @@
+"""
+A small Prometheus-compatible metrics registry.
+
+Metrics are recorded in plain Python objects of the worker process: no locks
+and no I/O on the request path. (Everything is updated from the event loop;
+the thread pool and the bcrypt processes only report back to it.)
+
+With `METRICS_DIR` set, e.g. when uvicorn runs several workers, every worker
+writes a snapshot of its metrics to `METRICS_DIR/metrics-<pid>.json` every
+`METRICS_FLUSH_INTERVAL_SECONDS` (and on scrape), and `/metrics` adds up the
+snapshots of all workers. Counters and histograms of workers that exited
+still count; gauges only for workers that are alive. Empty the directory
+when the service is (re)deployed.
+"""
+
+import asyncio
+import bisect
+import json
+import logging
+import os
+import time
+from abc import ABC, abstractmethod
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+# request latency buckets (seconds), as Prometheus' client libraries default to
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1, 2.5, 5, 10)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class CounterValue:
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.value += amount
+
+
+class GaugeValue(CounterValue):
+    def dec(self, amount: float = 1.0) -> None:
+        self.value -= amount
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+
+class HistogramValue:
+    """Counts of observed values per bucket, plus their sum and maximum."""
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    @property
+    def count(self) -> int:
+        return sum(self.counts)
+
+    def stats(self) -> dict:
+        """Cumulative counts per upper bound, as Prometheus reports them."""
+        cumulative, total = {}, 0
+        for bound, count in zip(self.buckets + ("+Inf",), self.counts):
+            total += count
+            cumulative[str(bound)] = total
+        return {"buckets": cumulative, "count": total, "sum": self.sum, "max": self.max}
+
+
+class Metric(ABC):
+    """A named metric with one value per combination of label values."""
+
+    type = ""
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        registry: Optional["Registry"] = None,
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], object] = {}
+        (registry or REGISTRY).register(self)
+
+    @abstractmethod
+    def _new_value(self):
+        """A value for a new combination of label values."""
+
+    def labels(self, *values: str):
+        """The value for these label values; keep it to skip the lookup."""
+        value = self._values.get(values)
+        if value is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} takes labels {self.labelnames}")
+            value = self._values[values] = self._new_value()
+        return value
+
+    def snapshot(self) -> dict:
+        return {
+            "type": self.type,
+            "help": self.documentation,
+            "labelnames": list(self.labelnames),
+            "values": [
+                [list(labels), self._dump(value)]
+                for labels, value in self._values.items()
+            ],
+        }
+
+    def _dump(self, value):
+        return value.value
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def _new_value(self):
+        return CounterValue()
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.labels().inc(amount)
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def _new_value(self):
+        return GaugeValue()
+
+    def set(self, value: float) -> None:
+        self.labels().set(value)
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, *args, buckets: Sequence[float] = DEFAULT_BUCKETS, **kwargs):
+        self.buckets = tuple(buckets)
+        super().__init__(*args, **kwargs)
+
+    def _new_value(self):
+        return HistogramValue(self.buckets)
+
+    def observe(self, value: float) -> None:
+        self.labels().observe(value)
+
+    def snapshot(self) -> dict:
+        return {**super().snapshot(), "buckets": list(self.buckets)}
+
+    def _dump(self, value):
+        return {"counts": value.counts, "sum": value.sum}
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+        self._collectors: List[Callable[[], None]] = []
+
+    def register(self, metric: Metric) -> None:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+
+    def on_collect(self, callback: Callable[[], None]) -> None:
+        """Runs `callback` before every snapshot, to update sampled gauges."""
+        self._collectors.append(callback)
+
+    def snapshot(self) -> dict:
+        for callback in self._collectors:
+            try:
+                callback()
+            except Exception:
+                logger.exception("Metrics collector failed")
+        return {name: metric.snapshot() for name, metric in self._metrics.items()}
+
+    def write_snapshot(self, directory: str) -> None:
+        """Atomically replaces this worker's snapshot file in `directory`."""
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"metrics-{os.getpid()}.json")
+        temporary = f"{path}.tmp"
+        with open(temporary, "w") as file:
+            json.dump({"pid": os.getpid(), "metrics": self.snapshot()}, file)
+        os.replace(temporary, path)
+
+    def render(self, directory: Optional[str] = None) -> str:
+        """The metrics in Prometheus' text format, of all workers if `directory`."""
+        if not directory:
+            return render_text(self.snapshot())
+        self.write_snapshot(directory)
+        return render_text(merge_snapshots(read_snapshots(directory)))
+
+
+def _is_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def read_snapshots(directory: str) -> Iterable[Tuple[bool, dict]]:
+    """Yields (worker is alive, metrics) for the snapshots in `directory`."""
+    for filename in sorted(os.listdir(directory)):
+        if not (filename.startswith("metrics-") and filename.endswith(".json")):
+            continue
+        try:
+            with open(os.path.join(directory, filename)) as file:
+                snapshot = json.load(file)
+        except (OSError, ValueError):
+            continue
+        yield _is_alive(snapshot["pid"]), snapshot["metrics"]
+
+
+def merge_snapshots(snapshots: Iterable[Tuple[bool, dict]]) -> dict:
+    """Adds up the values of several workers' snapshots."""
+    merged = {}
+    for is_alive, metrics in snapshots:
+        for name, metric in metrics.items():
+            if metric["type"] == "gauge" and not is_alive:
+                continue
+            target = merged.setdefault(name, {**metric, "values": {}})
+            for labels, value in metric["values"]:
+                key = tuple(labels)
+                if metric["type"] != "histogram":
+                    target["values"][key] = target["values"].get(key, 0.0) + value
+                elif key not in target["values"]:
+                    target["values"][key] = {
+                        "counts": list(value["counts"]),
+                        "sum": value["sum"],
+                    }
+                else:
+                    total = target["values"][key]
+                    total["counts"] = [
+                        a + b for a, b in zip(total["counts"], value["counts"])
+                    ]
+                    total["sum"] += value["sum"]
+    for metric in merged.values():
+        metric["values"] = [[list(k), v] for k, v in metric["values"].items()]
+    return merged
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def render_text(metrics: dict) -> str:
+    lines = []
+    for name, metric in sorted(metrics.items()):
+        lines.append(f"# HELP {name} {metric['help']}")
+        lines.append(f"# TYPE {name} {metric['type']}")
+        names = metric["labelnames"]
+        for labels, value in metric["values"]:
+            if metric["type"] != "histogram":
+                lines.append(f"{name}{_labels(names, labels)} {_number(value)}")
+                continue
+            cumulative = 0
+            bounds = [_number(bound) for bound in metric["buckets"]] + ["+Inf"]
+            for bound, count in zip(bounds, value["counts"]):
+                cumulative += count
+                label_text = _labels(names, labels, f'le="{bound}"')
+                lines.append(f"{name}_bucket{label_text} {cumulative}")
+            lines.append(f"{name}_sum{_labels(names, labels)} {_number(value['sum'])}")
+            lines.append(f"{name}_count{_labels(names, labels)} {cumulative}")
+    return "\n".join(lines) + "\n"
+
+
+async def flush_metrics(
+    directory: Optional[str] = settings.METRICS_DIR,
+    interval_seconds: float = settings.METRICS_FLUSH_INTERVAL_SECONDS,
+) -> None:
+    """Writes this worker's snapshot every `interval_seconds`, until cancelled."""
+    while directory:
+        await asyncio.sleep(interval_seconds)
+        try:
+            REGISTRY.write_snapshot(directory)
+        except OSError:
+            logger.exception("Writing the metrics snapshot failed")
+
+
+REGISTRY = Registry()
+
+HTTP_REQUESTS = Counter(
+    "http_requests_total",
+    "HTTP requests by method, route template and status code.",
+    ("method", "route", "status"),
+)
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds",
+    "HTTP request latency by method, route template and status code.",
+    ("method", "route", "status"),
+)
+HTTP_IN_FLIGHT = Gauge(
+    "http_requests_in_flight", "HTTP requests currently being served."
+)
+DB_QUERY_SECONDS = Histogram(
+    "db_query_duration_seconds",
+    "Duration of SQL statements by engine and statement type.",
+    ("engine", "operation"),
+)
+DB_QUERY_ERRORS = Counter(
+    "db_query_errors_total",
+    "SQL statements that raised, by engine.",
+    ("engine",),
+)
+PASSWORD_HASHING_SECONDS = Histogram(
+    "password_hashing_duration_seconds",
+    "Time spent hashing and checking passwords with bcrypt, by operation.",
+    ("operation",),
+)
+EXCEPTIONS_HANDLED = Counter(
+    "exception_handler_calls_total",
+    "Exceptions turned into responses, by exception handler.",
+    ("handler",),
+)
+
+
+def route_template(scope) -> str:
+    route = scope.get("route")
+    return getattr(route, "path", None) or "<unmatched>"
+
+
+class MetricsMiddleware:
+    """
+    Counts and times HTTP requests by route template (e.g.
+    `/waste-logs/{log_id}`), so the number of series doesn't depend on the
+    ids in the URLs. Plain ASGI, to keep the per-request overhead small.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        in_flight = HTTP_IN_FLIGHT.labels()
+        in_flight.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - started
+            in_flight.dec()
+            labels = (scope["method"], route_template(scope), str(status_code))
+            HTTP_REQUESTS.labels(*labels).inc()
+            HTTP_REQUEST_SECONDS.labels(*labels).observe(elapsed)
@@ -1,6 +1,7 @@
 from datetime import datetime
 from typing import List, Optional
 
+from sqlalchemy import DateTime
 from sqlmodel import Field, Relationship, SQLModel
 
 from app.helpers import utc_now
@@ -9,9 +10,27 @@ from app.helpers import utc_now
 class Team(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
     name: str = Field(index=True)
-    created_at: datetime = Field(default_factory=utc_now, nullable=False)
-    updated_at: datetime = Field(default_factory=utc_now, nullable=False)
+    created_at: datetime = Field(
+        default_factory=utc_now, sa_type=DateTime(timezone=True), nullable=False
+    )
+    updated_at: datetime = Field(
+        default_factory=utc_now, sa_type=DateTime(timezone=True), nullable=False
+    )
 
     # Relationships
     users: List["User"] = Relationship(back_populates="team")
     waste_logs: List["WasteLog"] = Relationship(back_populates="team")
+
+
+class TeamDataVersion(SQLModel, table=True):
+    """
+    A shard of a team's data version, which is the sum of its shards. Bumped
+    by triggers whenever the team's waste logs change (see
+    app/db/data_version.py).
+    """
+
+    __tablename__ = "team_data_version"
+
+    team_id: int = Field(foreign_key="team.id", primary_key=True, ondelete="CASCADE")
+    shard: int = Field(primary_key=True)
+    version: int
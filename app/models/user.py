@@ -2,6 +2,7 @@ from datetime import datetime
 from enum import Enum
 from typing import List, Optional
 
+from sqlalchemy import DateTime
 from sqlmodel import Field, Relationship, SQLModel
 
 from app.helpers import utc_now
@@ -27,12 +28,16 @@ class User(SQLModel, table=True):
     team_id: Optional[int] = Field(default=None, foreign_key="team.id", index=True)
     team: Optional[Team] = Relationship(back_populates="users")
 
-    # Auth token for invalidation
-    auth_token: Optional[str] = None
+    # Tokens carry the version they were issued at; bump to revoke them all
+    token_version: int = Field(default=0, sa_column_kwargs={"server_default": "0"})
 
     # Relationships
     waste_logs: List["WasteLog"] = Relationship(back_populates="created_by")
 
     is_active: bool = True
-    created_at: datetime = Field(default_factory=utc_now, nullable=False)
-    updated_at: datetime = Field(default_factory=utc_now, nullable=False)
+    created_at: datetime = Field(
+        default_factory=utc_now, sa_type=DateTime(timezone=True), nullable=False
+    )
+    updated_at: datetime = Field(
+        default_factory=utc_now, sa_type=DateTime(timezone=True), nullable=False
+    )
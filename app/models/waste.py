@@ -1,7 +1,8 @@
-from datetime import datetime
+from datetime import date, datetime
 from enum import Enum
 from typing import Optional
 
+from sqlalchemy import DateTime, Index
 from sqlmodel import Field, Relationship, SQLModel
 
 from app.helpers import utc_now
@@ -20,17 +21,98 @@ class WasteType(str, Enum):
 
 
 class WasteLog(SQLModel, table=True):
+    # Indexes follow the hot query shapes (kept in step with the migrations):
+    __table_args__ = (
+        # a team's logs by time: team-logs pages and recent entries (scanned
+        # backwards for newest first), and timeseries ranges, which the
+        # included columns turn into index-only scans
+        Index(
+            "ix_wastelog_team_id_created_at_id",
+            "team_id",
+            "created_at",
+            "id",
+            postgresql_include=["waste_type", "weight_kg"],
+        ),
+        # all logs by time: the admin listing
+        Index("ix_wastelog_created_at_id", "created_at", "id"),
+        # tiny summary index for wide time range scans over the whole table
+        # (logs are appended roughly in created_at order)
+        Index("brin_wastelog_created_at", "created_at", postgresql_using="brin"),
+    )
+
     id: Optional[int] = Field(default=None, primary_key=True)
     waste_type: WasteType
     weight_kg: float
     description: Optional[str] = None
 
     # Relationships
-    team_id: int = Field(foreign_key="team.id", index=True)
+    # indexed as the leading column of ix_wastelog_team_id_created_at_id
+    team_id: int = Field(foreign_key="team.id")
     team: Team = Relationship(back_populates="waste_logs")
 
     created_by_id: int = Field(foreign_key="user.id", index=True)
     created_by: User = Relationship(back_populates="waste_logs")
 
-    created_at: datetime = Field(default_factory=utc_now, nullable=False)
-    updated_at: datetime = Field(default_factory=utc_now, nullable=False)
+    created_at: datetime = Field(
+        default_factory=utc_now, sa_type=DateTime(timezone=True), nullable=False
+    )
+    updated_at: datetime = Field(
+        default_factory=utc_now, sa_type=DateTime(timezone=True), nullable=False
+    )
+
+
+class WasteLogDailyRollup(SQLModel, table=True):
+    """
+    Per team, UTC day and waste type totals of `wastelog`, kept exact by the
+    triggers in app/db/rollup.py. Analytics read from here instead of
+    scanning a team's whole history.
+    """
+
+    __tablename__ = "wastelog_daily_rollup"
+
+    team_id: int = Field(foreign_key="team.id", primary_key=True)
+    day: date = Field(primary_key=True)
+    waste_type: WasteType = Field(primary_key=True)
+    entry_count: int
+    total_kg: float
+
+
+class WasteLogArchive(SQLModel, table=True):
+    """
+    A Parquet file of archived logs of one team and UTC month (see
+    app/db/archive.py). The rows are inserted in the transaction that deletes
+    the logs from `wastelog`, so only files listed here are read.
+    """
+
+    __tablename__ = "wastelog_archive"
+    __table_args__ = (Index("ix_wastelog_archive_team_id_month", "team_id", "month"),)
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    team_id: int = Field(foreign_key="team.id")
+    month: date
+    # relative to ARCHIVE_DIR
+    path: str = Field(unique=True)
+    entry_count: int
+    total_kg: float
+    first_created_at: datetime = Field(sa_type=DateTime(timezone=True))
+    last_created_at: datetime = Field(sa_type=DateTime(timezone=True))
+    archived_at: datetime = Field(
+        default_factory=utc_now, sa_type=DateTime(timezone=True), nullable=False
+    )
+
+
+class WasteLogArchiveRollup(SQLModel, table=True):
+    """
+    Per team, UTC day and waste type totals of the logs archived to Parquet
+    files, added to in the transaction that archives them (see
+    app/db/archive.py). Together with the daily rollup they cover a team's
+    whole history.
+    """
+
+    __tablename__ = "wastelog_archive_rollup"
+
+    team_id: int = Field(foreign_key="team.id", primary_key=True)
+    day: date = Field(primary_key=True)
+    waste_type: WasteType = Field(primary_key=True)
+    entry_count: int
+    total_kg: float
@@ -0,0 +1,148 @@
+"""
+Keyset (cursor) pagination for list endpoints.
+
+Pages are ordered on a unique sort key, e.g. `(created_at, id)`, and the next
+page starts right after the last row of the previous one, so every page costs
+the same index range scan however deep it is. The position is handed to
+clients as an opaque cursor in the `X-Next-Cursor` header (and a `Link: ...;
+rel="next"` header); the body stays a plain list. The last page has no
+cursor.
+
+`skip` (offset) paging is still accepted for existing clients but is
+deprecated: responses to it carry a `Deprecation` header.
+"""
+
+import base64
+import json
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Awaitable, Callable, List, Optional, Sequence
+
+from fastapi import Query, Request, Response
+from sqlalchemy import func, literal, select, tuple_
+from sqlalchemy.orm import InstrumentedAttribute
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlmodel.sql.expression import SelectOfScalar
+
+from app.config import settings
+from app.exceptions import ValidationError
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+@dataclass
+class PageParams:
+    limit: int
+    cursor: Optional[str] = None
+    skip: Optional[int] = None
+
+
+def page_params(
+    limit: int = Query(settings.DEFAULT_PAGE_SIZE, ge=1, le=settings.MAX_PAGE_SIZE),
+    cursor: Optional[str] = Query(
+        None, description=f"The `{NEXT_CURSOR_HEADER}` of the previous page"
+    ),
+    skip: Optional[int] = Query(
+        None, ge=0, deprecated=True, description="Offset paging; use `cursor`"
+    ),
+) -> PageParams:
+    if cursor is not None and skip is not None:
+        raise ValidationError("Use either cursor or skip, not both")
+    return PageParams(limit=limit, cursor=cursor, skip=skip)
+
+
+def encode_cursor(values: Sequence[Any]) -> str:
+    payload = [
+        value.isoformat() if isinstance(value, datetime) else value for value in values
+    ]
+    raw = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str, sort_key: Sequence[InstrumentedAttribute]) -> List[Any]:
+    """
+    Decodes a cursor into values for the columns of `sort_key`. Anything that
+    wasn't produced by `encode_cursor` for the same sort key is rejected.
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        payload = json.loads(raw)
+        if not isinstance(payload, list) or len(payload) != len(sort_key):
+            raise ValueError
+        values = []
+        for column, value in zip(sort_key, payload):
+            python_type = column.type.python_type
+            if python_type is datetime:
+                value = datetime.fromisoformat(value)
+            elif not isinstance(value, python_type) or isinstance(value, bool):
+                raise ValueError
+            values.append(value)
+    except (ValueError, TypeError):
+        raise ValidationError("Invalid cursor")
+    return values
+
+
+async def paginate(
+    session: AsyncSession,
+    query: SelectOfScalar,
+    sort_key: Sequence[InstrumentedAttribute],
+    page: PageParams,
+    request: Request,
+    response: Response,
+    descending: bool = False,
+    continue_with: Optional[
+        Callable[[int, Optional[List[Any]], int], Awaitable[list]]
+    ] = None,
+) -> list:
+    """
+    Runs `query` (a select of one model, or of columns) for the requested
+    page, ordered on `sort_key`, which must be unique (end it with the primary
+    key). Sets the paging headers on `response` and returns the page's rows.
+
+    `continue_with(limit, after, skip)` lists rows that come after all of the
+    query's, for pages that reach past its end: up to `limit` of them after
+    the sort key values `after` (if not None), in order, once `skip` of them
+    are skipped.
+    """
+    base_query = query
+    if descending:
+        query = query.order_by(*(column.desc() for column in sort_key))
+    else:
+        query = query.order_by(*sort_key)
+
+    if page.skip is not None:
+        query = query.offset(page.skip)
+        response.headers["Deprecation"] = "true"
+    elif page.cursor is not None:
+        values = decode_cursor(page.cursor, sort_key)
+        position = tuple_(*sort_key)
+        last_seen = tuple_(
+            *(literal(value, column.type) for column, value in zip(sort_key, values))
+        )
+        query = query.where(
+            position < last_seen if descending else position > last_seen
+        )
+
+    # one extra row tells us whether there is a next page
+    rows = list((await session.exec(query.limit(page.limit + 1))).all())
+    if continue_with is not None and len(rows) <= page.limit:
+        after, skip = None, 0
+        if rows:
+            after = [getattr(rows[-1], column.key) for column in sort_key]
+        elif page.cursor is not None:
+            after = values
+        elif page.skip is not None:
+            count = select(func.count()).select_from(base_query.subquery())
+            skip = max(0, page.skip - await session.scalar(count))
+        rows += await continue_with(page.limit + 1 - len(rows), after, skip)
+    if len(rows) > page.limit:
+        rows = rows[: page.limit]
+        next_cursor = encode_cursor(
+            [getattr(rows[-1], column.key) for column in sort_key]
+        )
+        next_url = request.url.remove_query_params("skip").include_query_params(
+            cursor=next_cursor
+        )
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+        response.headers["Link"] = f'<{next_url}>; rel="next"'
+    return rows
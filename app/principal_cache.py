@@ -0,0 +1,110 @@
+import time
+from typing import Optional
+
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.cache import TTLCache
+from app.config import settings
+from app.db.notifications import listener, notify
+from app.models.user import User
+from app.schemas.auth import TokenData
+
+# Postgres channel used to tell every worker that a user changed
+PRINCIPAL_CHANNEL = "principal_invalidation"
+
+
+class PrincipalCache:
+    """
+    Caches, per token, its validated claims, so a token is only decoded and
+    checked once (until it expires), and per user id what authentication
+    needs from the user row: the current token version (to reject revoked
+    tokens) and a detached copy of the user itself for handlers that need
+    more than the token's claims.
+    """
+
+    def __init__(self, max_size: int, ttl_seconds: float):
+        self._claims = TTLCache(max_size, ttl_seconds)
+        self._users = TTLCache(max_size, ttl_seconds)
+        self._token_versions = TTLCache(max_size, ttl_seconds)
+        # bumped on every invalidation; see `put_user`
+        self.epoch = 0
+
+    def get_claims(self, token: str) -> Optional[TokenData]:
+        return self._claims.get(token)
+
+    def put_claims(
+        self, token: str, claims: TokenData, expires_at: Optional[float]
+    ) -> None:
+        """
+        Caches a token's validated claims, at most until `expires_at` (its
+        `exp`, a Unix time). Claims can't change, so this is never
+        invalidated: revocation is checked against the token version.
+        """
+        ttl_seconds = None if expires_at is None else expires_at - time.time()
+        if ttl_seconds is None or ttl_seconds > 0:
+            self._claims.set(token, claims, ttl_seconds)
+
+    def get_user(self, user_id: int) -> Optional[User]:
+        return self._users.get(user_id)
+
+    def put_user(self, user: User, epoch: Optional[int] = None) -> User:
+        """
+        Caches a copy of the user and returns it. Pass the `epoch` read before
+        loading the user: if an invalidation happened in the meantime the
+        loaded row may be stale, so it isn't cached.
+        """
+        principal = User.model_validate(user.model_dump())
+        if epoch is None or epoch == self.epoch:
+            self._users.set(principal.id, principal)
+            self._token_versions.set(principal.id, principal.token_version)
+        return principal
+
+    def get_token_version(self, user_id: int) -> Optional[int]:
+        return self._token_versions.get(user_id)
+
+    def put_token_version(
+        self, user_id: int, token_version: int, epoch: Optional[int] = None
+    ) -> None:
+        if epoch is None or epoch == self.epoch:
+            self._token_versions.set(user_id, token_version)
+
+    def invalidate_user(self, user_id: int) -> None:
+        self.epoch += 1
+        self._users.pop(user_id)
+        self._token_versions.pop(user_id)
+
+    def clear(self) -> None:
+        self.epoch += 1
+        self._users.clear()
+        self._token_versions.clear()
+
+    def stats(self) -> dict:
+        return {
+            "claims": self._claims.stats(),
+            "users": self._users.stats(),
+            "token_versions": self._token_versions.stats(),
+        }
+
+
+principal_cache = PrincipalCache(
+    max_size=settings.PRINCIPAL_CACHE_MAX_SIZE,
+    ttl_seconds=settings.PRINCIPAL_CACHE_TTL_SECONDS,
+)
+
+
+async def publish_principal_change(session: AsyncSession, user_id: int) -> None:
+    """
+    Makes every worker drop the user's cached principals once the current
+    transaction commits. Callers should also call `invalidate_user` after the
+    commit so this worker doesn't wait for the round trip.
+    """
+    await notify(session, PRINCIPAL_CHANNEL, str(user_id))
+
+
+def _on_principal_notification(payload: str) -> None:
+    principal_cache.invalidate_user(int(payload))
+
+
+listener.subscribe(PRINCIPAL_CHANNEL, _on_principal_notification)
+# anything could have changed while the listener was disconnected
+listener.on_connect(principal_cache.clear)
@@ -0,0 +1,125 @@
+"""
+Attribution of SQL statements to the HTTP request that ran them.
+
+`QueryTrackingMiddleware` gives every request a `RequestQueries` (in a
+context variable, which the cursor hooks in `app/db/events.py` record into)
+and reports the request's query count and database time in a `Server-Timing`
+header, e.g. `db;dur=3.1;desc="2 queries"`. It logs a warning when a request
+runs more than `QUERY_BUDGET` statements, or the same SELECT at least
+`QUERY_REPEAT_THRESHOLD` times, which is what an N+1 pattern looks like.
+
+Statements of a streaming body run after the headers were sent, so they are
+missing from `Server-Timing` but still count towards the budget.
+"""
+
+import logging
+from collections import Counter
+from contextvars import ContextVar
+from typing import Callable, List, Optional, Tuple
+
+from app.config import settings
+from app.metrics import route_template
+
+logger = logging.getLogger(__name__)
+
+
+class RequestQueries:
+    def __init__(self):
+        self.statements: List[str] = []
+        self.seconds = 0.0
+
+    @property
+    def count(self) -> int:
+        return len(self.statements)
+
+    def record(self, statement: str, seconds: float) -> None:
+        self.statements.append(statement)
+        self.seconds += seconds
+
+    def repeated(self, threshold: int) -> List[Tuple[str, int]]:
+        """
+        SELECT statements that ran at least `threshold` times. Parameters are
+        bound separately, so repeats of a statement are the same query shape.
+        """
+        selects = Counter(
+            statement
+            for statement in self.statements
+            if statement.lstrip()[:6].upper() == "SELECT"
+        )
+        return [
+            (statement, times)
+            for statement, times in selects.most_common()
+            if times >= threshold
+        ]
+
+    def server_timing(self) -> str:
+        noun = "query" if self.count == 1 else "queries"
+        return f'db;dur={self.seconds * 1000:.1f};desc="{self.count} {noun}"'
+
+
+current_queries: ContextVar[Optional[RequestQueries]] = ContextVar(
+    "current_queries", default=None
+)
+
+# called with (method, route template, queries) after every request; for tests
+query_observers: List[Callable[[str, str, RequestQueries], None]] = []
+
+
+def _shorten(statement: str, length: int = 200) -> str:
+    statement = " ".join(statement.split())
+    return statement if len(statement) <= length else statement[:length] + "..."
+
+
+class QueryTrackingMiddleware:
+    def __init__(
+        self,
+        app,
+        budget: int = settings.QUERY_BUDGET,
+        repeat_threshold: int = settings.QUERY_REPEAT_THRESHOLD,
+        server_timing: bool = settings.SERVER_TIMING,
+    ):
+        self.app = app
+        self.budget = budget
+        self.repeat_threshold = repeat_threshold
+        self.server_timing = server_timing
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        queries = RequestQueries()
+        token = current_queries.set(queries)
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start" and self.server_timing:
+                header = (b"server-timing", queries.server_timing().encode("latin-1"))
+                message["headers"] = list(message.get("headers", [])) + [header]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            current_queries.reset(token)
+            self._check(scope, queries)
+
+    def _check(self, scope, queries: RequestQueries) -> None:
+        method, route = scope["method"], route_template(scope)
+        if queries.count > self.budget:
+            logger.warning(
+                "%s %s ran %d queries, over the budget of %d",
+                method,
+                route,
+                queries.count,
+                self.budget,
+            )
+        for statement, times in queries.repeated(self.repeat_threshold):
+            logger.warning(
+                "%s %s ran the same query %d times (N+1?): %s",
+                method,
+                route,
+                times,
+                _shorten(statement),
+            )
+        for observer in query_observers:
+            observer(method, route, queries)
@@ -0,0 +1,375 @@
+"""
+A cache of whole responses of frequently polled reads: team summaries,
+first pages of team logs and team lists.
+
+Entries are keyed on the endpoint, its query parameters and the principal's
+scope (the team whose data the response shows, or all teams), and hold the
+encoded body and headers (paging headers, ETag), so a hit runs no query.
+
+Each scope has a generation that is part of every key; invalidating a team
+bumps it, so its entries can no longer be found and age out of the store.
+Keys also carry the generation of `EVERY_SCOPE`, which invalidates them all.
+`invalidate_on_commit` is called by the `WasteLog`/`Team` hooks in
+app/db/events.py (and by writes that bypass the ORM): the teams are
+invalidated in this worker once the transaction commits, and in the other
+workers through a Postgres NOTIFY. A shared backend's generations live in
+the store itself, so no notification is needed. Writes outside the API
+(manual SQL, COPY) only show once entries expire after
+`RESULT_CACHE_TTL_SECONDS`. Maintenance that changes every team's data at
+once (detaching partitions) calls `invalidate_all_on_commit`.
+
+With read replicas, an entry may be filled from a replica that hasn't
+replayed a write yet, after the write invalidated the team. Entries are
+tagged with the WAL position their data is known to include (see
+`get_session`), and a client that must read its own writes (see
+app/db/routing.py) skips entries older than its last write, so it doesn't
+get its pre-write data back from the cache.
+
+Backends (`RESULT_CACHE_BACKEND`):
+
+- `memory`: an LRU per worker (`TTLCache`);
+- `file`: one file per entry in `RESULT_CACHE_DIR`, shared by the workers of
+  a host; point it at `/dev/shm` to keep it in shared memory.
+"""
+
+import hashlib
+import os
+import time
+from typing import Dict, Iterable, Optional
+
+import orjson
+from fastapi import Request, Response
+from sqlalchemy import Connection, event, text
+from sqlmodel import Session
+
+from app.cache import TTLCache
+from app.conditional import is_fresh, not_modified
+from app.config import settings
+from app.db.notifications import listener
+
+# Postgres channel used to tell every worker that a team's data changed
+RESULT_CACHE_CHANNEL = "result_cache_invalidation"
+# the scope of responses over all teams (e.g. an admin's team list)
+ALL_TEAMS = None
+# invalidating it invalidates every scope
+EVERY_SCOPE = "every"
+
+_PENDING = "result_cache_pending_teams"
+
+
+def _scope_name(team_id: Optional[int]) -> str:
+    return "all" if team_id is ALL_TEAMS else str(team_id)
+
+
+class MemoryBackend:
+    shared = False
+
+    def __init__(self, max_size: int, ttl_seconds: float):
+        self._entries = TTLCache(max_size, ttl_seconds)
+        self._generations: Dict[str, int] = {}
+        self.invalidations = 0
+
+    def generation(self, scope: str) -> str:
+        return str(self._generations.get(scope, 0))
+
+    def get(self, key: str) -> Optional[bytes]:
+        return self._entries.get(key)
+
+    def set(self, key: str, value: bytes) -> None:
+        self._entries.set(key, value)
+
+    def invalidate(self, scope: str) -> None:
+        self._generations[scope] = self._generations.get(scope, 0) + 1
+        self.invalidations += 1
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        return {
+            "backend": "memory",
+            **self._entries.stats(),
+            "invalidations": self.invalidations,
+        }
+
+
+class FileBackend:
+    """
+    Entries are files named after a hash of their key, written atomically,
+    with their expiry time on the first line. Every `max_size // 10` writes,
+    expired entries and (oldest first) those beyond `max_size` are removed.
+    """
+
+    shared = True
+
+    def __init__(self, directory: str, max_size: int, ttl_seconds: float):
+        self.directory = directory
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        os.makedirs(directory, exist_ok=True)
+
+        # metrics, of this worker
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        self._writes = 0
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def _write(self, name: str, data: bytes) -> None:
+        path = self._path(name)
+        temporary = f"{path}.{os.getpid()}.tmp"
+        with open(temporary, "wb") as file:
+            file.write(data)
+        os.replace(temporary, path)
+
+    def generation(self, scope: str) -> str:
+        try:
+            with open(self._path(f"generation-{scope}"), "rb") as file:
+                return file.read().decode()
+        except FileNotFoundError:
+            return "0"
+
+    def get(self, key: str) -> Optional[bytes]:
+        path = self._path(hashlib.sha256(key.encode()).hexdigest())
+        try:
+            with open(path, "rb") as file:
+                expires_at, _, value = file.read().partition(b"\n")
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        if float(expires_at) <= time.time():
+            self._remove(path)
+            self.expirations += 1
+            self.misses += 1
+            return None
+        self.hits += 1
+        return value
+
+    def set(self, key: str, value: bytes) -> None:
+        expires_at = str(time.time() + self.ttl_seconds).encode()
+        self._write(
+            hashlib.sha256(key.encode()).hexdigest(), expires_at + b"\n" + value
+        )
+        self._writes += 1
+        if self._writes % max(self.max_size // 10, 1) == 0:
+            self._prune()
+
+    def invalidate(self, scope: str) -> None:
+        # unique, so concurrent invalidations can't write back an old value
+        self._write(f"generation-{scope}", f"{time.time_ns()}-{os.getpid()}".encode())
+        self.invalidations += 1
+
+    def _entries(self) -> list:
+        with os.scandir(self.directory) as entries:
+            return [
+                entry
+                for entry in entries
+                if len(entry.name) == 64 and entry.is_file(follow_symlinks=False)
+            ]
+
+    def _remove(self, path: str) -> None:
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+
+    def _prune(self) -> None:
+        now = time.time()
+        entries = []
+        for entry in self._entries():
+            try:
+                entries.append((entry.stat().st_mtime, entry.path))
+            except FileNotFoundError:
+                continue
+        entries.sort()
+        # anything written more than a TTL ago has expired
+        while entries and entries[0][0] + self.ttl_seconds <= now:
+            self._remove(entries.pop(0)[1])
+            self.expirations += 1
+        for _, path in entries[: max(len(entries) - self.max_size, 0)]:
+            self._remove(path)
+            self.evictions += 1
+
+    def clear(self) -> None:
+        for entry in self._entries():
+            self._remove(entry.path)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "backend": "file",
+            "directory": self.directory,
+            "size": len(self._entries()),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+        }
+
+
+class ResultCache:
+    def __init__(self, backend=None):
+        # None disables caching
+        self.backend = backend
+        # hits skipped because they predate the client's last write
+        self.stale_skips = 0
+
+    def key(self, request: Request, team_id: Optional[int]) -> Optional[str]:
+        """
+        The cache key of the request's response for a principal that sees
+        `team_id` (or `ALL_TEAMS`), or None if caching is disabled.
+        """
+        if self.backend is None:
+            return None
+        scope = _scope_name(team_id)
+        params = "&".join(
+            f"{name}={value}"
+            for name, value in sorted(request.query_params.multi_items())
+        )
+        generation = self.backend.generation(scope)
+        every_generation = self.backend.generation(EVERY_SCOPE)
+        return f"{request.url.path}?{params}|{scope}|{generation}|{every_generation}"
+
+    def get(self, key: Optional[str], request: Request) -> Optional[Response]:
+        """
+        The cached response, or a 304 if it's what the client has already;
+        None on a miss.
+        """
+        if key is None:
+            return None
+        value = self.backend.get(key)
+        if value is None:
+            return None
+        meta, _, body = value.partition(b"\n")
+        # entries written before they were tagged have no WAL position
+        status_code, headers, *read_lsn = orjson.loads(meta)
+        if (read_lsn or [0])[0] < getattr(request.state, "min_lsn", 0):
+            self.stale_skips += 1
+            return None
+        response = Response(body, status_code=status_code)
+        response.raw_headers = [
+            (name.encode("latin-1"), header.encode("latin-1"))
+            for name, header in headers
+        ]
+        etag = response.headers.get("etag")
+        if etag is not None and is_fresh(request, etag):
+            return not_modified(response)
+        return response
+
+    def put(self, key: Optional[str], request: Request, response: Response) -> Response:
+        """Caches the request's (non-streaming) response and returns it."""
+        if key is not None:
+            headers = [
+                (name.decode("latin-1"), value.decode("latin-1"))
+                for name, value in response.raw_headers
+            ]
+            read_lsn = getattr(request.state, "read_lsn", 0)
+            meta = orjson.dumps([response.status_code, headers, read_lsn])
+            self.backend.set(key, meta + b"\n" + response.body)
+        return response
+
+    def invalidate(self, team_id: Optional[int]) -> None:
+        if self.backend is not None:
+            self.backend.invalidate(_scope_name(team_id))
+
+    def invalidate_on_commit(
+        self, session: Session, team_ids: Iterable[Optional[int]]
+    ) -> None:
+        """
+        Invalidates the teams in every worker once the session's transaction
+        commits (and not at all if it rolls back).
+        """
+        if self.backend is None:
+            return
+        pending = session.info.setdefault(_PENDING, set())
+        new_team_ids = set(team_ids) - pending
+        pending.update(new_team_ids)
+        if self.backend.shared:
+            return
+        for team_id in new_team_ids:
+            session.connection().execute(
+                text("SELECT pg_notify(:channel, :payload)"),
+                {"channel": RESULT_CACHE_CHANNEL, "payload": _scope_name(team_id)},
+            )
+
+    def invalidate_all(self) -> None:
+        if self.backend is not None:
+            self.backend.invalidate(EVERY_SCOPE)
+
+    def invalidate_all_on_commit(self, connection: Connection) -> None:
+        """
+        Invalidates every scope, for writes that change all teams' data outside
+        the ORM: in this worker now, and in every worker (this one included,
+        dropping entries refilled meanwhile) once the transaction commits.
+        """
+        self.invalidate_all()
+        # whatever this process's backend, the workers' may cache results
+        connection.execute(
+            text("SELECT pg_notify(:channel, :payload)"),
+            {"channel": RESULT_CACHE_CHANNEL, "payload": EVERY_SCOPE},
+        )
+
+    def clear(self) -> None:
+        if self.backend is not None:
+            self.backend.clear()
+
+    def stats(self) -> dict:
+        if self.backend is None:
+            return {"backend": "none"}
+        return {**self.backend.stats(), "stale_skips": self.stale_skips}
+
+
+def create_backend(name: str = settings.RESULT_CACHE_BACKEND):
+    if name == "none":
+        return None
+    if name == "memory":
+        return MemoryBackend(
+            settings.RESULT_CACHE_MAX_SIZE, settings.RESULT_CACHE_TTL_SECONDS
+        )
+    if name == "file":
+        if not settings.RESULT_CACHE_DIR:
+            raise ValueError("RESULT_CACHE_BACKEND=file needs RESULT_CACHE_DIR")
+        return FileBackend(
+            settings.RESULT_CACHE_DIR,
+            settings.RESULT_CACHE_MAX_SIZE,
+            settings.RESULT_CACHE_TTL_SECONDS,
+        )
+    raise ValueError(f"Unknown RESULT_CACHE_BACKEND: {name}")
+
+
+result_cache = ResultCache(create_backend())
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_committed(session):
+    for team_id in session.info.pop(_PENDING, ()):
+        result_cache.invalidate(team_id)
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_rolled_back(session):
+    session.info.pop(_PENDING, None)
+
+
+def _on_invalidation_notification(payload: str) -> None:
+    if payload == EVERY_SCOPE:
+        result_cache.invalidate_all()
+    else:
+        result_cache.invalidate(ALL_TEAMS if payload == "all" else int(payload))
+
+
+def _on_listener_connect() -> None:
+    # anything could have changed while the listener was disconnected
+    if result_cache.backend is not None and not result_cache.backend.shared:
+        result_cache.clear()
+
+
+listener.subscribe(RESULT_CACHE_CHANNEL, _on_invalidation_notification)
+listener.on_connect(_on_listener_connect)
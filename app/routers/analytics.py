@@ -1,101 +1,597 @@
+import asyncio
+from datetime import date, datetime, time, timedelta, timezone
 from typing import List, Optional
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
 
-from fastapi import APIRouter, Depends
-from sqlmodel import Session, func, select
+from fastapi import APIRouter, Depends, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from sqlalchemy import (
+    DateTime,
+    Subquery,
+    cast,
+    literal,
+    literal_column,
+    text,
+    true,
+    union_all,
+)
+from sqlmodel import func, select
+from sqlmodel.ext.asyncio.session import AsyncSession
 
-from app.auth import enforce_team_id_for_user, get_current_active_manager
+from app.auth import (
+    enforce_team_id_for_user,
+    get_current_active_admin,
+    get_current_active_manager,
+)
+from app.conditional import conditional_response, set_validators, team_data_etag
+from app.config import settings
+from app.db.archive import (
+    archived_buckets,
+    archived_files,
+    archived_logs_page,
+    read_archived_logs,
+)
+from app.db.data_version import get_team_data_version, team_data_version
 from app.db.session import get_session
-from app.exceptions import ResourceNotFoundError
+from app.exceptions import ResourceNotFoundError, ValidationError
+from app.export import EXPORT_COLUMNS, MEDIA_TYPES, ExportFormat, export_waste_logs
 from app.models.team import Team
 from app.models.user import User
-from app.models.waste import WasteLog, WasteType
-from app.schemas.analytics import TeamWasteSummary
+from app.models.waste import (
+    WasteLog,
+    WasteLogArchiveRollup,
+    WasteLogDailyRollup,
+    WasteType,
+)
+from app.pagination import PageParams, page_params, paginate
+from app.result_cache import result_cache
+from app.routers.waste_log import WASTE_LOG_SORT_KEY, waste_log_rows
+from app.schemas.analytics import (
+    LeaderboardMetric,
+    TeamLeaderboard,
+    TeamWasteSummary,
+    TeamWasteTimeseries,
+    TimeBucket,
+    WasteTimeseriesPoint,
+)
+from app.schemas.auth import TokenData
 from app.schemas.waste import WasteLogRead
+from app.serialization import json_response
 
 router = APIRouter(prefix="/analytics", tags=["analytics"])
 
+# WasteLog columns that make up a WasteLogRead
+RECENT_ENTRY_COLUMNS = [getattr(WasteLog, field) for field in WasteLogRead.model_fields]
+
+
+def daily_totals(
+    team_id: Optional[int] = None,
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+) -> Subquery:
+    """
+    Per team, UTC day and waste type totals of the logs (of one team, and
+    between the days `start` and `end`, exclusive): those of the logs still
+    in Postgres from the daily rollup, and those of the archived ones (see
+    app/db/archive.py), as separate rows.
+    """
+    selects = []
+    for rollup in (WasteLogDailyRollup, WasteLogArchiveRollup):
+        filters = []
+        if team_id is not None:
+            filters.append(rollup.team_id == team_id)
+        if start is not None:
+            filters.append(rollup.day >= start)
+        if end is not None:
+            filters.append(rollup.day < end)
+        selects.append(
+            select(
+                rollup.team_id,
+                rollup.day,
+                rollup.waste_type,
+                rollup.entry_count,
+                rollup.total_kg,
+            ).where(*filters)
+        )
+    return union_all(*selects).subquery("daily_totals")
+
+
+async def _team_not_modified(
+    request: Request, response: Response, session: AsyncSession, team_id: int
+) -> Optional[Response]:
+    """
+    Checks that the team exists and sets the ETag of its data version,
+    returning a 304 if the client's copy is current. The version is read
+    before the data, so an ETag is never newer than the body it comes with.
+    """
+    data_version = await get_team_data_version(session, team_id)
+    if data_version is None:
+        raise ResourceNotFoundError("Team", str(team_id))
+    return conditional_response(
+        request, response, team_data_etag(team_id, data_version)
+    )
+
 
 @router.get("/team-logs", response_model=List[WasteLogRead])
 async def read_waste_logs_by_team(
+    request: Request,
+    response: Response,
+    team_id: Optional[int] = None,
+    page: PageParams = Depends(page_params),
+    session: AsyncSession = Depends(get_session),
+    current_user: TokenData = Depends(get_current_active_manager),
+):
+    team_id = enforce_team_id_for_user(team_id, current_user)
+
+    # first pages are what dashboards poll
+    first_page = page.cursor is None and page.skip is None
+    cache_key = result_cache.key(request, team_id) if first_page else None
+    cached = result_cache.get(cache_key, request)
+    if cached:
+        return cached
+
+    not_modified = await _team_not_modified(request, response, session, team_id)
+    if not_modified:
+        return not_modified
+
+    async def archived_logs(limit, after, skip):
+        # the team's archived logs are older than the others (see
+        # app/db/archive.py)
+        paths = await archived_files(session, team_id, before=after, newest_first=True)
+        if not paths:
+            return []
+        return await asyncio.to_thread(
+            archived_logs_page, paths, limit, after, skip, settings.ARCHIVE_DIR
+        )
+
+    # Filter by team, newest first
+    logs = await paginate(
+        session,
+        select(*waste_log_rows.columns).where(WasteLog.team_id == team_id),
+        WASTE_LOG_SORT_KEY,
+        page,
+        request,
+        response,
+        descending=True,
+        continue_with=archived_logs if settings.ARCHIVE_DIR else None,
+    )
+    return result_cache.put(cache_key, request, waste_log_rows.many(logs, response))
+
+
+@router.get(
+    "/team-logs/export",
+    response_class=StreamingResponse,
+    responses={
+        200: {"content": {media_type: {} for media_type in MEDIA_TYPES.values()}}
+    },
+)
+async def export_waste_logs_by_team(
+    request: Request,
     team_id: Optional[int] = None,
-    skip: int = 0,
-    limit: int = 100,
-    session: Session = Depends(get_session),
-    current_user: User = Depends(get_current_active_manager),
+    export_format: ExportFormat = Query(ExportFormat.NDJSON, alias="format"),
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    session: AsyncSession = Depends(get_session),
+    current_user: TokenData = Depends(get_current_active_manager),
 ):
+    """
+    Streams the team's logs (optionally only those created in [start, end))
+    oldest first, as NDJSON or CSV, archived ones included. Gzipped when the
+    client accepts it.
+    """
     team_id = enforce_team_id_for_user(team_id, current_user)
 
     # Check if team exists
-    team = session.get(Team, team_id)
+    team = await session.get(Team, team_id)
     if not team:
         raise ResourceNotFoundError("Team", str(team_id))
 
-    # Filter by team, apply offset and limit
     query = (
-        select(WasteLog).where(WasteLog.team_id == team_id).offset(skip).limit(limit)
+        select(*EXPORT_COLUMNS)
+        .where(WasteLog.team_id == team_id)
+        .order_by(*WASTE_LOG_SORT_KEY)
     )
+    if start is not None:
+        query = query.where(WasteLog.created_at >= start)
+    if end is not None:
+        query = query.where(WasteLog.created_at < end)
 
-    logs = session.exec(query).all()
-    return logs
+    # the team's archived logs are older than the others (see app/db/archive.py)
+    archived = None
+    if settings.ARCHIVE_DIR:
+        paths = await archived_files(session, team_id, start, end)
+        if paths:
+            archived = read_archived_logs(
+                paths, start, end, directory=settings.ARCHIVE_DIR
+            )
+    return export_waste_logs(
+        request, query, export_format, f"team-{team_id}-logs", archived
+    )
 
 
 @router.get("/team-summary", response_model=TeamWasteSummary)
 async def get_team_analytics(
+    request: Request,
+    response: Response,
     team_id: Optional[int] = None,
-    session: Session = Depends(get_session),
-    current_user: User = Depends(get_current_active_manager),
+    session: AsyncSession = Depends(get_session),
+    current_user: TokenData = Depends(get_current_active_manager),
 ):
     team_id = enforce_team_id_for_user(team_id, current_user)
-    # Check if team exists
-    team = session.get(Team, team_id)
-    if not team:
+
+    cache_key = result_cache.key(request, team_id)
+    cached = result_cache.get(cache_key, request)
+    if cached:
+        return cached
+
+    # A client revalidating its copy gets the data version looked up first,
+    # so a 304 skips the aggregation; otherwise the version is read along
+    # with the summary
+    if "if-none-match" in request.headers:
+        not_modified = await _team_not_modified(request, response, session, team_id)
+        if not_modified:
+            return not_modified
+
+    # Count, total and per-type totals in one pass over the team's daily
+    # rollup rows (archived logs included), so the cost doesn't grow with the
+    # number of logs
+    days = daily_totals(team_id)
+    totals = select(
+        func.coalesce(func.sum(days.c.entry_count), 0).label("total_entries"),
+        func.coalesce(func.sum(days.c.total_kg), 0.0).label("total_waste_kg"),
+        *[
+            func.coalesce(
+                func.sum(days.c.total_kg).filter(days.c.waste_type == waste_type),
+                0.0,
+            ).label(waste_type.value)
+            for waste_type in WasteType
+        ],
+    ).subquery("totals")
+    recent = (
+        select(*RECENT_ENTRY_COLUMNS)
+        .where(WasteLog.team_id == Team.id)
+        .order_by(WasteLog.created_at.desc(), WasteLog.id.desc())
+        .limit(10)
+        .lateral("recent")
+    )
+
+    # ...joined to the team row (which doubles as the existence check) and its
+    # recent entries, so the whole summary is a single round trip. Each row is
+    # one recent entry with the totals repeated; a team without logs gives a
+    # single row with the entry columns all NULL.
+    query = (
+        select(team_data_version(Team.id).label("data_version"), totals, recent)
+        .select_from(Team)
+        .join(totals, true())
+        .outerjoin(recent, true())
+        .where(Team.id == team_id)
+        .order_by(recent.c.created_at.desc(), recent.c.id.desc())
+    )
+    rows = (await session.exec(query)).mappings().all()
+    if not rows:
         raise ResourceNotFoundError("Team", str(team_id))
 
-    # Get total entries
-    total_entries_result = session.exec(
-        select(func.count(WasteLog.id)).where(WasteLog.team_id == team_id)
-    ).first()
+    summary = rows[0]
+    set_validators(response, team_data_etag(team_id, summary["data_version"]))
+    # cast to appropriate return schema
+    recent_entries = [
+        WasteLogRead.model_validate(
+            {column.name: row[column.name] for column in RECENT_ENTRY_COLUMNS}
+        )
+        for row in rows
+        if row["id"] is not None
+    ]
 
-    total_entries = (
-        total_entries_result if total_entries_result and total_entries_result else 0
+    result = TeamWasteSummary(
+        total_entries=summary["total_entries"],
+        total_waste_kg=summary["total_waste_kg"],
+        waste_by_type={
+            waste_type.value: summary[waste_type.value] for waste_type in WasteType
+        },
+        recent_entries=recent_entries,
     )
+    return result_cache.put(
+        cache_key, request, json_response(result.model_dump(mode="json"), response)
+    )
+
+
+@router.get("/leaderboard", response_model=TeamLeaderboard)
+async def get_team_leaderboard(
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    rank_by: LeaderboardMetric = LeaderboardMetric.TOTAL_WASTE_KG,
+    session: AsyncSession = Depends(get_session),
+    current_user: TokenData = Depends(get_current_active_admin),
+):
+    """
+    Every team's totals between the UTC days `start` (inclusive) and `end`
+    (exclusive), or over all time, with kg per member and the team's rank
+    and percentile by `rank_by`, most waste first. Teams without members
+    have no kg per member and come last when ranked by it.
+    """
+    if start is not None and end is not None and start >= end:
+        raise ValidationError("start must be before end")
 
-    # Get total waste kg
-    total_weight_result = session.exec(
-        select(func.sum(WasteLog.weight_kg).label("total")).where(
-            WasteLog.team_id == team_id
+    # One grouped pass over the daily rollup rows in range (archived logs
+    # included) and one over the team memberships, joined to every team and
+    # ranked with window functions, so the cost doesn't grow with the number
+    # of logs or depend on a query per team
+    days = daily_totals(start=start, end=end)
+    totals = (
+        select(
+            days.c.team_id,
+            func.sum(days.c.entry_count).label("total_entries"),
+            func.sum(days.c.total_kg).label("total_waste_kg"),
+            *[
+                func.sum(days.c.total_kg)
+                .filter(days.c.waste_type == waste_type)
+                .label(waste_type.value)
+                for waste_type in WasteType
+            ],
         )
-    ).first()
+        .group_by(days.c.team_id)
+        .subquery("totals")
+    )
+    members = (
+        select(User.team_id, func.count().label("members"))
+        .where(User.team_id.is_not(None))
+        .group_by(User.team_id)
+        .subquery("members")
+    )
 
-    total_waste_kg = (
-        total_weight_result if total_weight_result and total_weight_result else 0
+    total_waste_kg = func.coalesce(totals.c.total_waste_kg, 0.0)
+    member_count = func.coalesce(members.c.members, 0)
+    per_member = total_waste_kg / func.nullif(member_count, 0)
+    metric = (
+        total_waste_kg if rank_by == LeaderboardMetric.TOTAL_WASTE_KG else per_member
+    )
+    query = (
+        select(
+            Team.id.label("team_id"),
+            Team.name.label("team_name"),
+            func.coalesce(totals.c.total_entries, 0).label("total_entries"),
+            total_waste_kg.label("total_waste_kg"),
+            *[
+                func.coalesce(totals.c[waste_type.value], 0.0).label(waste_type.value)
+                for waste_type in WasteType
+            ],
+            member_count.label("members"),
+            per_member.label("waste_kg_per_member"),
+            func.rank().over(order_by=metric.desc().nulls_last()).label("rank"),
+            func.percent_rank()
+            .over(order_by=metric.asc().nulls_first())
+            .label("percentile"),
+        )
+        .select_from(Team)
+        .outerjoin(totals, totals.c.team_id == Team.id)
+        .outerjoin(members, members.c.team_id == Team.id)
+        .order_by(text("rank"), Team.id)
     )
+    rows = (await session.exec(query)).mappings().all()
 
-    # Get waste by type
-    waste_by_type = {}
-    for waste_type in WasteType:
-        type_result = session.exec(
-            select(func.sum(WasteLog.weight_kg).label("total"))
-            .where(WasteLog.team_id == team_id)
-            .where(WasteLog.waste_type == waste_type)
-        ).first()
+    result = TeamLeaderboard(
+        start=start,
+        end=end,
+        rank_by=rank_by,
+        teams=[
+            {
+                **row,
+                "waste_by_type": {
+                    waste_type.value: row[waste_type.value] for waste_type in WasteType
+                },
+            }
+            for row in rows
+        ],
+    )
+    return json_response(result.model_dump(mode="json"))
 
-        waste_by_type[waste_type] = type_result if type_result and type_result else 0.0
 
-    # Get recent entries
-    recent_logs = session.exec(
-        select(WasteLog)
-        .where(WasteLog.team_id == team_id)
-        .order_by(WasteLog.created_at.desc())
-        .limit(10)
-    ).all()
+# generous (month = 28 days) bucket lengths, for capping the size of a series
+APPROXIMATE_BUCKET_LENGTH = {
+    TimeBucket.HOUR: timedelta(hours=1),
+    TimeBucket.DAY: timedelta(days=1),
+    TimeBucket.WEEK: timedelta(weeks=1),
+    TimeBucket.MONTH: timedelta(days=28),
+}
 
-    # cast to appropriate return schema
-    recent_entries = [WasteLogRead.model_validate(log) for log in recent_logs]
 
-    return TeamWasteSummary(
-        total_entries=total_entries,
-        total_waste_kg=total_waste_kg,
-        waste_by_type=waste_by_type,
-        recent_entries=recent_entries,
+def _is_utc_midnight(value: datetime) -> bool:
+    value = value.astimezone(timezone.utc)
+    return value.time() == time(0)
+
+
+@router.get("/timeseries", response_model=TeamWasteTimeseries)
+async def get_team_timeseries(
+    request: Request,
+    response: Response,
+    start: datetime,
+    end: datetime,
+    bucket: TimeBucket = TimeBucket.DAY,
+    tz: str = "UTC",
+    by_type: bool = False,
+    team_id: Optional[int] = None,
+    session: AsyncSession = Depends(get_session),
+    current_user: TokenData = Depends(get_current_active_manager),
+):
+    """
+    Entry counts and kg per hour, day, week or month between `start`
+    (inclusive) and `end` (exclusive), with buckets aligned to local time in
+    the IANA time zone `tz`. Empty buckets are included with zeros. Naive
+    `start`/`end` values are taken to be in `tz`. Hourly series follow the
+    clock changes: an hour repeated when the clocks go back is two buckets
+    with different UTC offsets, and an hour skipped isn't a bucket.
+    """
+    team_id = enforce_team_id_for_user(team_id, current_user)
+
+    try:
+        zone = ZoneInfo(tz)
+    except (ValueError, ZoneInfoNotFoundError):
+        raise ValidationError(f"Unknown time zone: {tz}")
+    if start.tzinfo is None:
+        start = start.replace(tzinfo=zone)
+    if end.tzinfo is None:
+        end = end.replace(tzinfo=zone)
+    if start >= end:
+        raise ValidationError("start must be before end")
+    if (end - start) / APPROXIMATE_BUCKET_LENGTH[
+        bucket
+    ] > settings.TIMESERIES_MAX_BUCKETS:
+        raise ValidationError(
+            f"Range spans more than {settings.TIMESERIES_MAX_BUCKETS} "
+            f"{bucket.value} buckets"
+        )
+
+    not_modified = await _team_not_modified(request, response, session, team_id)
+    if not_modified:
+        return not_modified
+
+    # Days, weeks and months are computed on local wall-clock time (timestamp
+    # without time zone) so that they follow the zone's DST changes. Local
+    # hours repeat or are skipped when the clocks change, so hours are keyed
+    # by the UTC start of the local hour instead: a repeated hour is two
+    # buckets (with different offsets) and a skipped one isn't a bucket.
+    start_param = literal(start, DateTime(timezone=True))
+    end_param = literal(end, DateTime(timezone=True))
+    hourly = bucket == TimeBucket.HOUR
+
+    # Whole UTC days can be served from the daily rollup; anything else
+    # (hourly buckets, other zones, partial days) is a range scan over the
+    # team's logs on the (team_id, created_at) index
+    if (
+        tz == "UTC"
+        and bucket != TimeBucket.HOUR
+        and _is_utc_midnight(start)
+        and _is_utc_midnight(end)
+    ):
+        local_bucket = func.date_trunc(
+            bucket.value, cast(WasteLogDailyRollup.day, DateTime)
+        )
+        entries = func.sum(WasteLogDailyRollup.entry_count)
+        weight = WasteLogDailyRollup.total_kg
+        waste_type_column = WasteLogDailyRollup.waste_type
+        range_filter = (
+            WasteLogDailyRollup.team_id == team_id,
+            WasteLogDailyRollup.day >= start.astimezone(timezone.utc).date(),
+            WasteLogDailyRollup.day < end.astimezone(timezone.utc).date(),
+        )
+    else:
+        local_time = func.timezone(tz, WasteLog.created_at)
+        local_bucket = func.date_trunc(bucket.value, local_time)
+        if hourly:
+            # minus the zone's offset at the log's creation
+            local_bucket = local_bucket - (
+                local_time - func.timezone("UTC", WasteLog.created_at)
+            )
+        entries = func.count()
+        weight = WasteLog.weight_kg
+        waste_type_column = WasteLog.waste_type
+        range_filter = (
+            WasteLog.team_id == team_id,
+            WasteLog.created_at >= start_param,
+            WasteLog.created_at < end_param,
+        )
+
+    per_type = (
+        [
+            func.sum(weight)
+            .filter(waste_type_column == waste_type)
+            .label(waste_type.value)
+            for waste_type in WasteType
+        ]
+        if by_type
+        else []
+    )
+    data = (
+        select(
+            local_bucket.label("bucket"),
+            entries.label("entries"),
+            func.sum(weight).label("total_waste_kg"),
+            *per_type,
+        )
+        .where(*range_filter)
+        .group_by(text("bucket"))
+        .subquery("data")
+    )
+
+    series_start = func.date_trunc(bucket.value, func.timezone(tz, start_param))
+    if hourly:
+        # a series of timestamptz, in UTC hours
+        series_start = func.timezone(tz, series_start)
+        series_end = end_param
+    else:
+        series_end = func.timezone(tz, end_param)
+    series = (
+        func.generate_series(
+            series_start,
+            series_end,
+            literal_column(f"interval '1 {bucket.value}'"),
+        )
+        .table_valued("bucket")
+        .render_derived("series")
+    )
+    if hourly:
+        series_bucket = func.timezone("UTC", series.c.bucket)
+        bucket_start = series.c.bucket
+    else:
+        series_bucket = series.c.bucket
+        bucket_start = func.timezone(tz, series.c.bucket)
+    query = (
+        select(
+            series_bucket.label("local_bucket"),
+            bucket_start.label("bucket_start"),
+            func.coalesce(data.c.entries, 0).label("entries"),
+            func.coalesce(data.c.total_waste_kg, 0.0).label("total_waste_kg"),
+            *[
+                func.coalesce(data.c[waste_type.value], 0.0).label(waste_type.value)
+                for waste_type in (WasteType if by_type else [])
+            ],
+        )
+        .select_from(series)
+        .outerjoin(data, data.c.bucket == series_bucket)
+        .where(series.c.bucket < series_end)
+        .order_by(series.c.bucket)
+    )
+    rows = (await session.exec(query)).mappings().all()
+
+    # Logs moved to the archive (see app/db/archive.py) are added per bucket
+    archived = {}
+    if settings.ARCHIVE_DIR:
+        paths = await archived_files(session, team_id, start, end)
+        if paths:
+            archived = await asyncio.to_thread(
+                archived_buckets,
+                paths,
+                start,
+                end,
+                bucket.value,
+                tz,
+                settings.ARCHIVE_DIR,
+            )
+
+    points = []
+    for row in rows:
+        entries, total_waste_kg = row["entries"], row["total_waste_kg"]
+        waste_by_type = (
+            {waste_type.value: row[waste_type.value] for waste_type in WasteType}
+            if by_type
+            else None
+        )
+        extra = archived.get(row["local_bucket"])
+        if extra is not None:
+            entries += extra["entries"]
+            total_waste_kg += extra["total_waste_kg"]
+            if by_type:
+                for waste_type, kg in extra["by_type"].items():
+                    waste_by_type[waste_type] += kg
+        points.append(
+            WasteTimeseriesPoint(
+                bucket_start=row["bucket_start"].astimezone(zone),
+                entries=entries,
+                total_waste_kg=total_waste_kg,
+                waste_by_type=waste_by_type,
+            )
+        )
+
+    return TeamWasteTimeseries(
+        team_id=team_id, bucket=bucket, tz=tz, start=start, end=end, points=points
     )
@@ -0,0 +1,28 @@
+from fastapi import APIRouter, Depends
+
+from app.admission import admission_control
+from app.auth import get_current_active_admin
+from app.db.session import pool_monitor, read_router
+from app.hashing import password_hasher
+from app.principal_cache import principal_cache
+from app.result_cache import result_cache
+from app.routers.waste_log import write_batcher
+from app.schemas.auth import TokenData
+
+router = APIRouter(prefix="/internal", tags=["internal"])
+
+
+@router.get("/stats")
+async def read_stats(current_user: TokenData = Depends(get_current_active_admin)):
+    """
+    Runtime statistics of the worker process that served the request.
+    """
+    return {
+        "admission_control": admission_control.stats(),
+        "database_pool": pool_monitor.stats(),
+        "password_hashing": password_hasher.stats(),
+        "principal_cache": principal_cache.stats(),
+        "read_routing": read_router.stats(),
+        "result_cache": result_cache.stats(),
+        "write_batching": write_batcher.stats(),
+    }
@@ -1,79 +1,106 @@
 from typing import List
 
-from fastapi import APIRouter, Depends, status
-from sqlmodel import Session, select
+from fastapi import APIRouter, Depends, Request, Response, status
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
 
 from app.auth import (
     get_current_active_admin,
     get_current_active_manager,
     get_current_user,
 )
+from app.conditional import conditional_response, updated_at_etag
 from app.db.session import get_session
 from app.exceptions import AuthorizationError, ResourceNotFoundError, ValidationError
 from app.models.team import Team
 from app.models.user import User, UserRole
+from app.pagination import PageParams, page_params, paginate
+from app.result_cache import ALL_TEAMS, result_cache
+from app.schemas.auth import TokenData
 from app.schemas.team import TeamCreate, TeamRead, TeamUpdate
+from app.serialization import RowSerializer
 
 router = APIRouter(prefix="/teams", tags=["teams"])
 
+# reads select just the TeamRead columns (see app/serialization.py)
+team_rows = RowSerializer(TeamRead, Team)
+
 
 @router.post("/", response_model=TeamRead, status_code=status.HTTP_201_CREATED)
 async def create_team(
     team_data: TeamCreate,
-    session: Session = Depends(get_session),
-    current_user: User = Depends(get_current_active_admin),
+    session: AsyncSession = Depends(get_session),
+    current_user: TokenData = Depends(get_current_active_admin),
 ):
     db_team = Team(name=team_data.name)
     session.add(db_team)
-    session.commit()
-    session.refresh(db_team)
+    await session.commit()
+    await session.refresh(db_team)
     return db_team
 
 
 @router.get("/", response_model=List[TeamRead])
 async def read_teams(
-    skip: int = 0,
-    limit: int = 100,
-    session: Session = Depends(get_session),
-    current_user: User = Depends(get_current_active_manager),
+    request: Request,
+    response: Response,
+    page: PageParams = Depends(page_params),
+    session: AsyncSession = Depends(get_session),
+    current_user: TokenData = Depends(get_current_active_manager),
 ):
+    is_admin = current_user.role == UserRole.ADMIN
+    if not is_admin and current_user.team_id is None:
+        return []
+    cache_key = result_cache.key(
+        request, ALL_TEAMS if is_admin else current_user.team_id
+    )
+    cached = result_cache.get(cache_key, request)
+    if cached:
+        return cached
+
+    query = select(*team_rows.columns)
     # Admins can see all teams
-    if current_user.role == UserRole.ADMIN:
-        teams = session.exec(select(Team).offset(skip).limit(limit)).all()
+    if is_admin:
+        teams = await paginate(session, query, (Team.id,), page, request, response)
     # Managers and employees can only see their own team
     else:
-        if current_user.team_id is None:
-            return []
-        teams = [session.get(Team, current_user.team_id)]
+        teams = (await session.exec(query.where(Team.id == current_user.team_id))).all()
 
-    return teams
+    return result_cache.put(cache_key, request, team_rows.many(teams, response))
 
 
 @router.get("/{team_id}", response_model=TeamRead)
 async def read_team(
     team_id: int,
-    session: Session = Depends(get_session),
-    current_user: User = Depends(get_current_active_manager),
+    request: Request,
+    response: Response,
+    session: AsyncSession = Depends(get_session),
+    current_user: TokenData = Depends(get_current_active_manager),
 ):
     # Check authorization
     if current_user.role != UserRole.ADMIN and current_user.team_id != team_id:
         raise AuthorizationError()
 
-    team = session.get(Team, team_id)
+    query = select(*team_rows.columns).where(Team.id == team_id)
+    team = (await session.exec(query)).first()
     if not team:
         raise ResourceNotFoundError("Team", str(team_id))
 
-    return team
+    not_modified = conditional_response(
+        request, response, updated_at_etag(team.updated_at), team.updated_at
+    )
+    if not_modified:
+        return not_modified
+    return team_rows.one(team, response)
 
 
 @router.patch("/{team_id}", response_model=TeamRead)
 async def update_team(
     team_id: int,
     team_data: TeamUpdate,
-    session: Session = Depends(get_session),
-    current_user: User = Depends(get_current_active_admin),
+    session: AsyncSession = Depends(get_session),
+    current_user: TokenData = Depends(get_current_active_admin),
 ):
-    team = session.get(Team, team_id)
+    team = await session.get(Team, team_id)
     if not team:
         raise ResourceNotFoundError("Team", str(team_id))
 
@@ -84,26 +111,26 @@ async def update_team(
         setattr(team, key, value)
 
     session.add(team)
-    session.commit()
-    session.refresh(team)
+    await session.commit()
+    await session.refresh(team)
     return team
 
 
 @router.delete("/{team_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_team(
     team_id: int,
-    session: Session = Depends(get_session),
-    current_user: User = Depends(get_current_active_admin),
+    session: AsyncSession = Depends(get_session),
+    current_user: TokenData = Depends(get_current_active_admin),
 ):
-    team = session.get(Team, team_id)
+    team = await session.get(Team, team_id)
     if not team:
         raise ResourceNotFoundError("Team", str(team_id))
 
     # Check if team has users
-    users = session.exec(select(User).where(User.team_id == team_id)).all()
+    users = (await session.exec(select(User).where(User.team_id == team_id))).all()
     if users:
         raise ValidationError("Cannot delete team with assigned users")
 
-    session.delete(team)
-    session.commit()
+    await session.delete(team)
+    await session.commit()
     return None
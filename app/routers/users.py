@@ -1,28 +1,40 @@
 from typing import List
 
-from fastapi import APIRouter, Depends, status
-from sqlmodel import Session, select
+from fastapi import APIRouter, Depends, Request, Response, status
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
 
 from app.auth import (
     get_current_active_admin,
     get_current_active_employee,
     get_current_user,
-    get_password_hash,
 )
+from app.conditional import conditional_response, updated_at_etag
 from app.db.session import get_session
 from app.exceptions import AuthorizationError, ResourceNotFoundError, ValidationError
+from app.hashing import password_hasher
 from app.models.team import Team
 from app.models.user import User, UserRole
+from app.pagination import PageParams, page_params, paginate
+from app.principal_cache import principal_cache, publish_principal_change
+from app.schemas.auth import TokenData
 from app.schemas.user import UserCreate, UserRead, UserUpdate
+from app.serialization import RowSerializer
 
 router = APIRouter(prefix="/users", tags=["users"])
 
+# User fields that are copied into access tokens (or protect them)
+TOKEN_CLAIM_FIELDS = ("username", "role", "team_id", "hashed_password")
+
+# reads select just the UserRead columns (see app/serialization.py)
+user_rows = RowSerializer(UserRead, User)
+
 
 @router.post("/", response_model=UserRead, status_code=status.HTTP_201_CREATED)
 async def create_user(
     user_data: UserCreate,
-    session: Session = Depends(get_session),
-    current_user: User = Depends(get_current_active_admin),
+    session: AsyncSession = Depends(get_session),
+    current_user: TokenData = Depends(get_current_active_admin),
 ):
     # Validate team assignment based on role
     if user_data.role == UserRole.ADMIN and user_data.team_id:
@@ -36,7 +48,7 @@ async def create_user(
 
     # Check if team exists if team_id provided
     if user_data.team_id:
-        team = session.get(Team, user_data.team_id)
+        team = await session.get(Team, user_data.team_id)
         if not team:
             raise ResourceNotFoundError("Team", str(user_data.team_id))
 
@@ -44,58 +56,69 @@ async def create_user(
     db_user = User(
         username=user_data.username,
         email=user_data.email,
-        hashed_password=get_password_hash(user_data.password),
+        hashed_password=await password_hasher.hash(user_data.password),
         role=user_data.role,
         team_id=user_data.team_id,
     )
 
     session.add(db_user)
-    session.commit()
-    session.refresh(db_user)
+    await session.commit()
+    await session.refresh(db_user)
     return db_user
 
 
 @router.get("/", response_model=List[UserRead])
 async def read_users(
-    skip: int = 0,
-    limit: int = 100,
-    session: Session = Depends(get_session),
-    current_user: User = Depends(get_current_active_admin),
+    request: Request,
+    response: Response,
+    page: PageParams = Depends(page_params),
+    session: AsyncSession = Depends(get_session),
+    current_user: TokenData = Depends(get_current_active_admin),
 ):
-    users = session.exec(select(User).offset(skip).limit(limit)).all()
-    return users
+    users = await paginate(
+        session, select(*user_rows.columns), (User.id,), page, request, response
+    )
+    return user_rows.many(users, response)
 
 
 @router.get("/me", response_model=UserRead)
-async def read_user_me(current_user: User = Depends(get_current_active_employee)):
+async def read_user_me(current_user: User = Depends(get_current_user)):
     return current_user
 
 
 @router.get("/{user_id}", response_model=UserRead)
 async def read_user(
     user_id: int,
-    session: Session = Depends(get_session),
-    current_user: User = Depends(get_current_active_employee),
+    request: Request,
+    response: Response,
+    session: AsyncSession = Depends(get_session),
+    current_user: TokenData = Depends(get_current_active_employee),
 ):
     # Allow users to access their own data
     if current_user.id != user_id and current_user.role != UserRole.ADMIN:
         raise AuthorizationError()
 
-    user = session.get(User, user_id)
+    query = select(*user_rows.columns).where(User.id == user_id)
+    user = (await session.exec(query)).first()
     if not user:
         raise ResourceNotFoundError("User", str(user_id))
 
-    return user
+    not_modified = conditional_response(
+        request, response, updated_at_etag(user.updated_at), user.updated_at
+    )
+    if not_modified:
+        return not_modified
+    return user_rows.one(user, response)
 
 
 @router.patch("/{user_id}", response_model=UserRead)
 async def update_user(
     user_id: int,
     user_data: UserUpdate,
-    session: Session = Depends(get_session),
-    current_user: User = Depends(get_current_active_admin),
+    session: AsyncSession = Depends(get_session),
+    current_user: TokenData = Depends(get_current_active_admin),
 ):
-    user = session.get(User, user_id)
+    user = await session.get(User, user_id)
     if not user:
         raise ResourceNotFoundError("User", str(user_id))
 
@@ -104,7 +127,9 @@ async def update_user(
 
     # Hash password if provided
     if "password" in update_data:
-        update_data["hashed_password"] = get_password_hash(update_data.pop("password"))
+        update_data["hashed_password"] = await password_hasher.hash(
+            update_data.pop("password")
+        )
 
     # Validate team assignment based on role
     if "role" in update_data and update_data["role"] == UserRole.ADMIN:
@@ -121,47 +146,61 @@ async def update_user(
 
     # Check if team exists if team_id provided
     if "team_id" in update_data and update_data["team_id"] is not None:
-        team = session.get(Team, update_data["team_id"])
+        team = await session.get(Team, update_data["team_id"])
         if not team:
             raise ResourceNotFoundError("Team", str(update_data["team_id"]))
 
+    # Tokens carry these as claims, so changing them revokes outstanding tokens
+    if any(
+        getattr(user, key) != update_data[key]
+        for key in TOKEN_CLAIM_FIELDS
+        if key in update_data
+    ):
+        update_data["token_version"] = user.token_version + 1
+
     for key, value in update_data.items():
         setattr(user, key, value)
 
     session.add(user)
-    session.commit()
-    session.refresh(user)
+    await publish_principal_change(session, user.id)
+    await session.commit()
+    await session.refresh(user)
+    principal_cache.invalidate_user(user.id)
     return user
 
 
 @router.delete("/{user_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_user(
     user_id: int,
-    session: Session = Depends(get_session),
-    current_user: User = Depends(get_current_active_admin),
+    session: AsyncSession = Depends(get_session),
+    current_user: TokenData = Depends(get_current_active_admin),
 ):
-    user = session.get(User, user_id)
+    user = await session.get(User, user_id)
     if not user:
         raise ResourceNotFoundError("User", str(user_id))
 
-    session.delete(user)
-    session.commit()
+    await session.delete(user)
+    await publish_principal_change(session, user.id)
+    await session.commit()
+    principal_cache.invalidate_user(user.id)
     return None
 
 
 @router.post("/{user_id}/invalidate-token", status_code=status.HTTP_200_OK)
 async def invalidate_user_token(
     user_id: int,
-    session: Session = Depends(get_session),
-    current_user: User = Depends(get_current_active_admin),
+    session: AsyncSession = Depends(get_session),
+    current_user: TokenData = Depends(get_current_active_admin),
 ):
-    user = session.get(User, user_id)
+    user = await session.get(User, user_id)
     if not user:
         raise ResourceNotFoundError("User", str(user_id))
 
-    # Invalidate token
-    user.auth_token = None
+    # Invalidate every token issued so far
+    user.token_version += 1
     session.add(user)
-    session.commit()
+    await publish_principal_change(session, user.id)
+    await session.commit()
+    principal_cache.invalidate_user(user.id)
 
     return {"message": f"User {user.username} token invalidated successfully"}
@@ -1,62 +1,243 @@
-from typing import List, Optional
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
 
-from fastapi import APIRouter, Depends, status
-from sqlmodel import Session, select
+from fastapi import APIRouter, Depends, Query, Request, Response, status
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import TypeAdapter
+from pydantic import ValidationError as PydanticValidationError
+from sqlalchemy import insert
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
 
 from app.auth import (
     enforce_team_id_for_user,
     get_current_active_admin,
     get_current_active_employee,
     get_current_active_manager,
-    get_current_user,
+    get_current_claims,
 )
-from app.db.session import get_session
+from app.conditional import conditional_response, updated_at_etag
+from app.config import settings
+from app.db.session import async_session_maker, get_session
 from app.exceptions import AuthorizationError, ResourceNotFoundError
-from app.models.user import User, UserRole
-from app.models.waste import WasteLog
-from app.schemas.waste import WasteLogCreate, WasteLogRead, WasteLogUpdate
+from app.export import EXPORT_COLUMNS, MEDIA_TYPES, ExportFormat, export_waste_logs
+from app.helpers import utc_now
+from app.models.user import UserRole
+from app.models.waste import WasteLog, WasteType
+from app.pagination import PageParams, page_params, paginate
+from app.result_cache import result_cache
+from app.schemas.auth import TokenData
+from app.schemas.waste import (
+    WasteLogBulkCreate,
+    WasteLogBulkError,
+    WasteLogBulkResult,
+    WasteLogCreate,
+    WasteLogRead,
+    WasteLogUpdate,
+)
+from app.serialization import RowSerializer, json_response
+from app.write_batcher import WriteBatcher
 
 router = APIRouter(prefix="/waste-logs", tags=["waste-logs"])
 
+WASTE_LOG_SORT_KEY = (WasteLog.created_at, WasteLog.id)
+
+# the order of the wastetype enum in Postgres
+WASTE_TYPE_ORDER = {waste_type: order for order, waste_type in enumerate(WasteType)}
+
+_waste_log_create_adapter = TypeAdapter(WasteLogCreate)
+
+# reads select just the WasteLogRead columns (see app/serialization.py)
+waste_log_rows = RowSerializer(WasteLogRead, WasteLog)
+
+# group commit of single creates, with WRITE_BATCHING (see app/write_batcher.py)
+write_batcher = WriteBatcher(
+    async_session_maker,
+    settings.WRITE_BATCH_MAX_ROWS,
+    settings.WRITE_BATCH_MAX_DELAY_MS / 1000,
+    waste_log_rows.columns,
+)
+
 
 @router.post("/", response_model=WasteLogRead, status_code=status.HTTP_201_CREATED)
 async def create_waste_log(
     log_data: WasteLogCreate,
-    session: Session = Depends(get_session),
-    current_user: User = Depends(get_current_active_employee),
+    session: AsyncSession = Depends(get_session),
+    current_user: TokenData = Depends(get_current_active_employee),
     team_id: Optional[int] = None,
 ):
     team_id = enforce_team_id_for_user(team_id, current_user)
+    if settings.WRITE_BATCHING:
+        now = utc_now()
+        row = await write_batcher.add(
+            {
+                **log_data.model_dump(),
+                "team_id": team_id,
+                "created_by_id": current_user.id,
+                "created_at": now,
+                "updated_at": now,
+            }
+        )
+        # the batch committed on the primary: record the client's write for
+        # read-your-writes, as a commit of the request's own session does
+        await session.record_write()
+        return json_response(
+            waste_log_rows.validate_one(row), status_code=status.HTTP_201_CREATED
+        )
+
     db_log = WasteLog(
         **log_data.model_dump(), team_id=team_id, created_by_id=current_user.id
     )
 
     session.add(db_log)
-    session.commit()
-    session.refresh(db_log)
+    await session.commit()
+    await session.refresh(db_log)
     return db_log
 
 
+def _validate_bulk_items(
+    items: List[Dict[str, Any]],
+) -> Tuple[List[Tuple[int, WasteLogCreate]], List[WasteLogBulkError]]:
+    """
+    Validates each raw item as a `WasteLogCreate`, returning the valid ones
+    with their index and an error for every problem with the others.
+    """
+    valid, errors = [], []
+    for index, item in enumerate(items):
+        try:
+            valid.append((index, _waste_log_create_adapter.validate_python(item)))
+        except PydanticValidationError as exc:
+            for error in exc.errors(include_url=False):
+                errors.append(
+                    WasteLogBulkError(
+                        index=index,
+                        field=".".join(str(part) for part in error["loc"]) or None,
+                        message=error["msg"],
+                    )
+                )
+    return valid, errors
+
+
+@router.post(
+    "/bulk",
+    response_model=WasteLogBulkResult,
+    status_code=status.HTTP_201_CREATED,
+    responses={
+        status.HTTP_400_BAD_REQUEST: {
+            "model": WasteLogBulkResult,
+            "description": "Nothing was created: an atomic request had invalid items",
+        }
+    },
+)
+async def create_waste_logs_bulk(
+    bulk: WasteLogBulkCreate,
+    session: AsyncSession = Depends(get_session),
+    current_user: TokenData = Depends(get_current_active_employee),
+    team_id: Optional[int] = None,
+):
+    """
+    Creates many logs for one team in a single transaction, with multi-row
+    INSERT ... RETURNING statements. Invalid items are reported by index; in
+    atomic mode (the default) any invalid item means nothing is created.
+    """
+    team_id = enforce_team_id_for_user(team_id, current_user)
+
+    valid, errors = _validate_bulk_items(bulk.items)
+    if errors and bulk.atomic:
+        result = WasteLogBulkResult(created_ids=[], errors=errors)
+        return JSONResponse(
+            status_code=status.HTTP_400_BAD_REQUEST, content=result.model_dump()
+        )
+
+    created_ids = []
+    if valid:
+        # the rows share their team and day, so in waste type order they lock
+        # the daily rollup rows in key order across all the INSERTs, like any
+        # concurrent bulk create (see app/db/rollup.py)
+        valid.sort(key=lambda item: WASTE_TYPE_ORDER[item[1].waste_type])
+        now = utc_now()
+        rows = [
+            {
+                **log_data.model_dump(),
+                "team_id": team_id,
+                "created_by_id": current_user.id,
+                "created_at": now,
+                "updated_at": now,
+            }
+            for _, log_data in valid
+        ]
+        # SQLAlchemy batches the rows into multi-row INSERTs ("insertmanyvalues")
+        statement = insert(WasteLog).returning(
+            WasteLog.id, sort_by_parameter_order=True
+        )
+        ids = (await session.exec(statement, params=rows)).scalars()
+        created_ids = [
+            log_id for _, log_id in sorted(zip((index for index, _ in valid), ids))
+        ]
+        # Core inserts don't run the ORM hooks that invalidate cached results
+        await session.run_sync(result_cache.invalidate_on_commit, [team_id])
+        await session.commit()
+
+    return WasteLogBulkResult(created_ids=created_ids, errors=errors)
+
+
 @router.get("/", response_model=List[WasteLogRead])
 async def read_all_waste_logs(
-    skip: int = 0,
-    limit: int = 100,
-    session: Session = Depends(get_session),
-    current_user: User = Depends(get_current_active_admin),
+    request: Request,
+    response: Response,
+    page: PageParams = Depends(page_params),
+    session: AsyncSession = Depends(get_session),
+    current_user: TokenData = Depends(get_current_active_admin),
 ):
-    query = select(WasteLog).offset(skip).limit(limit)
+    # newest first
+    logs = await paginate(
+        session,
+        select(*waste_log_rows.columns),
+        WASTE_LOG_SORT_KEY,
+        page,
+        request,
+        response,
+        descending=True,
+    )
+    return waste_log_rows.many(logs, response)
+
 
-    logs = session.exec(query).all()
-    return logs
+@router.get(
+    "/export",
+    response_class=StreamingResponse,
+    responses={
+        200: {"content": {media_type: {} for media_type in MEDIA_TYPES.values()}}
+    },
+)
+async def export_all_waste_logs(
+    request: Request,
+    export_format: ExportFormat = Query(ExportFormat.NDJSON, alias="format"),
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    current_user: TokenData = Depends(get_current_active_admin),
+):
+    """
+    Streams every log (optionally only those created in [start, end)) oldest
+    first, as NDJSON or CSV. Gzipped when the client accepts it.
+    """
+    query = select(*EXPORT_COLUMNS).order_by(*WASTE_LOG_SORT_KEY)
+    if start is not None:
+        query = query.where(WasteLog.created_at >= start)
+    if end is not None:
+        query = query.where(WasteLog.created_at < end)
+    return export_waste_logs(request, query, export_format, "waste-logs")
 
 
 @router.get("/{log_id}", response_model=WasteLogRead)
 async def read_waste_log(
     log_id: int,
-    session: Session = Depends(get_session),
-    current_user: User = Depends(get_current_user),
+    request: Request,
+    response: Response,
+    session: AsyncSession = Depends(get_session),
+    current_user: TokenData = Depends(get_current_claims),
 ):
-    log = session.get(WasteLog, log_id)
+    query = select(*waste_log_rows.columns).where(WasteLog.id == log_id)
+    log = (await session.exec(query)).first()
     if not log:
         raise ResourceNotFoundError("WasteLog", str(log_id))
 
@@ -70,17 +251,22 @@ async def read_waste_log(
     else:
         raise AuthorizationError("You do not have permission to view that log")
 
-    return log
+    not_modified = conditional_response(
+        request, response, updated_at_etag(log.updated_at), log.updated_at
+    )
+    if not_modified:
+        return not_modified
+    return waste_log_rows.one(log, response)
 
 
 @router.patch("/{log_id}", response_model=WasteLogRead)
 async def update_waste_log(
     log_id: int,
     log_data: WasteLogUpdate,
-    session: Session = Depends(get_session),
-    current_user: User = Depends(get_current_user),
+    session: AsyncSession = Depends(get_session),
+    current_user: TokenData = Depends(get_current_claims),
 ):
-    log = session.get(WasteLog, log_id)
+    log = await session.get(WasteLog, log_id)
     if not log:
         raise ResourceNotFoundError("WasteLog", str(log_id))
 
@@ -96,18 +282,18 @@ async def update_waste_log(
         setattr(log, key, value)
 
     session.add(log)
-    session.commit()
-    session.refresh(log)
+    await session.commit()
+    await session.refresh(log)
     return log
 
 
 @router.delete("/{log_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_waste_log(
     log_id: int,
-    session: Session = Depends(get_session),
-    current_user: User = Depends(get_current_user),
+    session: AsyncSession = Depends(get_session),
+    current_user: TokenData = Depends(get_current_claims),
 ):
-    log = session.get(WasteLog, log_id)
+    log = await session.get(WasteLog, log_id)
     if not log:
         raise ResourceNotFoundError("WasteLog", str(log_id))
 
@@ -116,6 +302,6 @@ async def delete_waste_log(
     else:
         raise AuthorizationError("You do not have permission to delete that log")
 
-    session.delete(log)
-    session.commit()
+    await session.delete(log)
+    await session.commit()
     return None
@@ -1,4 +1,6 @@
-from typing import List
+from datetime import date, datetime
+from enum import Enum
+from typing import List, Optional
 
 from pydantic import BaseModel, create_model
 
@@ -19,3 +21,53 @@ class TeamWasteSummary(BaseModel):
     total_waste_kg: float
     waste_by_type: WasteByType
     recent_entries: List[WasteLogRead]
+
+
+class TimeBucket(str, Enum):
+    HOUR = "hour"
+    DAY = "day"
+    WEEK = "week"
+    MONTH = "month"
+
+
+class WasteTimeseriesPoint(BaseModel):
+    bucket_start: datetime
+    entries: int
+    total_waste_kg: float
+    waste_by_type: Optional[WasteByType] = None
+
+
+class TeamWasteTimeseries(BaseModel):
+    team_id: int
+    bucket: TimeBucket
+    tz: str
+    start: datetime
+    end: datetime
+    points: List[WasteTimeseriesPoint]
+
+
+class LeaderboardMetric(str, Enum):
+    TOTAL_WASTE_KG = "total_waste_kg"
+    WASTE_KG_PER_MEMBER = "waste_kg_per_member"
+
+
+class TeamLeaderboardEntry(BaseModel):
+    team_id: int
+    team_name: str
+    total_entries: int
+    total_waste_kg: float
+    waste_by_type: WasteByType
+    members: int
+    # None for teams without members
+    waste_kg_per_member: Optional[float]
+    # 1 for the most waste; teams with equal values share a rank
+    rank: int
+    # share of the other teams with less waste, from 0 to 1
+    percentile: float
+
+
+class TeamLeaderboard(BaseModel):
+    start: Optional[date]
+    end: Optional[date]
+    rank_by: LeaderboardMetric
+    teams: List[TeamLeaderboardEntry]
@@ -15,3 +15,11 @@ class TokenData(BaseModel):
     username: Optional[str] = None
     user_id: Optional[int] = None
     role: Optional[UserRole] = None
+    team_id: Optional[int] = None
+    token_version: Optional[int] = None
+    jti: Optional[str] = None
+
+    @property
+    def id(self) -> Optional[int]:
+        # lets the claims stand in for a User in permission checks
+        return self.user_id
@@ -1,8 +1,9 @@
 from datetime import datetime
-from typing import Optional
+from typing import Annotated, Any, Dict, List, Optional
 
-from pydantic import BaseModel
+from pydantic import BaseModel, Field, PlainValidator
 
+from app.config import settings
 from app.models.waste import WasteType
 
 
@@ -33,3 +34,36 @@ class WasteLogRead(WasteLogBase):
     model_config = {
         "from_attributes": True,
     }
+
+
+def _object(value: Any) -> Dict[str, Any]:
+    if not isinstance(value, dict):
+        raise ValueError("Input should be an object")
+    return value
+
+
+# A `WasteLogCreate` in the OpenAPI schema, but only checked to be an object
+# here: the items are validated one by one in the handler, so that a bad item
+# is reported rather than failing the whole request
+WasteLogBulkItem = Annotated[
+    Dict[str, Any], PlainValidator(_object, json_schema_input_type=WasteLogCreate)
+]
+
+
+class WasteLogBulkCreate(BaseModel):
+    items: List[WasteLogBulkItem] = Field(max_length=settings.BULK_MAX_ITEMS)
+    # all-or-nothing; with `false`, the valid items are created even if
+    # others are rejected
+    atomic: bool = True
+
+
+class WasteLogBulkError(BaseModel):
+    index: int
+    field: Optional[str] = None
+    message: str
+
+
+class WasteLogBulkResult(BaseModel):
+    # ids of the created logs, in the order of their items
+    created_ids: List[int]
+    errors: List[WasteLogBulkError]
@@ -1,115 +1,297 @@
+"""
+Seeds the database with an admin, teams with a manager and employees each,
+and the employees' waste logs:
+
+    python app/setup_service.py [--teams 3] [--users-per-team 5]
+        [--logs-per-user 8] [--days 90] [--end 2026-01-01] [--seed 42]
+        [--waste-types paper=30,plastic=25,organic=20,...]
+
+All data is drawn from one random generator seeded with `--seed`, so the
+same arguments (including `--end`, which defaults to today) give the same
+rows and ids. Logs are generated in time order, weighted towards working
+hours, weekdays and recent weeks, and streamed into `wastelog` with COPY
+while the rollup triggers are off; the rollup is rebuilt once at the end.
+Tens of millions of logs take minutes, e.g.
+
+    python app/setup_service.py --teams 200 --users-per-team 50 \\
+        --logs-per-user 2000 --days 730
+"""
+
+import argparse
+import io
 import random
+from datetime import date, datetime, time, timedelta, timezone
+from typing import Dict, Iterator, List, Sequence, Tuple
 
-from models.waste import WasteLog, WasteType
-from sqlmodel import Session, delete, select
+from sqlalchemy import Connection, insert, text
 
 from app.auth import get_password_hash
 from app.config import settings
+from app.db.partitions import ensure_partitions_between
+from app.db.rollup import deferred_rollup
 from app.db.session import engine
 from app.models.team import Team
 from app.models.user import User, UserRole
+from app.models.waste import WasteType
 
+DEFAULT_WASTE_TYPES = {
+    WasteType.PAPER: 30,
+    WasteType.PLASTIC: 25,
+    WasteType.ORGANIC: 20,
+    WasteType.GLASS: 10,
+    WasteType.METAL: 6,
+    WasteType.ELECTRONIC: 2,
+    WasteType.OTHER: 7,
+}
+
+# Relative activity per UTC hour: mostly office hours, dipping over lunch
+HOUR_WEIGHTS = [1] * 6 + [4, 10, 30, 55, 60, 55, 35, 45, 55, 50, 40, 20, 8, 5] + [2] * 4
+WEEKEND_ACTIVITY = 0.2
+# Activity grows linearly to this multiple of the first day's by the last day
+GROWTH = 2.0
+
+# Rows per COPY statement
+COPY_BATCH = 200_000
+WASTE_LOG_COLUMNS = (
+    "waste_type, weight_kg, team_id, created_by_id, created_at, updated_at"
+)
+
+
+def parse_waste_types(value: str) -> Dict[WasteType, float]:
+    """Parses a distribution like `paper=30,plastic=25`; other types get 0."""
+    weights = {}
+    for item in value.split(","):
+        name, _, weight = item.partition("=")
+        try:
+            weights[WasteType(name.strip().lower())] = float(weight)
+        except ValueError:
+            raise argparse.ArgumentTypeError(f"Invalid waste type weight: {item!r}")
+    if not any(weight > 0 for weight in weights.values()):
+        raise argparse.ArgumentTypeError("At least one waste type needs a weight")
+    return weights
 
-def wipe_existing_data(session: Session) -> None:
-    # Wipe all existing data - won't reset row numbers though
-    session.exec(delete(WasteLog))
-    session.exec(delete(User))
-    session.exec(delete(Team))
-    session.commit()
-    print("Wiped existing data.")
 
+def logs_per_day(total: int, days: int, first_day: date) -> List[int]:
+    """
+    Splits `total` logs over `days` days, proportional to the day's activity.
+    Rounding the running total keeps the sum exact.
+    """
+    weights = []
+    for index in range(days):
+        weight = 1 + (GROWTH - 1) * index / max(days - 1, 1)
+        if (first_day + timedelta(days=index)).weekday() >= 5:
+            weight *= WEEKEND_ACTIVITY
+        weights.append(weight)
+    scale = total / sum(weights)
+    counts, running, allocated = [], 0.0, 0
+    for weight in weights:
+        running += weight * scale
+        counts.append(round(running) - allocated)
+        allocated += counts[-1]
+    return counts
 
-def create_admin_account(session: Session) -> None:
-    # create admin account
-    admin = User(
-        username=settings.ADMIN_USERNAME,
-        full_name="Admin User",
-        email=settings.ADMIN_EMAIL,
-        hashed_password=get_password_hash(settings.ADMIN_PASSWORD),
-        role=UserRole.ADMIN,
-        is_active=True,
+
+def generate_waste_logs(
+    rng: random.Random,
+    employees: Sequence[Tuple[int, int]],
+    total: int,
+    first_day: date,
+    days: int,
+    waste_types: Dict[WasteType, float],
+) -> Iterator[str]:
+    """
+    Yields `total` waste logs of `employees` ((user id, team id) pairs) as
+    lines of COPY text, in `created_at` order, like an append-only table.
+    Some employees log more than others.
+    """
+    activity = [rng.lognormvariate(0, 0.6) for _ in employees]
+    type_names = [waste_type.name for waste_type in waste_types]
+    type_weights = list(waste_types.values())
+    hours = range(24)
+    for index, count in enumerate(logs_per_day(total, days, first_day)):
+        if not count:
+            continue
+        day = (first_day + timedelta(days=index)).isoformat()
+        seconds = sorted(
+            hour * 3600 + int(rng.random() * 3600)
+            for hour in rng.choices(hours, HOUR_WEIGHTS, k=count)
+        )
+        authors = rng.choices(employees, activity, k=count)
+        types = rng.choices(type_names, type_weights, k=count)
+        for second, (user_id, team_id), waste_type in zip(seconds, authors, types):
+            weight = min(max(rng.lognormvariate(1.5, 0.9), 0.1), 500)
+            hour, rest = divmod(second, 3600)
+            timestamp = f"{day} {hour:02d}:{rest // 60:02d}:{rest % 60:02d}+00"
+            yield (
+                f"{waste_type}\t{weight:.2f}\t{team_id}\t{user_id}\t"
+                f"{timestamp}\t{timestamp}\n"
+            )
+
+
+def copy_waste_logs(connection: Connection, lines: Iterator[str]) -> int:
+    """Loads COPY text lines into `wastelog` in batches; returns the row count."""
+    cursor = connection.connection.cursor()
+    copied = 0
+    while True:
+        buffer = io.StringIO()
+        rows = 0
+        for line in lines:
+            buffer.write(line)
+            rows += 1
+            if rows == COPY_BATCH:
+                break
+        if not rows:
+            return copied
+        buffer.seek(0)
+        cursor.copy_expert(f"COPY wastelog ({WASTE_LOG_COLUMNS}) FROM STDIN", buffer)
+        copied += rows
+        print(f"Copied {copied} waste logs.", flush=True)
+
+
+def wipe_existing_data(connection: Connection) -> None:
+    # Wipe all existing data and restart the ids, so seeds are reproducible
+    connection.execute(
+        text(
+            'TRUNCATE wastelog, wastelog_daily_rollup, "user", team '
+            "RESTART IDENTITY CASCADE"
+        )
     )
-    session.add(admin)
-    print("Created new admin account.")
-    session.commit()
-
-
-def seed_teams(session: Session) -> None:
-    # Create 3 default teams
-    for i in range(3):
-        team = Team(name=f"Team {i + 1}")
-        session.add(team)
-        print(f"Created default team: Team {i + 1}.")
-    session.commit()
-    print("Seeded default teams.")
-
-
-def seed_managers(session: Session) -> None:
-    # Create a manager for every team
-    teams = session.exec(select(Team)).all()
-    for team in teams:
-        manager = User(
-            username=f"{team.name.lower().replace(' ', '_')}_manager",
-            email=f"{team.name.lower().replace(' ', '_')}_manager@example.com",
-            full_name=f"{team.name} Manager",
-            hashed_password=get_password_hash("manager"),
-            role=UserRole.MANAGER,
-            team_id=team.id,
+    print("Wiped existing data.")
+
+
+def create_admin_account(connection: Connection, now: datetime) -> None:
+    connection.execute(
+        insert(User).values(
+            username=settings.ADMIN_USERNAME,
+            full_name="Admin User",
+            email=settings.ADMIN_EMAIL,
+            hashed_password=get_password_hash(settings.ADMIN_PASSWORD),
+            role=UserRole.ADMIN,
             is_active=True,
+            created_at=now,
+            updated_at=now,
         )
-        session.add(manager)
-        print(f"Created manager for {team.name}: {manager.username}.")
-    session.commit()
-    print("Seeded managers for all teams.")
-
-
-def seed_employees(session: Session) -> None:
-    # Create 5 employees for every team
-    teams = session.exec(select(Team)).all()
-    for team in teams:
-        for i in range(5):
-            employee = User(
-                username=f"{team.name.lower().replace(' ', '_')}_employee_{i+1}",
-                email=f"{team.name.lower().replace(' ', '_')}_employee_{i+1}@example.com",
-                full_name=f"{team.name} Employee {i+1}",
-                hashed_password=get_password_hash("employee"),
-                role=UserRole.EMPLOYEE,
-                team_id=team.id,
-                is_active=True,
-            )
-            session.add(employee)
-            print(f"Created employee for {team.name}: {employee.username}.")
-    session.commit()
-    print("Seeded employees for all teams.")
-
-
-def seed_waste_logs(session: Session) -> None:
-    # Create between 0 and 15 random waste logs for all employees
-    employees = session.exec(select(User).where(User.role == UserRole.EMPLOYEE)).all()
-    for employee in employees:
-        for _ in range(random.randint(0, 15)):
-            waste_log = WasteLog(
-                created_by_id=employee.id,
-                team_id=employee.team_id,
-                waste_type=random.choice(list(WasteType)),
-                weight_kg=random.randint(1, 100),
+    )
+    print("Created new admin account.")
+
+
+def seed_teams(connection: Connection, teams: int, now: datetime) -> List[int]:
+    rows = [
+        {"name": f"Team {i + 1}", "created_at": now, "updated_at": now}
+        for i in range(teams)
+    ]
+    team_ids = connection.execute(
+        insert(Team).returning(Team.id, sort_by_parameter_order=True), rows
+    ).scalars()
+    print(f"Seeded {teams} teams.")
+    return list(team_ids)
+
+
+def seed_users(
+    connection: Connection, team_ids: List[int], users_per_team: int, now: datetime
+) -> List[Tuple[int, int]]:
+    """
+    Creates a manager and `users_per_team` employees for every team (usernames
+    like `team_1_manager` and `team_1_employee_1`; passwords `manager` and
+    `employee`). Returns the employees as (user id, team id).
+    """
+    # bcrypt is slow on purpose: hash each password once, not once per user
+    hashes = {
+        UserRole.MANAGER: get_password_hash("manager"),
+        UserRole.EMPLOYEE: get_password_hash("employee"),
+    }
+    rows = []
+    for number, team_id in enumerate(team_ids, start=1):
+        members = [(UserRole.MANAGER, "manager", "Manager")] + [
+            (UserRole.EMPLOYEE, f"employee_{i}", f"Employee {i}")
+            for i in range(1, users_per_team + 1)
+        ]
+        for role, suffix, title in members:
+            username = f"team_{number}_{suffix}"
+            rows.append(
+                {
+                    "username": username,
+                    "email": f"{username}@example.com",
+                    "full_name": f"Team {number} {title}",
+                    "hashed_password": hashes[role],
+                    "role": role,
+                    "team_id": team_id,
+                    "is_active": True,
+                    "created_at": now,
+                    "updated_at": now,
+                }
             )
-            session.add(waste_log)
-            print(f"Created waste log for {employee.username}: {waste_log}.")
-    session.commit()
-    print("Seeded waste logs for all employees.")
+    users = connection.execute(
+        insert(User).returning(
+            User.id, User.team_id, User.role, sort_by_parameter_order=True
+        ),
+        rows,
+    ).all()
+    print(f"Seeded {len(users)} managers and employees.")
+    return [(user.id, user.team_id) for user in users if user.role == UserRole.EMPLOYEE]
+
+
+def seed_waste_logs(
+    connection: Connection,
+    rng: random.Random,
+    employees: List[Tuple[int, int]],
+    logs_per_user: int,
+    first_day: date,
+    days: int,
+    waste_types: Dict[WasteType, float],
+) -> None:
+    total = len(employees) * logs_per_user
+    # rows outside the monthly partitions would all pile up in the default one
+    ensure_partitions_between(connection, first_day, first_day + timedelta(days=days))
+    lines = generate_waste_logs(rng, employees, total, first_day, days, waste_types)
+    with deferred_rollup(connection):
+        copied = copy_waste_logs(connection, lines)
+    connection.execute(text("ANALYZE wastelog"))
+    print(f"Seeded {copied} waste logs and rebuilt the rollup.")
 
 
 def run():
-    with Session(engine) as session:
-        wipe_existing_data(session)
-        create_admin_account(session)
-        seed_teams(session)
-        seed_managers(session)
-        seed_employees(session)
-        seed_waste_logs(session)
-
-        print("Completed: setup_service.py")
+    parser = argparse.ArgumentParser(description="Seed the database with demo data.")
+    parser.add_argument("--teams", type=int, default=3)
+    parser.add_argument("--users-per-team", type=int, default=5, help="employees")
+    parser.add_argument(
+        "--logs-per-user", type=int, default=8, help="on average, per employee"
+    )
+    parser.add_argument("--days", type=int, default=90, help="time span of the logs")
+    parser.add_argument(
+        "--end",
+        type=date.fromisoformat,
+        default=datetime.now(timezone.utc).date(),
+        help="the (exclusive) last day of the logs",
+    )
+    parser.add_argument(
+        "--waste-types",
+        type=parse_waste_types,
+        default=DEFAULT_WASTE_TYPES,
+        help="relative weights, e.g. paper=30,plastic=25",
+    )
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    first_day = args.end - timedelta(days=args.days)
+    now = datetime.combine(first_day, time(), tzinfo=timezone.utc)
+    with engine.begin() as connection:
+        wipe_existing_data(connection)
+        create_admin_account(connection, now)
+        team_ids = seed_teams(connection, args.teams, now)
+        employees = seed_users(connection, team_ids, args.users_per_team, now)
+        seed_waste_logs(
+            connection,
+            rng,
+            employees,
+            args.logs_per_user,
+            first_day,
+            args.days,
+            args.waste_types,
+        )
+
+    print("Completed: setup_service.py")
 
 
 if __name__ == "__main__":
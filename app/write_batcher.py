@@ -0,0 +1,225 @@
+"""
+Group commit for `POST /waste-logs/` (opt-in with `WRITE_BATCHING`).
+
+Each create request otherwise runs its own transaction: an INSERT, a COMMIT
+that waits for the WAL to be flushed to disk, and a SELECT to reload the row.
+Under load the commits, not the CPU, cap the throughput. With batching, the
+handlers queue their rows here and wait; the rows are written every
+`WRITE_BATCH_MAX_ROWS` rows, or `WRITE_BATCH_MAX_DELAY_MS` after the first
+one was queued, as one multi-row INSERT ... RETURNING in a single
+transaction, so a batch costs one commit (one WAL flush) however many
+requests it serves. Each caller gets its own row back.
+
+A batch that fails (e.g. a row for a team deleted meanwhile) is retried row
+by row, so only the callers whose rows are invalid get the error.
+
+A caller cancelled (e.g. its client disconnected) while its row is queued
+has the row dropped, so the client's retry doesn't create it twice. Once
+its batch is being written, though, the row is committed whether or not
+the caller is still waiting: a client that gives up on a request and
+retries may then create a log twice (at-least-once).
+"""
+
+import asyncio
+import contextvars
+import logging
+import time
+import weakref
+from typing import List, Tuple
+
+from sqlalchemy import Row, insert
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from app.metrics import Counter, Histogram
+from app.models.waste import WasteLog
+from app.result_cache import result_cache
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+FLUSH_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+
+WRITE_BATCH_ROWS = Histogram(
+    "write_batch_rows",
+    "Rows written per group-committed batch.",
+    buckets=BATCH_SIZE_BUCKETS,
+)
+WRITE_BATCH_FLUSH_SECONDS = Histogram(
+    "write_batch_flush_seconds",
+    "Time from the first row of a batch being queued to its commit.",
+    buckets=FLUSH_BUCKETS,
+)
+WRITE_BATCH_COMMITS = Counter(
+    "write_batch_commits_total",
+    "Transactions (and so WAL flushes) committed by the write batcher.",
+)
+
+Pending = Tuple[dict, asyncio.Future]
+
+
+class _LoopState:
+    """The rows queued on one event loop (tests run one loop per client)."""
+
+    def __init__(self):
+        self.pending: List[Pending] = []
+        self.first_queued_at = 0.0
+        self.timer = None
+        self.tasks = set()
+
+
+class WriteBatcher:
+    def __init__(
+        self,
+        session_maker: async_sessionmaker,
+        max_rows: int,
+        max_delay_seconds: float,
+        columns: list,
+    ):
+        self.session_maker = session_maker
+        self.max_rows = max_rows
+        self.max_delay_seconds = max_delay_seconds
+        # the columns returned for each row
+        self.columns = columns
+        self._states = weakref.WeakKeyDictionary()
+
+        # metrics
+        self.rows = 0
+        self.batches = 0
+        self.commits = 0
+        self.retried_batches = 0
+        self.failed_rows = 0
+        self.cancelled_rows = 0
+        self.batch_rows = WRITE_BATCH_ROWS.labels()
+        self.flush_seconds = WRITE_BATCH_FLUSH_SECONDS.labels()
+
+    def _state(self) -> _LoopState:
+        loop = asyncio.get_running_loop()
+        if loop not in self._states:
+            self._states[loop] = _LoopState()
+        return self._states[loop]
+
+    async def add(self, row: dict) -> Row:
+        """
+        Queues a row of `WasteLog` column values and returns the row as
+        written (its `columns`), once its batch has committed.
+        """
+        state = self._state()
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        if not state.pending:
+            state.first_queued_at = time.perf_counter()
+        state.pending.append((row, future))
+        if len(state.pending) >= self.max_rows:
+            self._flush(state)
+        elif state.timer is None:
+            state.timer = loop.call_later(self.max_delay_seconds, self._flush, state)
+        return await future
+
+    def _flush(self, state: _LoopState) -> None:
+        if state.timer is not None:
+            state.timer.cancel()
+            state.timer = None
+        if not state.pending:
+            return
+        batch, state.pending = state.pending, []
+        # in an empty context: a task copies the current one, which is that of
+        # whichever request filled the batch or armed the timer, and the
+        # batch's statements would count as that request's (see
+        # app/query_tracking.py)
+        task = contextvars.Context().run(
+            asyncio.create_task, self._write(batch, state.first_queued_at)
+        )
+        # the loop only keeps weak references to tasks
+        state.tasks.add(task)
+        task.add_done_callback(state.tasks.discard)
+
+    async def _insert(self, batch: List[Pending]) -> List[Row]:
+        rows = [row for row, _ in batch]
+        statement = insert(WasteLog).returning(
+            *self.columns, sort_by_parameter_order=True
+        )
+        async with self.session_maker() as session:
+            written = (await session.exec(statement, params=rows)).all()
+            # Core inserts don't run the ORM hooks that invalidate cached results
+            await session.run_sync(
+                result_cache.invalidate_on_commit, {row["team_id"] for row in rows}
+            )
+            await session.commit()
+        self.commits += 1
+        WRITE_BATCH_COMMITS.inc()
+        return written
+
+    async def _write(self, batch: List[Pending], first_queued_at: float) -> None:
+        queued = len(batch)
+        batch = [item for item in batch if not item[1].cancelled()]
+        self.cancelled_rows += queued - len(batch)
+        if not batch:
+            return
+        self.batches += 1
+        self.rows += len(batch)
+        self.batch_rows.observe(len(batch))
+        try:
+            written = await self._insert(batch)
+        except Exception as exc:
+            if len(batch) == 1:
+                self.failed_rows += 1
+                _resolve(batch[0][1], exception=exc)
+                return
+            # find the bad rows, without failing the others
+            self.retried_batches += 1
+            logger.warning(
+                "A batch of %d rows failed, retrying them one by one: %r",
+                len(batch),
+                exc,
+            )
+            for item in batch:
+                if item[1].cancelled():
+                    self.cancelled_rows += 1
+                    continue
+                await self._write_one(item)
+            return
+        self.flush_seconds.observe(time.perf_counter() - first_queued_at)
+        for (_, future), row in zip(batch, written):
+            _resolve(future, result=row)
+
+    async def _write_one(self, item: Pending) -> None:
+        try:
+            (row,) = await self._insert([item])
+        except Exception as exc:
+            self.failed_rows += 1
+            _resolve(item[1], exception=exc)
+        else:
+            _resolve(item[1], result=row)
+
+    async def drain(self) -> None:
+        """Writes the rows queued on this loop and waits for all batches."""
+        state = self._state()
+        self._flush(state)
+        if state.tasks:
+            await asyncio.gather(*state.tasks, return_exceptions=True)
+
+    def stats(self) -> dict:
+        return {
+            "max_rows": self.max_rows,
+            "max_delay_ms": self.max_delay_seconds * 1000,
+            "queued": sum(len(state.pending) for state in self._states.values()),
+            "rows": self.rows,
+            "batches": self.batches,
+            "mean_batch_rows": self.rows / self.batches if self.batches else 0.0,
+            "commits": self.commits,
+            "retried_batches": self.retried_batches,
+            "failed_rows": self.failed_rows,
+            "cancelled_rows": self.cancelled_rows,
+            "batch_rows": self.batch_rows.stats(),
+            "flush_seconds": self.flush_seconds.stats(),
+        }
+
+
+def _resolve(future: asyncio.Future, result=None, exception=None) -> None:
+    # the caller may have gone away (e.g. a cancelled request)
+    if future.done():
+        return
+    if exception is not None:
+        future.set_exception(exception)
+    else:
+        future.set_result(result)
@@ -0,0 +1,229 @@
+"""
+Mixed-load concurrency benchmark for a running API instance.
+
+Seeds a dedicated benchmark team (a manager, a handful of employees and a
+configurable number of waste logs), then drives the API with concurrent async
+clients issuing a weighted mix of cheap and expensive requests. Reports
+requests/sec and p50/p99 latency per endpoint and overall.
+
+Usage (from the repo root, against a server started with uvicorn, with the
+per-user rate limit off, as by default, since the clients share a few tokens):
+
+    python -m benchmarks.concurrency --base-url http://127.0.0.1:8000 \
+        --concurrency 50 --duration 20 --logs 50000
+"""
+
+import argparse
+import asyncio
+import random
+import statistics
+import time
+from collections import defaultdict
+
+import httpx
+from sqlalchemy import delete, insert, select
+from sqlmodel import Session
+
+from app.auth import get_password_hash
+from app.db.session import engine
+from app.models.team import Team
+from app.models.user import User, UserRole
+from app.models.waste import WasteLog, WasteType
+
+BENCH_TEAM = "bench-team"
+BENCH_PASSWORD = "bench"
+
+
+def seed(logs: int, employees: int = 5) -> None:
+    """Create (or recreate) the benchmark team and its data."""
+    with Session(engine) as session:
+        team = session.exec(select(Team).where(Team.name == BENCH_TEAM)).scalar()
+        if team is not None:
+            session.exec(delete(WasteLog).where(WasteLog.team_id == team.id))
+            session.exec(delete(User).where(User.team_id == team.id))
+            session.exec(delete(Team).where(Team.id == team.id))
+            session.commit()
+
+        team = Team(name=BENCH_TEAM)
+        session.add(team)
+        session.commit()
+        session.refresh(team)
+
+        hashed = get_password_hash(BENCH_PASSWORD)
+        users = [
+            User(
+                username="bench_manager",
+                email="bench_manager@example.com",
+                hashed_password=hashed,
+                role=UserRole.MANAGER,
+                team_id=team.id,
+            )
+        ]
+        for i in range(employees):
+            users.append(
+                User(
+                    username=f"bench_employee_{i}",
+                    email=f"bench_employee_{i}@example.com",
+                    hashed_password=hashed,
+                    role=UserRole.EMPLOYEE,
+                    team_id=team.id,
+                )
+            )
+        session.add_all(users)
+        session.commit()
+        user_ids = [u.id for u in users]
+
+        rng = random.Random(0)
+        batch = []
+        for _ in range(logs):
+            batch.append(
+                {
+                    "team_id": team.id,
+                    "created_by_id": rng.choice(user_ids),
+                    "waste_type": rng.choice(list(WasteType)),
+                    "weight_kg": rng.uniform(0.1, 100.0),
+                }
+            )
+            if len(batch) == 5000:
+                session.exec(insert(WasteLog), params=batch)
+                batch = []
+        if batch:
+            session.exec(insert(WasteLog), params=batch)
+        session.commit()
+        print(f"Seeded team {team.id} with {len(users)} users and {logs} logs.")
+
+
+def percentile(samples, pct: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+async def login(client: httpx.AsyncClient, username: str) -> dict:
+    response = await client.post(
+        "/auth/token", data={"username": username, "password": BENCH_PASSWORD}
+    )
+    response.raise_for_status()
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+async def run(args) -> dict:
+    latencies = defaultdict(list)
+    errors = defaultdict(int)
+
+    async with httpx.AsyncClient(
+        base_url=args.base_url,
+        timeout=60,
+        limits=httpx.Limits(max_connections=args.concurrency),
+    ) as client:
+        manager = await login(client, "bench_manager")
+        employee = await login(client, "bench_employee_0")
+        created = await client.post(
+            "/waste-logs/",
+            json={"waste_type": "paper", "weight_kg": 1.0},
+            headers=employee,
+        )
+        created.raise_for_status()
+        log_id = created.json()["id"]
+
+        # (name, weight, request factory)
+        mix = [
+            ("GET /users/me", 40, lambda: client.get("/users/me", headers=employee)),
+            (
+                "GET /waste-logs/{id}",
+                30,
+                lambda: client.get(f"/waste-logs/{log_id}", headers=employee),
+            ),
+            (
+                "POST /waste-logs/",
+                20,
+                lambda: client.post(
+                    "/waste-logs/",
+                    json={"waste_type": "glass", "weight_kg": 2.5},
+                    headers=employee,
+                ),
+            ),
+            (
+                "GET /analytics/team-summary",
+                10,
+                lambda: client.get("/analytics/team-summary", headers=manager),
+            ),
+        ]
+        names = [m[0] for m in mix]
+        weights = [m[1] for m in mix]
+        factories = {m[0]: m[2] for m in mix}
+        deadline = time.perf_counter() + args.duration
+
+        async def worker(seed: int) -> None:
+            rng = random.Random(seed)
+            while time.perf_counter() < deadline:
+                name = rng.choices(names, weights)[0]
+                started = time.perf_counter()
+                try:
+                    response = await factories[name]()
+                    ok = response.status_code < 400
+                except httpx.HTTPError:
+                    ok = False
+                elapsed = time.perf_counter() - started
+                if ok:
+                    latencies[name].append(elapsed)
+                else:
+                    errors[name] += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(i) for i in range(args.concurrency)))
+        wall = time.perf_counter() - started
+
+    report = {"concurrency": args.concurrency, "duration_s": wall, "endpoints": {}}
+    everything = []
+    for name in names:
+        samples = latencies[name]
+        everything.extend(samples)
+        report["endpoints"][name] = summarise(samples, wall, errors[name])
+    report["overall"] = summarise(everything, wall, sum(errors.values()))
+    return report
+
+
+def summarise(samples, wall: float, errors: int) -> dict:
+    return {
+        "requests": len(samples),
+        "errors": errors,
+        "rps": len(samples) / wall if wall else 0.0,
+        "p50_ms": percentile(samples, 50) * 1000,
+        "p95_ms": percentile(samples, 95) * 1000,
+        "p99_ms": percentile(samples, 99) * 1000,
+        "mean_ms": statistics.fmean(samples) * 1000 if samples else 0.0,
+    }
+
+
+def print_report(report: dict) -> None:
+    print(
+        f"{'endpoint':32} {'reqs':>7} {'err':>5} {'rps':>9} "
+        f"{'p50 ms':>9} {'p99 ms':>9}"
+    )
+    rows = list(report["endpoints"].items()) + [("overall", report["overall"])]
+    for name, stats in rows:
+        print(
+            f"{name:32} {stats['requests']:>7} {stats['errors']:>5} "
+            f"{stats['rps']:>9.1f} {stats['p50_ms']:>9.1f} {stats['p99_ms']:>9.1f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--duration", type=float, default=20.0)
+    parser.add_argument("--logs", type=int, default=50000)
+    parser.add_argument("--skip-seed", action="store_true")
+    args = parser.parse_args()
+
+    if not args.skip_seed:
+        seed(args.logs)
+    print_report(asyncio.run(run(args)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,426 @@
+"""
+Reproducible benchmark of the API's hot paths at a given data scale.
+
+Seeds benchmark teams with a fixed number of waste logs (10k, 1m or 10m,
+generated deterministically inside Postgres), starts the API with uvicorn on
+a free local port (or uses --base-url), then drives one endpoint at a time
+with concurrent async clients and records throughput and p50/p95/p99
+latency:
+
+    python -m benchmarks.hot_paths run --scale 1m --output results.json
+    python -m benchmarks.hot_paths compare baseline.json results.json
+
+`compare` exits with status 1 when an endpoint's throughput dropped, or its
+p95/p99 latency rose, by more than --threshold (10% by default). Only a
+local Postgres (the POSTGRES_* settings) is needed.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+
+import httpx
+from sqlalchemy import text
+
+from app.auth import get_password_hash
+from app.db.partitions import ensure_partitions_between
+from app.db.session import engine
+from benchmarks.concurrency import login, summarise
+
+SCALES = {"10k": 10_000, "1m": 1_000_000, "10m": 10_000_000}
+TEAM_PREFIX = "bench-hot-"
+PASSWORD = "bench"
+# logs are spread over the year before this instant, so seeded data (and
+# therefore query plans and results) don't depend on the day of the run
+ANCHOR = datetime(2026, 1, 1, tzinfo=timezone.utc)
+SEED_DAYS = 365
+SEED_BATCH = 1_000_000
+
+ENDPOINTS = [
+    "POST /auth/token",
+    "POST /waste-logs/",
+    "GET /waste-logs/{id}",
+    "GET /analytics/team-logs",
+    "GET /analytics/team-summary",
+]
+
+# (metric, True if higher is better) checked by `compare`
+COMPARED = [("rps", True), ("p95_ms", False), ("p99_ms", False)]
+
+
+def seeded_logs(connection, scale: str) -> int:
+    """Logs of the benchmark teams seeded for `scale` (0 if there are none)."""
+    return connection.execute(
+        text(
+            "SELECT count(*) FROM wastelog JOIN team ON team.id = wastelog.team_id "
+            "WHERE team.name LIKE :prefix"
+        ),
+        {"prefix": f"{TEAM_PREFIX}{scale}-%"},
+    ).scalar_one()
+
+
+def seed(scale: str, teams: int, employees: int) -> None:
+    """
+    Replaces any benchmark teams with `teams` new ones, each with a manager and
+    `employees` employees, and the scale's number of waste logs spread evenly
+    over them.
+    """
+    logs = SCALES[scale]
+    hashed = get_password_hash(PASSWORD)
+    with engine.begin() as connection:
+        team_ids = (
+            connection.execute(
+                text("SELECT id FROM team WHERE name LIKE :prefix"),
+                {"prefix": f"{TEAM_PREFIX}%"},
+            )
+            .scalars()
+            .all()
+        )
+        if team_ids:
+            params = {"team_ids": list(team_ids)}
+            for table in ("wastelog", '"user"', "team"):
+                column = "id" if table == "team" else "team_id"
+                connection.execute(
+                    text(f"DELETE FROM {table} WHERE {column} = ANY(:team_ids)"),
+                    params,
+                )
+
+        user_ids, user_teams = [], []
+        for index in range(teams):
+            team_id = connection.execute(
+                text(
+                    "INSERT INTO team (name, created_at, updated_at) "
+                    "VALUES (:name, now(), now()) RETURNING id"
+                ),
+                {"name": f"{TEAM_PREFIX}{scale}-{index}"},
+            ).scalar_one()
+            for role, number in [("MANAGER", 0)] + [
+                ("EMPLOYEE", n) for n in range(employees)
+            ]:
+                username = f"bench_{index}_{role.lower()}_{number}"
+                user_ids.append(
+                    connection.execute(
+                        text(
+                            'INSERT INTO "user" (username, email, hashed_password, '
+                            "role, team_id, token_version, is_active, created_at, "
+                            "updated_at) VALUES (:username, :email, :hashed, :role, "
+                            ":team_id, 0, true, now(), now()) RETURNING id"
+                        ),
+                        {
+                            "username": username,
+                            "email": f"{username}@example.com",
+                            "hashed": hashed,
+                            "role": role,
+                            "team_id": team_id,
+                        },
+                    ).scalar_one()
+                )
+                user_teams.append(team_id)
+
+        # the seeded months get partitions, rather than filling wastelog_default
+        ensure_partitions_between(
+            connection, (ANCHOR - timedelta(days=SEED_DAYS)).date(), ANCHOR.date()
+        )
+
+    # pseudo-random but deterministic values from hashes of the row number
+    insert_logs = text(
+        """
+        INSERT INTO wastelog
+            (waste_type, weight_kg, team_id, created_by_id, created_at, updated_at)
+        SELECT types[1 + (hashint4(i) & 2147483647) % array_length(types, 1)],
+               1 + (hashint4(i + 1) & 2147483647) % 10000 / 100.0,
+               (:user_teams)[1 + i % :users],
+               (:user_ids)[1 + i % :users],
+               at,
+               at
+        FROM generate_series(:first, :last) AS i,
+             LATERAL (
+                SELECT CAST(:anchor AS timestamptz)
+                       - make_interval(secs => (hashint4(i + 2) & 2147483647)
+                                               % (:days * 86400)) AS at
+             ) AS created,
+             (SELECT enum_range(NULL::wastetype) AS types) AS waste_types
+        """
+    )
+    started = time.perf_counter()
+    for first in range(0, logs, SEED_BATCH):
+        with engine.begin() as connection:
+            connection.execute(
+                insert_logs,
+                {
+                    "user_teams": user_teams,
+                    "user_ids": user_ids,
+                    "users": len(user_ids),
+                    "first": first,
+                    "last": min(logs, first + SEED_BATCH) - 1,
+                    "anchor": ANCHOR,
+                    "days": SEED_DAYS,
+                },
+            )
+        print(f"  {min(logs, first + SEED_BATCH):,} / {logs:,} logs", flush=True)
+    with engine.begin() as connection:
+        connection.execute(text("ANALYZE wastelog"))
+    print(
+        f"Seeded {teams} teams, {len(user_ids)} users and {logs:,} logs "
+        f"in {time.perf_counter() - started:.1f}s."
+    )
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(workers: int) -> tuple:
+    """Starts uvicorn on a free port; returns (process, base URL)."""
+    port = free_port()
+    process = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "uvicorn",
+            "app.main:app",
+            "--port",
+            str(port),
+            "--workers",
+            str(workers),
+            "--log-level",
+            "warning",
+        ],
+        # the clients share a few tokens: a rate limit would be measured instead
+        env={**os.environ, "PYTHONPATH": os.getcwd(), "RATE_LIMIT_PER_SECOND": "0"},
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(f"{base_url}/health/ready").status_code == 200:
+                return process, base_url
+        except httpx.HTTPError:
+            pass
+        if process.poll() is not None:
+            break
+        time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError("The API server didn't start")
+
+
+async def measure(factory, concurrency: int, duration: float, warmup: float) -> dict:
+    """Runs `factory()` requests from `concurrency` clients for `duration`."""
+    latencies, errors = [], defaultdict(int)
+
+    async def worker(until: float, record: bool) -> None:
+        while time.perf_counter() < until:
+            started = time.perf_counter()
+            try:
+                response = await factory()
+                ok = response.status_code < 400
+            except httpx.HTTPError:
+                ok = False
+            if not record:
+                continue
+            if ok:
+                latencies.append(time.perf_counter() - started)
+            else:
+                errors["errors"] += 1
+
+    if warmup:
+        until = time.perf_counter() + warmup
+        await asyncio.gather(*(worker(until, False) for _ in range(concurrency)))
+    started = time.perf_counter()
+    until = started + duration
+    await asyncio.gather(*(worker(until, True) for _ in range(concurrency)))
+    return summarise(latencies, time.perf_counter() - started, errors["errors"])
+
+
+async def run_endpoints(args, base_url: str) -> dict:
+    results = {}
+    async with httpx.AsyncClient(
+        base_url=base_url,
+        timeout=60,
+        limits=httpx.Limits(max_connections=args.concurrency),
+    ) as client:
+        manager = await login(client, "bench_0_manager_0")
+        employee = await login(client, "bench_0_employee_0")
+        created = await client.post(
+            "/waste-logs/",
+            json={"waste_type": "paper", "weight_kg": 1.0},
+            headers=employee,
+        )
+        created.raise_for_status()
+        log_id = created.json()["id"]
+
+        factories = {
+            "POST /auth/token": lambda: client.post(
+                "/auth/token",
+                data={"username": "bench_0_employee_0", "password": PASSWORD},
+            ),
+            "POST /waste-logs/": lambda: client.post(
+                "/waste-logs/",
+                json={"waste_type": "glass", "weight_kg": 2.5},
+                headers=employee,
+            ),
+            "GET /waste-logs/{id}": lambda: client.get(
+                f"/waste-logs/{log_id}", headers=employee
+            ),
+            "GET /analytics/team-logs": lambda: client.get(
+                "/analytics/team-logs", headers=manager
+            ),
+            "GET /analytics/team-summary": lambda: client.get(
+                "/analytics/team-summary", headers=manager
+            ),
+        }
+        for name in args.endpoints:
+            results[name] = await measure(
+                factories[name], args.concurrency, args.duration, args.warmup
+            )
+            print_row(name, results[name])
+    return results
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def print_row(name: str, stats: dict) -> None:
+    print(
+        f"{name:30} {stats['requests']:>7} {stats['errors']:>5} {stats['rps']:>9.1f} "
+        f"{stats['p50_ms']:>8.1f} {stats['p95_ms']:>8.1f} {stats['p99_ms']:>8.1f}"
+    )
+
+
+def run(args) -> None:
+    logs = SCALES[args.scale]
+    # runs add the logs they POST; --reseed starts from the exact data again
+    with engine.connect() as connection:
+        existing = seeded_logs(connection, args.scale)
+    if args.reseed or existing < logs:
+        seed(args.scale, args.teams, args.employees)
+
+    process = None
+    if args.base_url:
+        base_url = args.base_url
+    else:
+        process, base_url = start_server(args.workers)
+    print(
+        f"{'endpoint':30} {'reqs':>7} {'err':>5} {'rps':>9} "
+        f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}"
+    )
+    try:
+        endpoints = asyncio.run(run_endpoints(args, base_url))
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+
+    report = {
+        "meta": {
+            "scale": args.scale,
+            "logs": logs,
+            "teams": args.teams,
+            "concurrency": args.concurrency,
+            "duration_s": args.duration,
+            "workers": args.workers if process else None,
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "started_at": datetime.now(timezone.utc).isoformat(),
+        },
+        "endpoints": endpoints,
+    }
+    with open(args.output, "w") as file:
+        json.dump(report, file, indent=2)
+    print(f"Wrote {args.output}")
+
+
+def compare(baseline: dict, current: dict, threshold: float) -> list:
+    """
+    Returns (endpoint, metric, baseline, current, change) for every compared
+    metric that got worse by more than `threshold` (a fraction).
+    """
+    regressions = []
+    for name, stats in current["endpoints"].items():
+        before = baseline["endpoints"].get(name)
+        if before is None:
+            continue
+        for metric, higher_is_better in COMPARED:
+            if not before[metric]:
+                continue
+            change = (stats[metric] - before[metric]) / before[metric]
+            worse = -change if higher_is_better else change
+            if worse > threshold:
+                regressions.append(
+                    (name, metric, before[metric], stats[metric], change)
+                )
+    return regressions
+
+
+def run_compare(args) -> int:
+    with open(args.baseline) as file:
+        baseline = json.load(file)
+    with open(args.current) as file:
+        current = json.load(file)
+    if baseline["meta"]["scale"] != current["meta"]["scale"]:
+        print("Warning: the runs used different data scales")
+
+    regressions = compare(baseline, current, args.threshold)
+    for name, metric, before, after, change in regressions:
+        print(
+            f"REGRESSION {name} {metric}: {before:.1f} -> {after:.1f} ({change:+.0%})"
+        )
+    if not regressions:
+        print(f"No regressions beyond {args.threshold:.0%}.")
+    return 1 if regressions else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="seed, benchmark and write JSON")
+    run_parser.add_argument("--scale", choices=SCALES, default="10k")
+    run_parser.add_argument("--teams", type=int, default=10)
+    run_parser.add_argument("--employees", type=int, default=5)
+    run_parser.add_argument("--reseed", action="store_true")
+    run_parser.add_argument("--base-url", help="use a running API instead")
+    run_parser.add_argument("--workers", type=int, default=1)
+    run_parser.add_argument("--concurrency", type=int, default=32)
+    run_parser.add_argument("--duration", type=float, default=10.0)
+    run_parser.add_argument("--warmup", type=float, default=2.0)
+    run_parser.add_argument(
+        "--endpoints", nargs="+", choices=ENDPOINTS, default=ENDPOINTS
+    )
+    run_parser.add_argument("--output", default="benchmark-results.json")
+
+    compare_parser = commands.add_parser(
+        "compare", help="flag regressions against a baseline"
+    )
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument("--threshold", type=float, default=0.10)
+
+    args = parser.parse_args()
+    if args.command == "run":
+        run(args)
+    else:
+        sys.exit(run_compare(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+CPU cost per row of serving a page of waste logs, ORM path vs. row path.
+
+Fetches the newest `--rows` logs (1000, the largest page, by default) and
+turns them into a JSON body both ways, `--repeat` times:
+
+- orm: `select(WasteLog)` entities, validated against `List[WasteLogRead]`
+  with `from_attributes` and encoded by FastAPI's `JSONResponse`, as the
+  list endpoints used to;
+- rows: `select()` of the `WasteLogRead` columns, through `RowSerializer`.
+
+    python -m benchmarks.serialization [--rows 1000] [--repeat 50]
+
+Needs a database (the POSTGRES_* settings) with at least `--rows` logs,
+e.g. one seeded by `app/setup_service.py` or `benchmarks.hot_paths`.
+"""
+
+import argparse
+import asyncio
+import time
+from typing import List
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_model_field
+from sqlmodel import Session, select
+
+from app.db.session import engine
+from app.models.waste import WasteLog
+from app.routers.waste_log import WASTE_LOG_SORT_KEY, waste_log_rows
+from app.schemas.waste import WasteLogRead
+
+RESPONSE_FIELD = create_model_field("Response_read", List[WasteLogRead])
+
+
+def orm_page(session: Session, rows: int) -> bytes:
+    query = select(WasteLog).order_by(*(column.desc() for column in WASTE_LOG_SORT_KEY))
+    logs = session.exec(query.limit(rows)).all()
+    content = asyncio.run(
+        serialize_response(field=RESPONSE_FIELD, response_content=logs)
+    )
+    # a fresh session per page, as per request, so the identity map is empty
+    session.expunge_all()
+    return JSONResponse(content).body
+
+
+def row_page(session: Session, rows: int) -> bytes:
+    query = select(*waste_log_rows.columns).order_by(
+        *(column.desc() for column in WASTE_LOG_SORT_KEY)
+    )
+    logs = session.exec(query.limit(rows)).all()
+    return waste_log_rows.many(logs).body
+
+
+def measure(page, rows: int, repeat: int) -> dict:
+    with Session(engine) as session:
+        body = page(session, rows)
+        cpu, wall = time.process_time(), time.perf_counter()
+        for _ in range(repeat):
+            page(session, rows)
+        cpu, wall = time.process_time() - cpu, time.perf_counter() - wall
+    return {
+        "cpu_us_per_row": cpu / (repeat * rows) * 1e6,
+        "wall_us_per_row": wall / (repeat * rows) * 1e6,
+        "body": body,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    orm = measure(orm_page, args.rows, args.repeat)
+    rows = measure(row_page, args.rows, args.repeat)
+    if orm["body"] != rows["body"]:
+        raise SystemExit("The two paths produced different response bodies")
+    for name, result in (("orm", orm), ("rows", rows)):
+        print(
+            f"{name:<5} {result['cpu_us_per_row']:7.2f} us CPU/row"
+            f"  {result['wall_us_per_row']:7.2f} us wall/row"
+        )
+    print(f"CPU per row: {rows['cpu_us_per_row'] / orm['cpu_us_per_row']:.0%} of orm")
+
+
+if __name__ == "__main__":
+    main()
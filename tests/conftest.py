@@ -1,3 +1,5 @@
+from contextlib import contextmanager
+
 import pytest
 from fastapi.testclient import TestClient
 
@@ -21,23 +23,101 @@ def setup_database():
 
 @pytest.fixture()
 def session():
-    """Create a new database session for each test."""
-    from app.db.session import get_session
+    """Create a new (synchronous) database session for each test."""
+    from sqlmodel import Session
+
+    from app.db.session import engine
 
-    gen = get_session()
-    session = next(gen)
-    try:
+    with Session(engine) as session:
         yield session
-    finally:
-        # cleanup: close DB session (important!)
-        session.close()
+
+
+@pytest.fixture()
+def query_budget():
+    """
+    `with query_budget(n) as requests:` fails the test if a request made in the
+    block runs more than n SQL statements. `requests` collects a (method,
+    route, RequestQueries) per request.
+    """
+    from app.query_tracking import query_observers
+
+    @contextmanager
+    def _query_budget(max_queries):
+        requests = []
+
+        def observe(method, route, queries):
+            requests.append((method, route, queries))
+
+        query_observers.append(observe)
         try:
-            next(gen)  # allow generator to finish if needed
-        except StopIteration:
-            pass
+            yield requests
+        finally:
+            query_observers.remove(observe)
+        for method, route, queries in requests:
+            assert queries.count <= max_queries, (
+                f"{method} {route} ran {queries.count} queries "
+                f"(budget {max_queries}): {queries.statements}"
+            )
+
+    return _query_budget
 
 
 @pytest.fixture(scope="function")
 def client():
     with TestClient(app) as c:
         yield c
+
+
+@pytest.fixture()
+def team_members(session):
+    """A team with one user per role. Everything is removed again afterwards."""
+    from sqlmodel import delete
+
+    from app.auth import get_password_hash
+    from app.models.team import Team
+    from app.models.user import User, UserRole
+    from app.models.waste import WasteLog
+
+    team = Team(name="Test Team")
+    session.add(team)
+    session.commit()
+    session.refresh(team)
+
+    hashed_password = get_password_hash("password")
+    members = {
+        role: User(
+            username=f"test_{role.value}",
+            email=f"test_{role.value}@example.com",
+            hashed_password=hashed_password,
+            role=role,
+            team_id=None if role == UserRole.ADMIN else team.id,
+        )
+        for role in UserRole
+    }
+    session.add_all(members.values())
+    session.commit()
+    for member in members.values():
+        session.refresh(member)
+
+    yield team, members
+
+    member_ids = [member.id for member in members.values()]
+    session.exec(delete(WasteLog).where(WasteLog.team_id == team.id))
+    session.exec(delete(User).where(User.id.in_(member_ids)))
+    session.exec(delete(Team).where(Team.id == team.id))
+    session.commit()
+
+
+@pytest.fixture()
+def auth_headers(client, team_members):
+    """Log in as the team member with the given role and return auth headers."""
+
+    def _auth_headers(role):
+        response = client.post(
+            "/auth/token",
+            data={"username": f"test_{role.value}", "password": "password"},
+        )
+        assert response.status_code == 200, response.text
+        return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+    return _auth_headers
@@ -0,0 +1,85 @@
+import asyncio
+
+import pytest
+
+from app.admission import (
+    ConcurrencyLimiter,
+    RateLimiter,
+    admission_control,
+    parse_limits,
+    route_class,
+)
+from app.models.user import UserRole
+
+
+def test_route_classes_and_limits():
+    assert route_class("POST", "/auth/token") == "auth"
+    assert route_class("GET", "/analytics/team-summary") == "analytics"
+    assert route_class("GET", "/waste-logs/export") == "analytics"
+    assert route_class("PATCH", "/waste-logs/1") == "writes"
+    assert route_class("GET", "/teams/") == "reads"
+    assert route_class("GET", "/users/me") is None
+    assert route_class("GET", "/health") is None
+
+    assert parse_limits("analytics=4:16, writes=10:0") == {
+        "analytics": (4, 16),
+        "writes": (10, 0),
+    }
+    for spec in ("analytics=4", "other=1:1", "reads=0:1"):
+        with pytest.raises(ValueError):
+            parse_limits(spec)
+
+
+def test_concurrency_limiter_queues_and_sheds():
+    async def scenario():
+        limiter = ConcurrencyLimiter("test", 1, 1, queue_timeout_seconds=0.05)
+        assert await limiter.acquire() is None
+        waiting = asyncio.create_task(limiter.acquire())
+        await asyncio.sleep(0)
+        # the queue is full
+        assert await limiter.acquire() == "queue_full"
+        # the slot is handed over to the queued request
+        limiter.release()
+        assert await waiting is None
+        assert limiter.in_flight == 1
+        # nobody releases it in time
+        assert await limiter.acquire() == "queue_timeout"
+        limiter.release()
+        assert limiter.in_flight == 0
+        return limiter.stats()
+
+    stats = asyncio.run(scenario())
+    assert stats["admitted"] == 2
+    assert stats["queue_full"] == 1
+    assert stats["queue_timeouts"] == 1
+    assert stats["queued"] == 0
+
+
+def test_saturated_classes_shed_load(client, auth_headers, monkeypatch):
+    manager = auth_headers(UserRole.MANAGER)
+    limiter = admission_control.limiters["analytics"]
+    monkeypatch.setattr(limiter, "in_flight", limiter.max_concurrency)
+    monkeypatch.setattr(limiter, "max_queue", 0)
+
+    response = client.get("/analytics/team-summary", headers=manager)
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
+    # other classes and cheap endpoints are unaffected
+    assert client.get("/teams/", headers=manager).status_code == 200
+    assert client.get("/users/me", headers=manager).status_code == 200
+    assert client.get("/health").status_code == 200
+
+
+def test_users_are_rate_limited(client, auth_headers, monkeypatch):
+    monkeypatch.setattr(
+        admission_control, "rate_limiter", RateLimiter(1, 2, max_size=100)
+    )
+    manager = auth_headers(UserRole.MANAGER)
+    admin = auth_headers(UserRole.ADMIN)
+    for _ in range(2):
+        assert client.get("/teams/", headers=manager).status_code == 200
+    response = client.get("/teams/", headers=manager)
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "1"
+    # per user
+    assert client.get("/teams/", headers=admin).status_code == 200
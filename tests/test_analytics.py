@@ -0,0 +1,384 @@
+from app.models.user import UserRole
+
+
+def test_team_summary_is_a_single_query(client, auth_headers, query_budget):
+    employee = auth_headers(UserRole.EMPLOYEE)
+    manager = auth_headers(UserRole.MANAGER)
+
+    # a team without logs still gets a (zeroed) summary
+    response = client.get("/analytics/team-summary", headers=manager)
+    assert response.status_code == 200, response.text
+    assert response.json()["total_entries"] == 0
+    assert response.json()["recent_entries"] == []
+
+    for i in range(12):
+        client.post(
+            "/waste-logs/",
+            json={"waste_type": "metal", "weight_kg": i + 1},
+            headers=employee,
+        )
+
+    with query_budget(1) as requests:
+        response = client.get("/analytics/team-summary", headers=manager)
+    assert response.status_code == 200, response.text
+    assert response.headers["Server-Timing"].endswith('desc="1 query"')
+    assert [route for _, route, _ in requests] == ["/analytics/team-summary"]
+
+    summary = response.json()
+    assert summary["total_entries"] == 12
+    assert summary["total_waste_kg"] == 78
+    assert summary["waste_by_type"]["metal"] == 78
+    assert summary["waste_by_type"]["paper"] == 0
+    assert [e["weight_kg"] for e in summary["recent_entries"]] == list(range(12, 2, -1))
+
+
+def test_team_summary_unknown_team(client, auth_headers):
+    response = client.get(
+        "/analytics/team-summary",
+        params={"team_id": 999999},
+        headers=auth_headers(UserRole.ADMIN),
+    )
+    assert response.status_code == 400, response.text
+
+
+def test_daily_rollup_stays_exact(client, session, team_members, auth_headers):
+    from datetime import timedelta
+
+    from sqlmodel import func, select
+
+    from app.db.rollup import rebuild_rollup
+    from app.models.waste import WasteLog, WasteLogDailyRollup
+
+    team, _ = team_members
+    employee = auth_headers(UserRole.EMPLOYEE)
+    admin = auth_headers(UserRole.ADMIN)
+
+    def rollup():
+        session.expire_all()
+        return session.exec(
+            select(
+                WasteLogDailyRollup.day,
+                WasteLogDailyRollup.waste_type,
+                WasteLogDailyRollup.entry_count,
+                WasteLogDailyRollup.total_kg,
+            )
+            .where(WasteLogDailyRollup.team_id == team.id)
+            .order_by(WasteLogDailyRollup.day, WasteLogDailyRollup.waste_type)
+        ).all()
+
+    def recomputed():
+        day = func.date(func.timezone("UTC", WasteLog.created_at))
+        return session.exec(
+            select(day, WasteLog.waste_type, func.count(), func.sum(WasteLog.weight_kg))
+            .where(WasteLog.team_id == team.id)
+            .group_by(day, WasteLog.waste_type)
+            .order_by(day, WasteLog.waste_type)
+        ).all()
+
+    ids = []
+    for waste_type, weight_kg in [("paper", 1), ("paper", 2), ("glass", 4)]:
+        response = client.post(
+            "/waste-logs/",
+            json={"waste_type": waste_type, "weight_kg": weight_kg},
+            headers=employee,
+        )
+        ids.append(response.json()["id"])
+    assert rollup() == recomputed()
+
+    client.patch(f"/waste-logs/{ids[0]}", json={"waste_type": "metal"}, headers=admin)
+    client.patch(f"/waste-logs/{ids[1]}", json={"weight_kg": 5}, headers=admin)
+    client.delete(f"/waste-logs/{ids[2]}", headers=admin)
+    # moving a log to another day moves its totals too
+    log = session.get(WasteLog, ids[1])
+    log.created_at = log.created_at - timedelta(days=3)
+    session.add(log)
+    session.commit()
+    assert rollup() == recomputed()
+    assert len(rollup()) == 2
+
+    # a rebuild from scratch agrees with the incremental result
+    incremental = rollup()
+    rebuild_rollup(session.connection(), team.id)
+    session.commit()
+    assert rollup() == incremental
+
+
+def test_concurrent_multi_row_inserts_dont_deadlock_on_the_rollup(
+    session, team_members
+):
+    from concurrent.futures import ThreadPoolExecutor
+    from threading import Barrier
+
+    from sqlalchemy import text
+    from sqlmodel import func, select
+
+    from app.db.session import engine
+    from app.models.waste import WasteLogDailyRollup, WasteType
+
+    team, members = team_members
+    barrier = Barrier(2)
+
+    def insert_days(work_mem):
+        """One statement, a log of every type for each of 1000 days."""
+        with engine.begin() as connection:
+            connection.execute(text(f"SET LOCAL work_mem = '{work_mem}'"))
+            barrier.wait()
+            connection.execute(
+                text(
+                    """
+                    INSERT INTO wastelog
+                        (waste_type, weight_kg, team_id, created_by_id,
+                         created_at, updated_at)
+                    SELECT waste_type, 1, :team_id, :user_id,
+                           now() - day * interval '1 day', now()
+                    FROM generate_series(1, 1000) AS day,
+                         unnest(enum_range(NULL::wastetype)) AS waste_type
+                    """
+                ),
+                {
+                    "team_id": team.id,
+                    "user_id": members[UserRole.EMPLOYEE].id,
+                },
+            )
+
+    # the same (team, day, type) rollup rows, aggregated with different plans
+    # (one spills to disk), which return them in different orders
+    with ThreadPoolExecutor(2) as executor:
+        for _ in range(5):
+            futures = [
+                executor.submit(insert_days, "64kB"),
+                executor.submit(insert_days, "4MB"),
+            ]
+            for future in futures:
+                future.result()
+
+    total = session.exec(
+        select(func.sum(WasteLogDailyRollup.entry_count)).where(
+            WasteLogDailyRollup.team_id == team.id
+        )
+    ).one()
+    assert total == 5 * 2000 * len(WasteType)
+
+
+def test_timeseries_buckets_in_local_time(client, session, team_members, auth_headers):
+    from datetime import datetime, timezone
+
+    from app.models.waste import WasteLog, WasteType
+
+    team, members = team_members
+    employee = members[UserRole.EMPLOYEE]
+    manager = auth_headers(UserRole.MANAGER)
+
+    # 2026-01-01 00:00 in Sydney (UTC+11) is 2025-12-31 13:00 UTC
+    for created_at, waste_type, weight_kg in [
+        (datetime(2025, 12, 31, 13, 30, tzinfo=timezone.utc), WasteType.PAPER, 1),
+        (datetime(2025, 12, 31, 13, 45, tzinfo=timezone.utc), WasteType.GLASS, 2),
+        (datetime(2025, 12, 31, 16, 0, tzinfo=timezone.utc), WasteType.PAPER, 4),
+        # outside the range
+        (datetime(2025, 12, 31, 12, 59, tzinfo=timezone.utc), WasteType.PAPER, 8),
+    ]:
+        session.add(
+            WasteLog(
+                waste_type=waste_type,
+                weight_kg=weight_kg,
+                team_id=team.id,
+                created_by_id=employee.id,
+                created_at=created_at,
+                updated_at=created_at,
+            )
+        )
+    session.commit()
+
+    response = client.get(
+        "/analytics/timeseries",
+        params={
+            "start": "2026-01-01T00:00:00",
+            "end": "2026-01-01T06:00:00",
+            "bucket": "hour",
+            "tz": "Australia/Sydney",
+            "by_type": True,
+        },
+        headers=manager,
+    )
+    assert response.status_code == 200, response.text
+    points = response.json()["points"]
+    # gaps are filled with zeros
+    assert [p["bucket_start"] for p in points] == [
+        f"2026-01-01T0{hour}:00:00+11:00" for hour in range(6)
+    ]
+    assert [p["entries"] for p in points] == [2, 0, 0, 1, 0, 0]
+    assert [p["total_waste_kg"] for p in points] == [3, 0, 0, 4, 0, 0]
+    assert points[0]["waste_by_type"]["paper"] == 1
+    assert points[0]["waste_by_type"]["glass"] == 2
+
+    # the same data in UTC days, once served from the daily rollup ("UTC")
+    # and once from the logs themselves ("Etc/UTC")
+    def daily(tz):
+        response = client.get(
+            "/analytics/timeseries",
+            params={
+                "start": "2025-12-30T00:00:00Z",
+                "end": "2026-01-02T00:00:00Z",
+                "tz": tz,
+                "by_type": True,
+            },
+            headers=manager,
+        )
+        assert response.status_code == 200, response.text
+        return [
+            (p["entries"], p["total_waste_kg"], p["waste_by_type"])
+            for p in response.json()["points"]
+        ]
+
+    assert daily("UTC") == daily("Etc/UTC")
+    assert [point[:2] for point in daily("UTC")] == [(0, 0), (4, 15), (0, 0)]
+
+
+def test_hourly_timeseries_across_dst_changes(
+    client, session, team_members, auth_headers
+):
+    from datetime import datetime, timedelta, timezone
+
+    from app.models.waste import WasteLog, WasteType
+
+    team, members = team_members
+    employee = members[UserRole.EMPLOYEE]
+    manager = auth_headers(UserRole.MANAGER)
+
+    # Amsterdam skips 02:00-03:00 on 2026-03-29 (01:00 UTC) and repeats
+    # 02:00-03:00 on 2026-10-25 (00:00 and 01:00 UTC): a log every UTC hour
+    for day in (datetime(2026, 3, 28, 23), datetime(2026, 10, 24, 23)):
+        for hour in range(4):
+            session.add(
+                WasteLog(
+                    waste_type=WasteType.PAPER,
+                    weight_kg=hour + 1,
+                    team_id=team.id,
+                    created_by_id=employee.id,
+                    created_at=(day + timedelta(hours=hour, minutes=30)).replace(
+                        tzinfo=timezone.utc
+                    ),
+                )
+            )
+    session.commit()
+
+    def hourly(start, end):
+        response = client.get(
+            "/analytics/timeseries",
+            params={
+                "start": start,
+                "end": end,
+                "bucket": "hour",
+                "tz": "Europe/Amsterdam",
+            },
+            headers=manager,
+        )
+        assert response.status_code == 200, response.text
+        return [
+            (p["bucket_start"], p["total_waste_kg"]) for p in response.json()["points"]
+        ]
+
+    assert hourly("2026-03-29T00:00:00", "2026-03-29T04:00:00") == [
+        ("2026-03-29T00:00:00+01:00", 1),
+        ("2026-03-29T01:00:00+01:00", 2),
+        ("2026-03-29T03:00:00+02:00", 3),
+    ]
+    assert hourly("2026-10-25T01:00:00", "2026-10-25T04:00:00") == [
+        ("2026-10-25T01:00:00+02:00", 1),
+        ("2026-10-25T02:00:00+02:00", 2),
+        ("2026-10-25T02:00:00+01:00", 3),
+        ("2026-10-25T03:00:00+01:00", 4),
+    ]
+
+
+def test_timeseries_validation(client, auth_headers):
+    manager = auth_headers(UserRole.MANAGER)
+
+    def get(**params):
+        params = {"start": "2026-01-01", "end": "2026-02-01", **params}
+        return client.get("/analytics/timeseries", params=params, headers=manager)
+
+    assert get().status_code == 200
+    assert len(get(bucket="week").json()["points"]) == 5
+    assert get(tz="Not/AZone").status_code == 400
+    assert get(start="2026-03-01").status_code == 400
+    assert get(bucket="hour", end="2027-01-01").status_code == 400
+    # managers can't look at other teams
+    assert get(team_id=999999).status_code == 400
+
+
+def test_leaderboard_ranks_every_team_in_one_query(
+    client, session, team_members, auth_headers, query_budget
+):
+    from datetime import datetime, timezone
+
+    from sqlmodel import delete
+
+    from app.models.team import Team
+    from app.models.waste import WasteLog, WasteType
+
+    team, members = team_members
+    employee = members[UserRole.EMPLOYEE]
+    admin = auth_headers(UserRole.ADMIN)
+    # a team without members or logs
+    empty_team = Team(name="Empty Team")
+    session.add(empty_team)
+    session.commit()
+
+    def log(waste_type, weight_kg, day):
+        return WasteLog(
+            waste_type=waste_type,
+            weight_kg=weight_kg,
+            team_id=team.id,
+            created_by_id=employee.id,
+            created_at=datetime(2026, 5, day, 12, tzinfo=timezone.utc),
+        )
+
+    session.add_all(
+        [
+            log(WasteType.PAPER, 3, 1),
+            log(WasteType.GLASS, 5, 2),
+            log(WasteType.PAPER, 100, 20),
+        ]
+    )
+    session.commit()
+
+    def leaderboard(**params):
+        response = client.get("/analytics/leaderboard", params=params, headers=admin)
+        assert response.status_code == 200, response.text
+        return {entry["team_id"]: entry for entry in response.json()["teams"]}
+
+    try:
+        leaderboard()
+        with query_budget(1):
+            teams = leaderboard(start="2026-05-01", end="2026-05-10")
+        ours, empty = teams[team.id], teams[empty_team.id]
+        assert ours["total_entries"] == 2
+        assert ours["total_waste_kg"] == 8
+        assert ours["waste_by_type"]["paper"] == 3
+        assert ours["waste_by_type"]["glass"] == 5
+        # the manager and the employee
+        assert ours["members"] == 2
+        assert ours["waste_kg_per_member"] == 4
+        assert ours["rank"] == 1 and ours["percentile"] == 1
+        assert empty["total_waste_kg"] == 0 and empty["members"] == 0
+        assert empty["waste_kg_per_member"] is None
+        assert empty["rank"] > 1
+
+        teams = leaderboard(rank_by="waste_kg_per_member")
+        assert teams[team.id]["total_waste_kg"] == 108
+        assert teams[team.id]["rank"] == 1
+        assert teams[empty_team.id]["percentile"] == 0
+
+        response = client.get(
+            "/analytics/leaderboard",
+            params={"start": "2026-05-10", "end": "2026-05-01"},
+            headers=admin,
+        )
+        assert response.status_code == 400
+        manager = auth_headers(UserRole.MANAGER)
+        response = client.get("/analytics/leaderboard", headers=manager)
+        assert response.status_code == 400
+    finally:
+        session.exec(delete(Team).where(Team.id == empty_team.id))
+        session.commit()
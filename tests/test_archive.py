@@ -0,0 +1,193 @@
+from datetime import datetime, timedelta, timezone
+
+import pyarrow.parquet as pq
+from sqlmodel import delete, func, select
+
+from app.config import settings
+from app.db.archive import archive_logs, rebuild_archive_rollup
+from app.models.user import UserRole
+from app.models.waste import WasteLog, WasteLogArchive, WasteLogArchiveRollup, WasteType
+
+
+def test_old_logs_are_archived_and_still_counted(
+    client, session, team_members, auth_headers, tmp_path, monkeypatch
+):
+    team, members = team_members
+    employee = members[UserRole.EMPLOYEE]
+    manager = auth_headers(UserRole.MANAGER)
+    admin = auth_headers(UserRole.ADMIN)
+    first = datetime(2024, 1, 30, 22, tzinfo=timezone.utc)
+    session.add_all(
+        WasteLog(
+            waste_type=waste_type,
+            weight_kg=i + 1,
+            description="old",
+            team_id=team.id,
+            created_by_id=employee.id,
+            created_at=first + timedelta(hours=12 * i),
+            updated_at=first,
+        )
+        for i, waste_type in enumerate([WasteType.PAPER, WasteType.GLASS] * 4)
+    )
+    session.commit()
+
+    def timeseries(**params):
+        response = client.get(
+            "/analytics/timeseries",
+            params={"start": "2024-01-29", "end": "2024-02-05", **params},
+            headers=manager,
+        )
+        assert response.status_code == 200, response.text
+        return response.json()["points"]
+
+    queries = [
+        {"by_type": True},
+        {"bucket": "hour"},
+        {"bucket": "week", "tz": "Europe/Amsterdam"},
+        {"start": "2024-01-31T12:00:00Z", "bucket": "month", "by_type": True},
+    ]
+    expected = [timeseries(**params) for params in queries]
+
+    def summary_totals():
+        response = client.get("/analytics/team-summary", headers=manager)
+        assert response.status_code == 200, response.text
+        summary = response.json()
+        return (
+            summary["total_entries"],
+            summary["total_waste_kg"],
+            summary["waste_by_type"],
+        )
+
+    assert summary_totals() == (
+        8,
+        36,
+        {**{waste_type.value: 0 for waste_type in WasteType}, "paper": 16, "glass": 20},
+    )
+    expected_totals = summary_totals()
+
+    def leaderboard_totals(**params):
+        response = client.get("/analytics/leaderboard", params=params, headers=admin)
+        assert response.status_code == 200, response.text
+        (entry,) = [
+            row for row in response.json()["teams"] if row["team_id"] == team.id
+        ]
+        return entry["total_entries"], entry["total_waste_kg"], entry["waste_by_type"]
+
+    ranges = [{}, {"start": "2024-01-31", "end": "2024-02-02"}]
+    expected_leaderboards = [leaderboard_totals(**params) for params in ranges]
+    assert expected_leaderboards[1][0] == 4
+
+    def team_logs(**params):
+        """Every page of the team's logs, following the cursors."""
+        logs = []
+        while True:
+            response = client.get(
+                "/analytics/team-logs", params=params, headers=manager
+            )
+            assert response.status_code == 200, response.text
+            logs.extend(response.json())
+            if "X-Next-Cursor" not in response.headers:
+                return logs
+            params = {**params, "cursor": response.headers["X-Next-Cursor"]}
+
+    def skip_pages(limit):
+        pages = []
+        for skip in range(0, 10, limit):
+            response = client.get(
+                "/analytics/team-logs",
+                params={"limit": limit, "skip": skip},
+                headers=manager,
+            )
+            assert response.status_code == 200, response.text
+            pages.append(response.json())
+        return pages
+
+    def export(**params):
+        response = client.get(
+            "/analytics/team-logs/export", params=params, headers=manager
+        )
+        assert response.status_code == 200, response.text
+        return response.text
+
+    expected_logs = team_logs()
+    assert len(expected_logs) == 8
+    assert team_logs(limit=3) == expected_logs
+    expected_skip_pages = skip_pages(3)
+    exports = [
+        {},
+        {"format": "csv"},
+        {"start": "2024-01-31T12:00:00Z", "end": "2024-02-03T12:00:00Z"},
+    ]
+    expected_exports = [export(**params) for params in exports]
+    assert len(expected_exports[0].splitlines()) == 8
+
+    monkeypatch.setattr(settings, "ARCHIVE_DIR", str(tmp_path))
+    try:
+        archived = archive_logs(
+            datetime(2024, 2, 2, 12, tzinfo=timezone.utc),
+            batch_size=2,
+            directory=str(tmp_path),
+        )
+        assert archived == {team.id: 6}
+        remaining = session.exec(
+            select(func.count()).where(WasteLog.team_id == team.id)
+        ).one()
+        assert remaining == 2
+
+        files = session.exec(
+            select(WasteLogArchive)
+            .where(WasteLogArchive.team_id == team.id)
+            .order_by(WasteLogArchive.first_created_at)
+        ).all()
+        # batches of two logs, split by month
+        assert [(str(file.month), file.entry_count) for file in files] == [
+            ("2024-01-01", 2),
+            ("2024-01-01", 1),
+            ("2024-02-01", 1),
+            ("2024-02-01", 2),
+        ]
+        table = pq.read_table(tmp_path / files[0].path)
+        assert table.column("description").to_pylist() == ["old", "old"]
+        assert table.column("waste_type").to_pylist() == ["paper", "glass"]
+
+        assert [timeseries(**params) for params in queries] == expected
+        assert summary_totals() == expected_totals
+        assert [
+            leaderboard_totals(**params) for params in ranges
+        ] == expected_leaderboards
+
+        # logs are listed and exported as before, archived ones included
+        assert team_logs() == expected_logs
+        assert team_logs(limit=3) == expected_logs
+        assert team_logs(limit=1) == expected_logs
+        assert skip_pages(3) == expected_skip_pages
+        assert [export(**params) for params in exports] == expected_exports
+
+        # the archived logs' totals, per UTC day and type, can be recomputed
+        # from the files
+        def archive_rollup():
+            return session.exec(
+                select(WasteLogArchiveRollup)
+                .where(WasteLogArchiveRollup.team_id == team.id)
+                .order_by(WasteLogArchiveRollup.day, WasteLogArchiveRollup.waste_type)
+            ).all()
+
+        archived_totals = [
+            (str(row.day), row.waste_type, row.entry_count, row.total_kg)
+            for row in archive_rollup()
+        ]
+        assert sum(count for *_, count, _ in archived_totals) == 6
+        assert rebuild_archive_rollup(session, str(tmp_path)) == len(archived_totals)
+        session.commit()
+        assert [
+            (str(row.day), row.waste_type, row.entry_count, row.total_kg)
+            for row in archive_rollup()
+        ] == archived_totals
+    finally:
+        session.exec(
+            delete(WasteLogArchiveRollup).where(
+                WasteLogArchiveRollup.team_id == team.id
+            )
+        )
+        session.exec(delete(WasteLogArchive).where(WasteLogArchive.team_id == team.id))
+        session.commit()
@@ -0,0 +1,126 @@
+from app.hashing import hash_rounds, password_hasher
+from app.models.user import UserRole
+
+
+def login(client, username):
+    return client.post(
+        "/auth/token", data={"username": username, "password": "password"}
+    )
+
+
+def test_login_upgrades_hash_when_cost_changes(
+    client, session, team_members, monkeypatch
+):
+    _, members = team_members
+    employee = members[UserRole.EMPLOYEE]
+    assert hash_rounds(employee.hashed_password) == password_hasher.rounds
+
+    rehashed = password_hasher.stats()["rehashed"]
+    monkeypatch.setattr(password_hasher, "rounds", 4)
+    response = login(client, employee.username)
+    assert response.status_code == 200, response.text
+
+    session.refresh(employee)
+    assert hash_rounds(employee.hashed_password) == 4
+    assert password_hasher.stats()["rehashed"] == rehashed + 1
+
+    # the upgraded hash still verifies and isn't rewritten again
+    response = login(client, employee.username)
+    assert response.status_code == 200, response.text
+    assert password_hasher.stats()["rehashed"] == rehashed + 1
+
+
+def test_wrong_password_is_rejected(client, team_members):
+    response = client.post(
+        "/auth/token", data={"username": "test_employee", "password": "nope"}
+    )
+    assert response.status_code == 400, response.text
+
+
+def test_stats_include_password_hashing(client, auth_headers):
+    response = client.get("/internal/stats", headers=auth_headers(UserRole.ADMIN))
+    assert response.status_code == 200, response.text
+    stats = response.json()["password_hashing"]
+    assert stats["completed"] >= 1
+    assert stats["queued"] == 0
+
+
+def test_login_does_not_write_user_row(client, session, team_members):
+    _, members = team_members
+    employee = members[UserRole.EMPLOYEE]
+    updated_at = employee.updated_at
+
+    first = login(client, employee.username).json()["access_token"]
+    second = login(client, employee.username).json()["access_token"]
+    assert first != second
+
+    session.refresh(employee)
+    assert employee.updated_at == updated_at
+    # logging in again doesn't revoke the earlier token
+    for token in (first, second):
+        response = client.get("/users/me", headers={"Authorization": f"Bearer {token}"})
+        assert response.status_code == 200, response.text
+
+
+def test_principal_cache_hits_and_invalidation(client, team_members, auth_headers):
+    from app.principal_cache import principal_cache
+
+    _, members = team_members
+    employee = members[UserRole.EMPLOYEE]
+    headers = auth_headers(UserRole.EMPLOYEE)
+    admin = auth_headers(UserRole.ADMIN)
+
+    client.get("/users/me", headers=headers)
+    stats = principal_cache.stats()
+    response = client.get("/users/me", headers=headers)
+    assert response.status_code == 200, response.text
+    # the token isn't decoded again, and its user isn't reloaded
+    assert principal_cache.stats()["claims"]["hits"] == stats["claims"]["hits"] + 1
+    assert principal_cache.stats()["users"]["hits"] == stats["users"]["hits"] + 1
+
+    # changing a claim revokes the token on the very next request
+    response = client.patch(
+        f"/users/{employee.id}", json={"role": "manager"}, headers=admin
+    )
+    assert response.status_code == 200, response.text
+    assert client.get("/users/me", headers=headers).status_code == 400
+
+    # ...while a fresh token carries the new role
+    headers = auth_headers(UserRole.EMPLOYEE)
+    assert client.get("/users/me", headers=headers).json()["role"] == "manager"
+
+    response = client.post(f"/users/{employee.id}/invalidate-token", headers=admin)
+    assert response.status_code == 200, response.text
+    response = client.get("/users/me", headers=headers)
+    assert response.status_code == 400, response.text
+
+
+def test_principal_cache_listens_for_other_workers(client, session, auth_headers):
+    import time
+
+    from sqlalchemy import text
+
+    from app.db.notifications import listener
+    from app.principal_cache import PRINCIPAL_CHANNEL, principal_cache
+
+    # connecting clears the cache, so wait for that before filling it
+    deadline = time.monotonic() + 5
+    while not listener.is_connected and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert listener.is_connected
+
+    headers = auth_headers(UserRole.EMPLOYEE)
+    user_id = client.get("/users/me", headers=headers).json()["id"]
+    assert principal_cache.get_user(user_id) is not None
+
+    # what another worker's update_user would send
+    session.exec(
+        text("SELECT pg_notify(:channel, :payload)"),
+        params={"channel": PRINCIPAL_CHANNEL, "payload": str(user_id)},
+    )
+    session.commit()
+
+    deadline = time.monotonic() + 5
+    while principal_cache.get_user(user_id) is not None and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert principal_cache.get_user(user_id) is None
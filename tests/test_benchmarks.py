@@ -0,0 +1,19 @@
+from benchmarks.hot_paths import compare
+
+
+def report(rps, p95, p99):
+    return {
+        "meta": {"scale": "10k"},
+        "endpoints": {"GET /x": {"rps": rps, "p95_ms": p95, "p99_ms": p99}},
+    }
+
+
+def test_compare_flags_regressions_beyond_the_threshold():
+    baseline = report(rps=100, p95=10, p99=20)
+    assert compare(baseline, report(rps=95, p95=10.5, p99=21), 0.10) == []
+
+    regressions = compare(baseline, report(rps=80, p95=9, p99=30), 0.10)
+    assert [(name, metric) for name, metric, *_ in regressions] == [
+        ("GET /x", "rps"),
+        ("GET /x", "p99_ms"),
+    ]
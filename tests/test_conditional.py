@@ -0,0 +1,128 @@
+from app.models.user import UserRole
+
+
+def test_single_resources_are_validated_by_updated_at(
+    client, team_members, auth_headers
+):
+    team, members = team_members
+    admin = auth_headers(UserRole.ADMIN)
+    log = client.post(
+        "/waste-logs/",
+        json={"waste_type": "paper", "weight_kg": 3},
+        headers=auth_headers(UserRole.EMPLOYEE),
+    ).json()
+
+    for path in (
+        f"/waste-logs/{log['id']}",
+        f"/teams/{team.id}",
+        f"/users/{members[UserRole.EMPLOYEE].id}",
+    ):
+        response = client.get(path, headers=admin)
+        assert response.status_code == 200
+        etag, last_modified = (
+            response.headers["ETag"],
+            response.headers["Last-Modified"],
+        )
+        assert response.headers["Vary"] == "Authorization"
+
+        response = client.get(path, headers={**admin, "If-None-Match": etag})
+        assert response.status_code == 304
+        assert response.content == b""
+        assert response.headers["ETag"] == etag
+        response = client.get(
+            path, headers={**admin, "If-None-Match": f'"x", W/{etag}'}
+        )
+        assert response.status_code == 304
+        response = client.get(
+            path, headers={**admin, "If-Modified-Since": last_modified}
+        )
+        assert response.status_code == 304
+
+    # an update changes the ETag
+    path = f"/waste-logs/{log['id']}"
+    etag = client.get(path, headers=admin).headers["ETag"]
+    client.patch(path, json={"description": "wet"}, headers=admin)
+    response = client.get(path, headers={**admin, "If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.json()["description"] == "wet"
+    assert response.headers["ETag"] != etag
+
+
+def test_analytics_are_validated_by_the_team_data_version(
+    client, team_members, auth_headers, query_budget
+):
+    employee = auth_headers(UserRole.EMPLOYEE)
+    manager = auth_headers(UserRole.MANAGER)
+    admin = auth_headers(UserRole.ADMIN)
+    path = "/analytics/team-summary"
+
+    def current_etag():
+        etag = client.get(path, headers=manager).headers["ETag"]
+        # a revalidation costs just the version lookup
+        with query_budget(1):
+            response = client.get(path, headers={**manager, "If-None-Match": etag})
+        assert response.status_code == 304
+        return etag
+
+    etags = [current_etag()]
+    log = client.post(
+        "/waste-logs/", json={"waste_type": "glass", "weight_kg": 2}, headers=employee
+    ).json()
+    etags.append(current_etag())
+    log_path = f"/waste-logs/{log['id']}"
+    client.patch(log_path, json={"weight_kg": 4}, headers=admin)
+    etags.append(current_etag())
+    items = [{"waste_type": "paper", "weight_kg": 1}]
+    client.post("/waste-logs/bulk", json={"items": items}, headers=employee)
+    etags.append(current_etag())
+    client.delete(log_path, headers=admin)
+    etags.append(current_etag())
+    assert len(set(etags)) == len(etags)
+
+    # the other analytics share the version
+    for other in (
+        "/analytics/team-logs",
+        "/analytics/timeseries?start=2026-01-01T00:00:00Z&end=2026-01-08T00:00:00Z",
+    ):
+        response = client.get(other, headers={**manager, "If-None-Match": etags[-1]})
+        assert response.status_code == 304
+
+
+def test_data_versions_add_up_across_connections(
+    client, session, team_members, auth_headers
+):
+    from sqlmodel import text
+
+    team, _ = team_members
+    employee = auth_headers(UserRole.EMPLOYEE)
+    admin = auth_headers(UserRole.ADMIN)
+
+    def version():
+        return session.exec(
+            text("SELECT sum(version) FROM team_data_version WHERE team_id = :id"),
+            params={"id": team.id},
+        ).one()[0]
+
+    # writes on the API's connections and on this one
+    log = client.post(
+        "/waste-logs/", json={"waste_type": "glass", "weight_kg": 2}, headers=employee
+    ).json()
+    session.exec(
+        text("UPDATE wastelog SET description = 'wet' WHERE id = :id"),
+        params={"id": log["id"]},
+    )
+    session.commit()
+    client.delete(f"/waste-logs/{log['id']}", headers=admin)
+    assert version() == 3
+
+    # the shards go with the team
+    other = client.post("/teams/", json={"name": "Other"}, headers=admin).json()
+    log = client.post(
+        "/waste-logs/",
+        params={"team_id": other["id"]},
+        json={"waste_type": "paper", "weight_kg": 1},
+        headers=admin,
+    ).json()
+    client.delete(f"/waste-logs/{log['id']}", headers=admin)
+    response = client.delete(f"/teams/{other['id']}", headers=admin)
+    assert response.status_code == 204, response.text
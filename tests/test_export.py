@@ -0,0 +1,93 @@
+import asyncio
+import csv
+import io
+import json
+import zlib
+
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import NullPool
+from sqlmodel import select
+
+from app.config import settings
+from app.export import EXPORT_COLUMNS, ExportFormat, _stream
+from app.models.user import UserRole
+from app.models.waste import WasteLog
+
+
+def test_export_streams_every_row(client, team_members, auth_headers):
+    team, _ = team_members
+    employee = auth_headers(UserRole.EMPLOYEE)
+    manager = auth_headers(UserRole.MANAGER)
+    admin = auth_headers(UserRole.ADMIN)
+    # more rows than one batch of the server-side cursor
+    items = [{"waste_type": "glass", "weight_kg": i} for i in range(2500)]
+    response = client.post("/waste-logs/bulk", json={"items": items}, headers=employee)
+    created_ids = response.json()["created_ids"]
+
+    response = client.get(
+        "/analytics/team-logs/export",
+        headers={**manager, "Accept-Encoding": "identity"},
+    )
+    assert response.status_code == 200, response.text
+    assert response.headers["content-type"] == "application/x-ndjson"
+    assert "content-encoding" not in response.headers
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert [row["id"] for row in rows] == created_ids
+    assert rows[0]["waste_type"] == "glass"
+    assert rows[0]["team_id"] == team.id
+
+    # gzipped when asked for (the client decompresses it transparently)
+    response = client.get(
+        "/analytics/team-logs/export",
+        params={"format": "csv"},
+        headers={**manager, "Accept-Encoding": "gzip"},
+    )
+    assert response.status_code == 200, response.text
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["content-type"].startswith("text/csv")
+    rows = list(csv.DictReader(io.StringIO(response.text)))
+    assert len(rows) == 2500
+    assert rows[-1]["weight_kg"] == "2499.0"
+
+    response = client.get(
+        "/waste-logs/export", params={"end": "2000-01-01T00:00:00"}, headers=admin
+    )
+    assert response.status_code == 200, response.text
+    assert response.text == ""
+    response = client.get("/waste-logs/export", headers=admin)
+    assert len(response.text.splitlines()) == 2500
+
+    # the usual permission rules apply
+    assert client.get("/waste-logs/export", headers=manager).status_code == 400
+    response = client.get(
+        "/analytics/team-logs/export", params={"team_id": team.id + 1}, headers=manager
+    )
+    assert response.status_code == 400
+
+
+def test_gzipped_batches_are_flushed(client, team_members, auth_headers, monkeypatch):
+    team, _ = team_members
+    employee = auth_headers(UserRole.EMPLOYEE)
+    items = [{"waste_type": "paper", "weight_kg": i} for i in range(3)]
+    client.post("/waste-logs/bulk", json={"items": items}, headers=employee)
+    monkeypatch.setattr(settings, "EXPORT_BATCH_SIZE", 1)
+    query = (
+        select(*EXPORT_COLUMNS).where(WasteLog.team_id == team.id).order_by(WasteLog.id)
+    )
+
+    async def chunks():
+        engine = create_async_engine(settings.ASYNC_DATABASE_URL, poolclass=NullPool)
+        try:
+            return [
+                chunk
+                async for chunk in _stream(engine, query, ExportFormat.NDJSON, True)
+            ]
+        finally:
+            await engine.dispose()
+
+    *batches, trailer = asyncio.run(chunks())
+    # every batch decompresses on its own, without waiting for the next
+    decompressor = zlib.decompressobj(wbits=zlib.MAX_WBITS | 16)
+    lines = [decompressor.decompress(batch).decode() for batch in batches]
+    assert [json.loads(line)["weight_kg"] for line in lines] == [0, 1, 2]
+    assert decompressor.decompress(trailer) == b""
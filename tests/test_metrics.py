@@ -0,0 +1,86 @@
+import json
+import os
+import re
+import subprocess
+import sys
+
+from app.metrics import Counter, Gauge, Histogram, Registry
+from app.models.user import UserRole
+
+
+def sample(text, name, **labels):
+    """The value of one sample in Prometheus' text format, or None."""
+    for line in text.splitlines():
+        match = re.match(r"^([a-z_]+)(?:\{(.*)\})? (\S+)$", line)
+        if not match or match[1] != name:
+            continue
+        found = dict(re.findall(r'(\w+)="((?:[^"\\]|\\.)*)"', match[2] or ""))
+        if found == {key: str(value) for key, value in labels.items()}:
+            return float(match[3])
+    return None
+
+
+def test_metrics_endpoint(client, team_members, auth_headers):
+    headers = auth_headers(UserRole.EMPLOYEE)
+    # metrics add up over the test session, so look at the increase
+    before = client.get("/metrics").text
+    response = client.post(
+        "/waste-logs/", json={"waste_type": "glass", "weight_kg": 2}, headers=headers
+    )
+    log_id = response.json()["id"]
+    for _ in range(3):
+        assert client.get(f"/waste-logs/{log_id}", headers=headers).status_code == 200
+    # handled by the BaseAppException handler
+    assert client.get("/waste-logs/", headers=headers).status_code == 400
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    text = response.text
+
+    def increase(name, **labels):
+        return sample(text, name, **labels) - (sample(before, name, **labels) or 0)
+
+    route = {"method": "GET", "route": "/waste-logs/{log_id}", "status": 200}
+    assert increase("http_requests_total", **route) == 3
+    assert increase("http_request_duration_seconds_count", **route) == 3
+    assert increase("http_request_duration_seconds_bucket", **route, le="+Inf") == 3
+    # the scrape itself is in flight
+    assert sample(text, "http_requests_in_flight") == 1
+    inserts = increase(
+        "db_query_duration_seconds_count", engine="primary", operation="INSERT"
+    )
+    assert inserts >= 1
+    hashing = "password_hashing_duration_seconds_count"
+    assert sample(text, hashing, operation="check_password") >= 1
+    handler = "base_exception_handler"
+    assert increase("exception_handler_calls_total", handler=handler) == 1
+    pool = {"engine": "primary", "state": "checked_out"}
+    assert sample(text, "db_pool_connections", **pool) == 0
+
+
+def test_snapshots_of_all_workers_are_added_up(tmp_path):
+    registry = Registry()
+    requests = Counter("requests_total", "Requests.", ("route",), registry=registry)
+    in_flight = Gauge("in_flight", "In flight.", registry=registry)
+    latency = Histogram(
+        "latency_seconds", "Latency.", buckets=(0.1, 1), registry=registry
+    )
+    requests.labels("/a").inc(2)
+    in_flight.set(4)
+    latency.observe(0.5)
+
+    # a worker that has exited: its counters still count, its gauges don't
+    exited = subprocess.Popen([sys.executable, "-c", "pass"])
+    exited.wait()
+    snapshot = {"pid": exited.pid, "metrics": registry.snapshot()}
+    (tmp_path / f"metrics-{exited.pid}.json").write_text(json.dumps(snapshot))
+
+    text = registry.render(str(tmp_path))
+    assert sample(text, "requests_total", route="/a") == 4
+    assert sample(text, "in_flight") == 4
+    assert sample(text, "latency_seconds_bucket", le="0.1") == 0
+    assert sample(text, "latency_seconds_bucket", le="1") == 2
+    assert sample(text, "latency_seconds_sum") == 1.0
+    assert sample(text, "latency_seconds_count") == 2
+    assert (tmp_path / f"metrics-{os.getpid()}.json").exists()
@@ -0,0 +1,99 @@
+from datetime import datetime, timedelta, timezone
+
+from app.models.user import UserRole
+
+
+def add_logs(session, team, members, created_at):
+    from app.models.waste import WasteLog, WasteType
+
+    logs = [
+        WasteLog(
+            waste_type=WasteType.PAPER,
+            weight_kg=1,
+            team_id=team.id,
+            created_by_id=members[UserRole.EMPLOYEE].id,
+            created_at=at,
+            updated_at=at,
+        )
+        for at in created_at
+    ]
+    session.add_all(logs)
+    session.commit()
+    return [log.id for log in logs]
+
+
+def test_cursor_pages_cover_every_row_once(client, session, team_members, auth_headers):
+    team, members = team_members
+    admin = auth_headers(UserRole.ADMIN)
+    now = datetime.now(timezone.utc)
+    # three logs share a timestamp, so the id has to break the tie
+    ids = add_logs(
+        session,
+        team,
+        members,
+        [now - timedelta(minutes=i) for i in range(4)] + [now] * 3,
+    )
+
+    seen = []
+    url, params = "/waste-logs/", {"limit": 3}
+    while True:
+        response = client.get(url, params=params, headers=admin)
+        assert response.status_code == 200, response.text
+        assert len(response.json()) <= 3
+        seen += response.json()
+        cursor = response.headers.get("X-Next-Cursor")
+        if cursor is None:
+            break
+        assert 'rel="next"' in response.headers["Link"]
+        params = {"limit": 3, "cursor": cursor}
+
+    assert sorted(log["id"] for log in seen) == sorted(ids)
+    # newest first, ties broken by id
+    keys = [(log["created_at"], log["id"]) for log in seen]
+    assert keys == sorted(keys, reverse=True)
+
+    # the team listing pages the same way
+    manager = auth_headers(UserRole.MANAGER)
+    response = client.get("/analytics/team-logs", params={"limit": 4}, headers=manager)
+    assert [log["id"] for log in response.json()] == [log["id"] for log in seen[:4]]
+    response = client.get(
+        "/analytics/team-logs",
+        params={"limit": 4, "cursor": response.headers["X-Next-Cursor"]},
+        headers=manager,
+    )
+    assert [log["id"] for log in response.json()] == [log["id"] for log in seen[4:]]
+    assert "X-Next-Cursor" not in response.headers
+
+
+def test_page_size_and_cursor_validation(client, team_members, auth_headers):
+    from app.config import settings
+
+    admin = auth_headers(UserRole.ADMIN)
+
+    response = client.get(
+        "/users/", params={"limit": settings.MAX_PAGE_SIZE + 1}, headers=admin
+    )
+    assert response.status_code == 422
+    response = client.get("/users/", params={"cursor": "not-a-cursor"}, headers=admin)
+    assert response.status_code == 400
+    response = client.get(
+        "/users/", params={"cursor": "WzFd", "skip": 1}, headers=admin
+    )
+    assert response.status_code == 400
+
+    # users are paged by id
+    response = client.get("/users/", params={"limit": 2}, headers=admin)
+    first_page = response.json()
+    response = client.get(
+        "/users/",
+        params={"limit": 2, "cursor": response.headers["X-Next-Cursor"]},
+        headers=admin,
+    )
+    ids = [user["id"] for user in first_page + response.json()]
+    assert ids == sorted(ids) and len(ids) == 3
+
+    # offset paging still works, but is flagged as deprecated
+    response = client.get("/users/", params={"skip": 1, "limit": 1}, headers=admin)
+    assert response.status_code == 200
+    assert response.headers["Deprecation"] == "true"
+    assert [user["id"] for user in response.json()] == ids[1:2]
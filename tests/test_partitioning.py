@@ -0,0 +1,262 @@
+"""
+The partitioned layout only exists in migrated databases (the test database
+is created from the models), so these tests migrate a scratch database.
+"""
+
+from datetime import date, datetime, timezone
+from pathlib import Path
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, text
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.auth import create_access_token
+from app.config import settings
+from app.db.partitions import (
+    default_partition_rows,
+    detach_partitions_before,
+    ensure_partitions,
+    is_partitioned,
+    list_partitions,
+)
+from app.db.session import get_primary_session, get_session
+from app.main import app
+from app.principal_cache import principal_cache
+
+ALEMBIC_DIR = Path(__file__).resolve().parent.parent / "alembic"
+
+
+@pytest.fixture
+def partitioned_engine():
+    from alembic import command
+    from alembic.config import Config
+
+    name = f"{settings.POSTGRES_DB}_partitioned"
+    admin_engine = create_engine(settings.DATABASE_URL, isolation_level="AUTOCOMMIT")
+    with admin_engine.connect() as connection:
+        connection.execute(text(f'DROP DATABASE IF EXISTS "{name}" WITH (FORCE)'))
+        connection.execute(text(f'CREATE DATABASE "{name}"'))
+
+    database_url = settings.DATABASE_URL.rsplit("/", 1)[0] + f"/{name}"
+    original_url = settings.DATABASE_URL
+    settings.DATABASE_URL = database_url  # read by alembic/env.py
+    try:
+        config = Config()
+        config.set_main_option("script_location", str(ALEMBIC_DIR))
+        command.upgrade(config, "head")
+    finally:
+        settings.DATABASE_URL = original_url
+
+    engine = create_engine(database_url)
+    yield engine
+    engine.dispose()
+    with admin_engine.connect() as connection:
+        connection.execute(text(f'DROP DATABASE "{name}" WITH (FORCE)'))
+    admin_engine.dispose()
+
+
+def rollup_mismatches(connection):
+    return connection.execute(
+        text(
+            """
+            SELECT count(*)
+            FROM (
+                SELECT team_id, (created_at AT TIME ZONE 'UTC')::date AS day,
+                       waste_type, count(*) AS entry_count, sum(weight_kg) AS total_kg
+                FROM wastelog
+                GROUP BY 1, 2, 3
+            ) AS actual
+            FULL JOIN wastelog_daily_rollup AS rollup USING (team_id, day, waste_type)
+            WHERE rollup.entry_count IS DISTINCT FROM actual.entry_count
+               OR rollup.total_kg IS DISTINCT FROM actual.total_kg
+            """
+        )
+    ).scalar_one()
+
+
+def test_monthly_partitions(partitioned_engine):
+    with partitioned_engine.begin() as connection:
+        assert is_partitioned(connection)
+        # the migration created partitions through a few months from now...
+        this_month = datetime.now(timezone.utc).date().replace(day=1)
+        assert (this_month, f"wastelog_y{this_month:%Y}m{this_month:%m}") in (
+            list_partitions(connection)
+        )
+        # ...and keeping them ahead is idempotent
+        ensure_partitions(connection, months_ahead=6)
+        assert ensure_partitions(connection, months_ahead=6) == []
+
+        connection.execute(
+            text("SELECT wastelog_ensure_partitions('2026-01-01', '2026-02-01')")
+        )
+        team_id = connection.execute(
+            text(
+                "INSERT INTO team (name, created_at, updated_at) "
+                "VALUES ('t', now(), now()) RETURNING id"
+            )
+        ).scalar_one()
+        user_id = connection.execute(
+            text(
+                'INSERT INTO "user" (username, email, hashed_password, role, '
+                "is_active, created_at, updated_at) "
+                "VALUES ('u', 'u@example.com', 'x', 'EMPLOYEE', true, now(), now()) "
+                "RETURNING id"
+            )
+        ).scalar_one()
+
+        def add_log(created_at, weight_kg):
+            return connection.execute(
+                text(
+                    "INSERT INTO wastelog (waste_type, weight_kg, team_id, "
+                    "created_by_id, created_at, updated_at) "
+                    "VALUES ('PAPER', :weight_kg, :team_id, :user_id, :at, :at) "
+                    "RETURNING tableoid::regclass::text"
+                ),
+                {
+                    "weight_kg": weight_kg,
+                    "team_id": team_id,
+                    "user_id": user_id,
+                    "at": created_at,
+                },
+            ).scalar_one()
+
+        assert add_log("2026-01-31 23:59:59+00", 1) == "wastelog_y2026m01"
+        assert add_log("2026-02-01 00:00:00+00", 2) == "wastelog_y2026m02"
+        # no partition for that month yet
+        assert add_log("2031-03-15 00:00:00+00", 4) == "wastelog_default"
+        assert default_partition_rows(connection) == 1
+        assert rollup_mismatches(connection) == 0
+
+        # moving a log to another month moves it to that partition, and its
+        # rollup totals with it
+        connection.execute(
+            text(
+                "UPDATE wastelog SET created_at = created_at - interval '1 day' "
+                "WHERE weight_kg = 2"
+            )
+        )
+        assert rollup_mismatches(connection) == 0
+
+        # a new partition takes over matching rows from the default partition
+        connection.execute(
+            text("SELECT wastelog_ensure_partitions('2031-03-01', '2031-03-01')")
+        )
+        assert (
+            connection.execute(
+                text(
+                    "SELECT tableoid::regclass::text FROM wastelog WHERE weight_kg = 4"
+                )
+            ).scalar_one()
+            == "wastelog_y2031m03"
+        )
+        assert default_partition_rows(connection) == 0
+
+        # time bounded queries only touch the matching partition
+        plan = connection.execute(
+            text(
+                "EXPLAIN (FORMAT JSON) SELECT count(*) FROM wastelog "
+                "WHERE team_id = :team_id AND created_at >= '2026-01-10+00' "
+                "AND created_at < '2026-01-20+00'"
+            ),
+            {"team_id": team_id},
+        ).scalar_one()
+        assert "wastelog_y2026m01" in str(plan)
+        assert "wastelog_y2026m02" not in str(plan)
+        assert "wastelog_default" not in str(plan)
+
+        # every write statement bumped the team's data version...
+        def data_version():
+            return connection.execute(
+                text("SELECT sum(version) FROM team_data_version WHERE team_id = :id"),
+                {"id": team_id},
+            ).scalar_one()
+
+        assert data_version() == 4
+
+        # retention removes whole months, from the rollup too
+        removed = detach_partitions_before(connection, date(2026, 2, 1), drop=True)
+        assert removed == ["wastelog_y2026m01"]
+        # ...and so does detaching, which fires no triggers
+        assert data_version() == 5
+        assert (
+            connection.execute(text("SELECT count(*) FROM wastelog")).scalar_one() == 1
+        )
+        assert rollup_mismatches(connection) == 0
+        assert detach_partitions_before(connection, date(2026, 2, 1)) == []
+
+
+def test_detaching_partitions_refreshes_cached_results(partitioned_engine):
+    with partitioned_engine.begin() as connection:
+        connection.execute(
+            text("SELECT wastelog_ensure_partitions('2026-01-01', '2026-02-01')")
+        )
+        team_id = connection.execute(
+            text(
+                "INSERT INTO team (name, created_at, updated_at) "
+                "VALUES ('t', now(), now()) RETURNING id"
+            )
+        ).scalar_one()
+        user_id = connection.execute(
+            text(
+                'INSERT INTO "user" (username, email, hashed_password, role, '
+                "is_active, created_at, updated_at) "
+                "VALUES ('m', 'm@example.com', 'x', 'MANAGER', true, now(), now()) "
+                "RETURNING id"
+            )
+        ).scalar_one()
+        connection.execute(
+            text(
+                "INSERT INTO wastelog (waste_type, weight_kg, team_id, "
+                "created_by_id, created_at, updated_at) "
+                "SELECT 'PAPER', 1, :team_id, :user_id, at, at "
+                "FROM unnest(ARRAY['2026-01-15+00', '2026-02-15+00']::timestamptz[]) "
+                "AS at"
+            ),
+            {"team_id": team_id, "user_id": user_id},
+        )
+
+    # the API on the partitioned database
+    async_engine = create_async_engine(
+        partitioned_engine.url.set(drivername="postgresql+asyncpg")
+    )
+    session_maker = async_sessionmaker(
+        async_engine, class_=AsyncSession, expire_on_commit=False
+    )
+
+    async def partitioned_session():
+        async with session_maker() as session:
+            yield session
+
+    app.dependency_overrides[get_session] = partitioned_session
+    app.dependency_overrides[get_primary_session] = partitioned_session
+    # user ids of this database may be cached for the test database's users
+    principal_cache.clear()
+    token = create_access_token(
+        {
+            "sub": "m",
+            "user_id": user_id,
+            "role": "manager",
+            "team_id": team_id,
+            "ver": 0,
+        }
+    )
+    headers = {"Authorization": f"Bearer {token}"}
+    try:
+        with TestClient(app) as client:
+
+            def total_entries():
+                response = client.get("/analytics/team-summary", headers=headers)
+                assert response.status_code == 200, response.text
+                return response.json()["total_entries"]
+
+            assert total_entries() == 2
+            with partitioned_engine.begin() as connection:
+                detach_partitions_before(connection, date(2026, 2, 1))
+            # not the cached summary of before
+            assert total_entries() == 1
+    finally:
+        app.dependency_overrides.clear()
+        principal_cache.clear()
+        async_engine.sync_engine.dispose()
@@ -0,0 +1,70 @@
+import asyncio
+
+import pytest
+from sqlalchemy import create_engine, exc, text
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import NullPool
+
+from app.config import settings
+from app.db.pool import InstrumentedAsyncPool, PoolMonitor, ping_idle_connections
+
+
+def test_readiness_reports_latency_and_pool(client, monkeypatch):
+    response = client.get("/health/ready")
+    assert response.status_code == 200, response.text
+    body = response.json()
+    assert body["status"] == "ready"
+    assert body["database"]["latency_ms"] > 0
+    assert body["pool"]["size"] == settings.DB_POOL_SIZE
+    assert body["pool"]["max_overflow"] == settings.DB_MAX_OVERFLOW
+    assert body["pool"]["wait_seconds"]["count"] >= 1
+
+    # a worker whose pool is saturated is taken out of rotation
+    monkeypatch.setattr(settings, "READINESS_MAX_POOL_SATURATION", 0.0)
+    response = client.get("/health/ready")
+    assert response.status_code == 503
+    assert response.json()["status"] == "unavailable"
+
+
+def test_checkout_timeouts_are_counted():
+    async def exhaust_pool():
+        engine = create_async_engine(
+            settings.ASYNC_DATABASE_URL,
+            poolclass=InstrumentedAsyncPool,
+            pool_size=1,
+            max_overflow=0,
+            pool_timeout=0.1,
+        )
+        monitor = PoolMonitor(engine, max_overflow=0)
+        try:
+            async with engine.connect():
+                assert monitor.saturation() == 1.0
+                with pytest.raises(exc.TimeoutError):
+                    async with engine.connect():
+                        pass
+        finally:
+            await engine.dispose()
+        return monitor.stats()
+
+    stats = asyncio.run(exhaust_pool())
+    assert stats["timeouts"] == 1
+    assert stats["waiting"] == 0
+    assert stats["wait_seconds"]["count"] == 2
+    assert stats["wait_seconds"]["max"] >= 0.1
+
+
+def test_idle_connections_are_pinged_and_replaced():
+    engine = create_engine(settings.DATABASE_URL, pool_size=1, max_overflow=0)
+    ping_idle_connections(engine, idle_seconds=0)
+    try:
+        with engine.connect() as connection:
+            pid = connection.scalar(text("SELECT pg_backend_pid()"))
+        # the server drops the pooled connection while it's idle
+        with create_engine(
+            settings.DATABASE_URL, poolclass=NullPool
+        ).connect() as other:
+            other.execute(text("SELECT pg_terminate_backend(:pid)"), {"pid": pid})
+        with engine.connect() as connection:
+            assert connection.scalar(text("SELECT pg_backend_pid()")) != pid
+    finally:
+        engine.dispose()
@@ -0,0 +1,113 @@
+"""
+Runs the routers' queries under EXPLAIN and fails if any of them needs a
+sequential scan. The tables here are tiny, where a seq scan is the planner's
+best choice, so they are explained with `enable_seqscan = off`: the planner
+then only falls back to one when no index can serve the query. Likewise,
+`enable_sort = off` leaves a Sort in a listing only if no index has the
+rows in order.
+"""
+
+import asyncio
+import json
+from contextlib import contextmanager
+
+import asyncpg
+from sqlalchemy import event
+
+from app.config import settings
+from app.db.session import async_engine
+from app.models.user import UserRole
+
+
+@contextmanager
+def record_queries():
+    queries = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, *args):
+        if statement.lstrip().upper().startswith("SELECT"):
+            queries.append((statement, parameters))
+
+    event.listen(
+        async_engine.sync_engine, "before_cursor_execute", before_cursor_execute
+    )
+    try:
+        yield queries
+    finally:
+        event.remove(
+            async_engine.sync_engine, "before_cursor_execute", before_cursor_execute
+        )
+
+
+def plan_nodes(plan):
+    yield plan
+    for child in plan.get("Plans", []):
+        yield from plan_nodes(child)
+
+
+async def explain_all(queries):
+    connection = await asyncpg.connect(settings.DATABASE_URL)
+    try:
+        await connection.execute("ANALYZE")
+        await connection.execute("SET enable_seqscan = off")
+        await connection.execute("SET enable_sort = off")
+        plans = []
+        for statement, parameters in queries:
+            result = await connection.fetchval(
+                f"EXPLAIN (FORMAT JSON) {statement}", *parameters
+            )
+            plans.append(json.loads(result)[0]["Plan"])
+        return plans
+    finally:
+        await connection.close()
+
+
+def test_router_queries_use_indexes(client, team_members, auth_headers):
+    team, members = team_members
+    admin = auth_headers(UserRole.ADMIN)
+    manager = auth_headers(UserRole.MANAGER)
+    employee = auth_headers(UserRole.EMPLOYEE)
+    for i in range(3):
+        response = client.post(
+            "/waste-logs/",
+            json={"waste_type": "paper", "weight_kg": i + 1},
+            headers=employee,
+        )
+    log_id = response.json()["id"]
+
+    def get(url, headers, **params):
+        response = client.get(url, params=params, headers=headers)
+        assert response.status_code == 200, response.text
+        return response
+
+    with record_queries() as queries:
+        cursor = get("/waste-logs/", admin, limit=1).headers["X-Next-Cursor"]
+        get("/waste-logs/", admin, limit=1, cursor=cursor)
+        get(f"/waste-logs/{log_id}", employee)
+        cursor = get("/analytics/team-logs", manager, limit=1).headers["X-Next-Cursor"]
+        get("/analytics/team-logs", manager, limit=1, cursor=cursor)
+        get("/analytics/team-summary", manager)
+        for tz, bucket in [("UTC", "day"), ("Europe/Berlin", "hour")]:
+            get(
+                "/analytics/timeseries",
+                manager,
+                start="2026-01-01T00:00:00Z",
+                end="2026-01-03T00:00:00Z",
+                tz=tz,
+                bucket=bucket,
+                by_type=True,
+            )
+        cursor = get("/users/", admin, limit=1).headers["X-Next-Cursor"]
+        get("/users/", admin, limit=1, cursor=cursor)
+        get(f"/users/{members[UserRole.EMPLOYEE].id}", admin)
+        get("/teams/", admin)
+        get(f"/teams/{team.id}", manager)
+    assert queries
+
+    plans = asyncio.run(explain_all(queries))
+    for (statement, _), plan in zip(queries, plans):
+        nodes = list(plan_nodes(plan))
+        seq_scans = [n["Relation Name"] for n in nodes if n["Node Type"] == "Seq Scan"]
+        assert not seq_scans, f"Sequential scan on {seq_scans}:\n{statement}"
+        # keyset pages of logs come straight off an index, in order
+        if statement.startswith("SELECT wastelog.") and "ORDER BY" in statement:
+            assert not [n for n in nodes if n["Node Type"] == "Sort"], statement
@@ -0,0 +1,72 @@
+import asyncio
+import logging
+
+from app.models.user import UserRole
+from app.query_tracking import QueryTrackingMiddleware, current_queries
+
+
+def run_request(app):
+    """Runs one GET request through an ASGI app, returning the start message."""
+    messages = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {"type": "http", "method": "GET", "path": "/", "headers": []}
+    asyncio.run(app(scope, receive, send))
+    return messages[0]
+
+
+def test_repeated_queries_and_budget_overruns_are_logged(caplog):
+    async def n_plus_one(scope, receive, send):
+        queries = current_queries.get()
+        queries.record("SELECT team.id FROM team", 0.002)
+        for _ in range(5):
+            queries.record("SELECT user.id FROM user WHERE user.team_id = $1", 0.001)
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+
+    app = QueryTrackingMiddleware(n_plus_one, budget=5, repeat_threshold=5)
+    with caplog.at_level(logging.WARNING, logger="app.query_tracking"):
+        start = run_request(app)
+
+    assert dict(start["headers"])[b"server-timing"] == b'db;dur=7.0;desc="6 queries"'
+    assert "ran 6 queries, over the budget of 5" in caplog.text
+    assert "ran the same query 5 times (N+1?): SELECT user.id" in caplog.text
+    assert "SELECT team.id" not in caplog.text
+    assert current_queries.get() is None
+
+
+def test_endpoint_query_budgets(client, team_members, auth_headers, query_budget):
+    employee = auth_headers(UserRole.EMPLOYEE)
+    manager = auth_headers(UserRole.MANAGER)
+    admin = auth_headers(UserRole.ADMIN)
+    log = client.post(
+        "/waste-logs/", json={"waste_type": "glass", "weight_kg": 1}, headers=employee
+    ).json()
+
+    # once warm, authentication is served from the principal cache, so the
+    # budgets are the handlers' own queries
+    budgets = [
+        (f"/waste-logs/{log['id']}", employee, 1),
+        ("/waste-logs/", admin, 1),
+        ("/analytics/team-logs", manager, 2),
+        ("/analytics/team-summary", manager, 1),
+        (
+            "/analytics/timeseries?start=2026-01-01T00:00:00Z&end=2026-01-08T00:00:00Z",
+            manager,
+            2,
+        ),
+    ]
+    for path, headers, budget in budgets:
+        client.get(path, headers=headers)
+        with query_budget(budget) as requests:
+            response = client.get(path, headers=headers)
+        assert response.status_code == 200, response.text
+        ((_, route, queries),) = requests
+        assert response.headers["Server-Timing"].endswith(
+            f'desc="{queries.count} {"query" if queries.count == 1 else "queries"}"'
+        )
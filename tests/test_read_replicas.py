@@ -0,0 +1,216 @@
+from contextlib import contextmanager
+from datetime import timedelta
+
+import pytest
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from sqlmodel import select
+
+import app.db.session as db_session
+from app.auth import create_user_access_token
+from app.config import settings
+from app.db.routing import LSN_COOKIE, ReadRouter, parse_lsn
+from app.models.user import User, UserRole
+from app.result_cache import result_cache
+
+# the test database stands in for a replica: a server that isn't in recovery
+# reports itself as fully caught up
+REPLICA_URL = settings.ASYNC_DATABASE_URL
+UNREACHABLE_URL = REPLICA_URL.replace(f":{settings.POSTGRES_PORT}/", ":1/")
+
+
+def make_router(urls, max_lag_bytes=1024):
+    return ReadRouter(
+        db_session.async_engine,
+        urls,
+        max_lag_bytes=max_lag_bytes,
+        check_interval_seconds=2,
+        read_your_writes_seconds=60,
+    )
+
+
+@pytest.fixture()
+def read_router(client, monkeypatch):
+    """Routes the app's reads through a router with one stand-in replica."""
+    router = make_router([REPLICA_URL])
+    client.portal.call(router.check_replicas)
+    monkeypatch.setattr(db_session, "read_router", router)
+    yield router
+    client.portal.call(router.stop)
+
+
+@contextmanager
+def lagging(replica):
+    """
+    Makes the stand-in replica lag: its transactions see the data as it is
+    when the block starts.
+    """
+    with db_session.engine.connect() as snapshot_connection:
+        snapshot_connection = snapshot_connection.execution_options(
+            isolation_level="REPEATABLE READ"
+        )
+        snapshot = snapshot_connection.exec_driver_sql(
+            "SELECT pg_export_snapshot()"
+        ).scalar()
+
+        def read_snapshot(session, transaction, connection):
+            if connection.engine is replica.engine.sync_engine:
+                connection.exec_driver_sql(
+                    "SET TRANSACTION ISOLATION LEVEL REPEATABLE READ"
+                )
+                connection.exec_driver_sql(f"SET TRANSACTION SNAPSHOT '{snapshot}'")
+
+        event.listen(Session, "after_begin", read_snapshot)
+        try:
+            yield
+        finally:
+            event.remove(Session, "after_begin", read_snapshot)
+
+
+def count_statements(engine):
+    statements = []
+    event.listen(
+        engine.sync_engine,
+        "before_cursor_execute",
+        lambda *args: statements.append(args[2]),
+    )
+    return statements
+
+
+def test_reads_go_to_replicas_and_writes_to_the_primary(
+    client, team_members, auth_headers, read_router
+):
+    employee = auth_headers(UserRole.EMPLOYEE)
+    manager = auth_headers(UserRole.MANAGER)
+    (replica,) = read_router.replicas
+    assert replica.healthy and replica.lag_bytes == 0
+    replica_statements = count_statements(replica.engine)
+
+    response = client.get("/analytics/team-logs", headers=manager)
+    assert response.status_code == 200, response.text
+    assert replica.reads == 1
+    assert replica_statements
+
+    replica_statements.clear()
+    response = client.post(
+        "/waste-logs/",
+        json={"waste_type": "glass", "weight_kg": 1.5},
+        headers=employee,
+    )
+    assert response.status_code == 201, response.text
+    assert not replica_statements
+    assert parse_lsn(response.cookies[LSN_COOKIE]) > 0
+
+
+@pytest.mark.parametrize("write_batching", [False, True])
+def test_clients_read_their_own_writes(
+    client, team_members, auth_headers, read_router, monkeypatch, write_batching
+):
+    monkeypatch.setattr(settings, "WRITE_BATCHING", write_batching)
+    employee = auth_headers(UserRole.EMPLOYEE)
+    (replica,) = read_router.replicas
+    response = client.post(
+        "/waste-logs/",
+        json={"waste_type": "glass", "weight_kg": 1.5},
+        headers=employee,
+    )
+    log_id = response.json()["id"]
+    write_lsn = parse_lsn(response.cookies[LSN_COOKIE])
+
+    # a replica that hasn't replayed the write yet isn't used for this client
+    replica.replay_lsn = write_lsn - 1
+    response = client.get(f"/waste-logs/{log_id}", headers=employee)
+    assert response.status_code == 200, response.text
+    assert replica.reads == 0
+    assert read_router.pinned_reads == 1
+
+    # ... also without the cookie, for the same token in this worker
+    client.cookies.clear()
+    client.get(f"/waste-logs/{log_id}", headers=employee)
+    assert replica.reads == 0
+    assert read_router.pinned_reads == 2
+
+    replica.replay_lsn = write_lsn
+    response = client.get(f"/waste-logs/{log_id}", headers=employee)
+    assert response.status_code == 200, response.text
+    assert replica.reads == 1
+
+
+def test_revoked_tokens_are_rejected_while_replicas_lag(
+    client, team_members, auth_headers, read_router
+):
+    _, members = team_members
+    manager = members[UserRole.MANAGER]
+    headers = auth_headers(UserRole.MANAGER)
+    admin = auth_headers(UserRole.ADMIN)
+    (replica,) = read_router.replicas
+
+    async def replica_token_version():
+        async with replica.session_maker() as session:
+            query = select(User.token_version).where(User.id == manager.id)
+            return (await session.exec(query)).one()
+
+    with lagging(replica):
+        response = client.post(f"/users/{manager.id}/invalidate-token", headers=admin)
+        assert response.status_code == 200, response.text
+        assert client.portal.call(replica_token_version) == manager.token_version
+        # the admin's read-your-writes cookie doesn't pin the manager's reads
+        client.cookies.clear()
+
+        # the token's version is checked on the primary, not the replica
+        for path in ("/teams/", "/users/me"):
+            response = client.get(path, headers=headers)
+            assert response.status_code == 400, response.text
+        assert read_router.pinned_reads == 0
+
+
+def test_cached_results_include_the_clients_own_writes(
+    client, team_members, auth_headers, read_router
+):
+    _, members = team_members
+    headers = auth_headers(UserRole.MANAGER)
+    # another of the manager's sessions, which isn't pinned by its writes
+    other = {
+        "Authorization": "Bearer "
+        + create_user_access_token(members[UserRole.MANAGER], timedelta(minutes=5))
+    }
+    (replica,) = read_router.replicas
+    path = "/analytics/team-summary"
+
+    with lagging(replica):
+        response = client.post(
+            "/waste-logs/",
+            json={"waste_type": "glass", "weight_kg": 2},
+            headers=headers,
+        )
+        assert response.status_code == 201, response.text
+        client.cookies.clear()
+
+        # the other session fills the cache from the replica, without the log
+        assert client.get(path, headers=other).json()["total_entries"] == 0
+        assert client.get(path, headers=other).json()["total_entries"] == 0
+
+        # the writer reads its log, from the primary instead of the cache
+        stale_skips = result_cache.stats()["stale_skips"]
+        assert client.get(path, headers=headers).json()["total_entries"] == 1
+        assert result_cache.stats()["stale_skips"] == stale_skips + 1
+        assert read_router.pinned_reads == 1
+
+
+def test_failing_and_lagging_replicas_are_ejected(client):
+    router = make_router([REPLICA_URL, UNREACHABLE_URL])
+    good, bad = router.replicas
+    client.portal.call(router.check_replicas)
+    assert good.healthy
+    assert not bad.healthy and bad.last_error
+
+    router.max_lag_bytes = -1
+    client.portal.call(router.check_replicas)
+    assert not good.healthy and good.ejections == 1
+    assert "behind the primary" in good.last_error
+    assert router.stats()["replicas"][0]["healthy"] is False
+
+    router.max_lag_bytes = 1024
+    client.portal.call(router.check_replicas)
+    assert good.healthy and good.last_error is None
+    client.portal.call(router.stop)
@@ -0,0 +1,90 @@
+import time
+
+from app.models.user import UserRole
+from app.result_cache import FileBackend, result_cache
+
+
+def test_cached_results_are_invalidated_by_writes(
+    client, team_members, auth_headers, query_budget
+):
+    employee = auth_headers(UserRole.EMPLOYEE)
+    manager = auth_headers(UserRole.MANAGER)
+    admin = auth_headers(UserRole.ADMIN)
+    paths = ("/analytics/team-summary", "/analytics/team-logs", "/teams/")
+
+    def cached_totals():
+        bodies = [client.get(path, headers=manager).json() for path in paths]
+        hits = result_cache.stats()["hits"]
+        # served from the cache, without a query
+        with query_budget(0):
+            for path, body in zip(paths, bodies):
+                response = client.get(path, headers=manager)
+                assert response.status_code == 200
+                assert response.json() == body
+        assert result_cache.stats()["hits"] == hits + len(paths)
+        summary, logs, _ = bodies
+        return summary["total_entries"], len(logs), summary["total_waste_kg"]
+
+    assert cached_totals() == (0, 0, 0)
+    log = client.post(
+        "/waste-logs/", json={"waste_type": "glass", "weight_kg": 2}, headers=employee
+    ).json()
+    assert cached_totals() == (1, 1, 2)
+    log_path = f"/waste-logs/{log['id']}"
+    client.patch(log_path, json={"weight_kg": 4}, headers=admin)
+    assert cached_totals() == (1, 1, 4)
+    items = [{"waste_type": "paper", "weight_kg": 1}] * 2
+    client.post("/waste-logs/bulk", json={"items": items}, headers=employee)
+    assert cached_totals() == (3, 3, 6)
+    client.delete(log_path, headers=admin)
+    assert cached_totals() == (2, 2, 2)
+
+    # a team update invalidates the team lists
+    team, _ = team_members
+    client.get("/teams/", headers=admin)
+    client.patch(f"/teams/{team.id}", json={"name": "Renamed"}, headers=admin)
+    names = [each["name"] for each in client.get("/teams/", headers=admin).json()]
+    assert "Renamed" in names
+    assert client.get("/teams/", headers=manager).json()[0]["name"] == "Renamed"
+
+    # a cached response answers revalidations too
+    path = "/analytics/team-summary"
+    etag = client.get(path, headers=manager).headers["ETag"]
+    with query_budget(0):
+        response = client.get(path, headers={**manager, "If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.headers["ETag"] == etag
+
+    stats = client.get("/internal/stats", headers=admin).json()["result_cache"]
+    assert stats["hits"] > 0 and stats["misses"] > 0
+    assert "evictions" in stats
+
+
+def test_file_backend(tmp_path):
+    backend = FileBackend(str(tmp_path), max_size=10, ttl_seconds=60)
+    assert backend.get("a") is None
+    backend.set("a", b"value\nwith a newline")
+    assert backend.get("a") == b"value\nwith a newline"
+
+    # another worker sees the entries and generations
+    other = FileBackend(str(tmp_path), max_size=10, ttl_seconds=60)
+    assert other.get("a") == b"value\nwith a newline"
+    generation = backend.generation("1")
+    other.invalidate("1")
+    assert backend.generation("1") != generation
+    assert backend.generation("2") == "0"
+
+    # the oldest entries beyond max_size are evicted
+    for i in range(12):
+        backend.set(str(i), b"")
+    assert backend.stats()["size"] == 10
+    assert backend.stats()["evictions"] == 3
+    assert backend.get("a") is None
+
+    expiring = FileBackend(str(tmp_path), max_size=10, ttl_seconds=0.01)
+    expiring.set("b", b"value")
+    time.sleep(0.02)
+    assert expiring.get("b") is None
+    assert expiring.stats()["expirations"] == 1
+    backend.clear()
+    assert backend.stats()["size"] == 0
@@ -0,0 +1,64 @@
+from datetime import datetime, timedelta, timezone
+
+from fastapi.responses import JSONResponse
+
+from app.main import app
+from app.models.user import UserRole
+from app.models.waste import WasteLog, WasteType
+from app.schemas.waste import WasteLogRead
+
+
+def test_row_responses_match_fastapi_serialisation(
+    client, session, team_members, auth_headers
+):
+    team, members = team_members
+    employee = members[UserRole.EMPLOYEE]
+    at = datetime(2026, 3, 1, 12, 30, 5, 120, tzinfo=timezone.utc)
+    logs = [
+        WasteLog(
+            waste_type=WasteType.ELECTRONIC,
+            weight_kg=weight,
+            description=description,
+            team_id=team.id,
+            created_by_id=employee.id,
+            created_at=at + timedelta(seconds=i),
+            updated_at=at + timedelta(seconds=i),
+        )
+        for i, (weight, description) in enumerate(
+            [(0.1, 'old "fridge" \\ door'), (12, None), (2.75, "")]
+        )
+    ]
+    session.add_all(logs)
+    session.commit()
+
+    response = client.get(
+        "/analytics/team-logs",
+        params={"limit": 2},
+        headers=auth_headers(UserRole.MANAGER),
+    )
+    assert response.status_code == 200
+    assert "X-Next-Cursor" in response.headers
+    # the body FastAPI would have built from the ORM entities
+    expected = [
+        WasteLogRead.model_validate(log).model_dump(mode="json")
+        for log in sorted(logs, key=lambda log: log.created_at, reverse=True)[:2]
+    ]
+    assert response.content == JSONResponse(expected).body
+
+    log = logs[0]
+    response = client.get(
+        f"/waste-logs/{log.id}", headers=auth_headers(UserRole.EMPLOYEE)
+    )
+    expected = WasteLogRead.model_validate(log).model_dump(mode="json")
+    assert response.content == JSONResponse(expected).body
+
+
+def test_response_schemas_are_documented():
+    paths = app.openapi()["paths"]
+    content = paths["/waste-logs/"]["get"]["responses"]["200"]["content"]
+    schema = content["application/json"]["schema"]
+    assert schema["items"] == {"$ref": "#/components/schemas/WasteLogRead"}
+    content = paths["/users/{user_id}"]["get"]["responses"]["200"]["content"]
+    assert content["application/json"]["schema"] == {
+        "$ref": "#/components/schemas/UserRead"
+    }
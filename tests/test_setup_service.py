@@ -0,0 +1,46 @@
+import random
+from datetime import date
+
+from app.models.waste import WasteType
+from app.setup_service import (
+    DEFAULT_WASTE_TYPES,
+    generate_waste_logs,
+    logs_per_day,
+    parse_waste_types,
+)
+
+
+def test_waste_logs_are_reproducible_and_in_time_order():
+    employees = [(user_id, user_id % 3 + 1) for user_id in range(10, 40)]
+
+    def generate(seed):
+        lines = generate_waste_logs(
+            random.Random(seed),
+            employees,
+            5000,
+            date(2026, 1, 5),
+            14,
+            DEFAULT_WASTE_TYPES,
+        )
+        return list(lines)
+
+    lines = generate(42)
+    assert lines == generate(42)
+    assert lines != generate(43)
+    assert len(lines) == 5000
+
+    rows = [line.rstrip("\n").split("\t") for line in lines]
+    timestamps = [row[4] for row in rows]
+    assert timestamps == sorted(timestamps)
+    assert timestamps[0] >= "2026-01-05" and timestamps[-1] < "2026-01-19"
+    assert {row[0] for row in rows} == {waste_type.name for waste_type in WasteType}
+    assert all((int(row[3]), int(row[2])) in employees for row in rows)
+    # working days are busier than weekends (2026-01-10 is a Saturday)
+    per_day = logs_per_day(5000, 14, date(2026, 1, 5))
+    assert sum(per_day) == 5000
+    assert per_day[5] < per_day[4] / 3
+
+
+def test_parse_waste_types():
+    weights = parse_waste_types("paper=3, Glass=1")
+    assert weights == {WasteType.PAPER: 3.0, WasteType.GLASS: 1.0}
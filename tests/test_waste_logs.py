@@ -0,0 +1,127 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from app.models.user import UserRole
+
+
+def test_create_and_read_waste_log(client, auth_headers):
+    headers = auth_headers(UserRole.EMPLOYEE)
+
+    response = client.post(
+        "/waste-logs/", json={"waste_type": "paper", "weight_kg": 2.5}, headers=headers
+    )
+    assert response.status_code == 201, response.text
+    created = response.json()
+
+    response = client.get(f"/waste-logs/{created['id']}", headers=headers)
+    assert response.status_code == 200, response.text
+    assert response.json() == created
+
+
+def test_team_summary(client, auth_headers):
+    employee = auth_headers(UserRole.EMPLOYEE)
+    for waste_type, weight_kg in [("paper", 1.5), ("paper", 2.0), ("glass", 4.0)]:
+        response = client.post(
+            "/waste-logs/",
+            json={"waste_type": waste_type, "weight_kg": weight_kg},
+            headers=employee,
+        )
+        assert response.status_code == 201, response.text
+
+    response = client.get(
+        "/analytics/team-summary", headers=auth_headers(UserRole.MANAGER)
+    )
+    assert response.status_code == 200, response.text
+    summary = response.json()
+    assert summary["total_entries"] == 3
+    assert summary["total_waste_kg"] == 7.5
+    assert summary["waste_by_type"]["paper"] == 3.5
+    assert summary["waste_by_type"]["glass"] == 4.0
+    assert len(summary["recent_entries"]) == 3
+
+
+def test_bulk_create(client, team_members, auth_headers):
+    team, members = team_members
+    employee = auth_headers(UserRole.EMPLOYEE)
+    items = [{"waste_type": "paper", "weight_kg": i + 1} for i in range(500)]
+    bad_items = items[:2] + [{"waste_type": "gold", "weight_kg": "heavy"}]
+
+    # atomic (the default): one bad item and nothing is created
+    response = client.post(
+        "/waste-logs/bulk", json={"items": bad_items}, headers=employee
+    )
+    assert response.status_code == 400, response.text
+    assert response.json()["created_ids"] == []
+    assert {(e["index"], e["field"]) for e in response.json()["errors"]} == {
+        (2, "waste_type"),
+        (2, "weight_kg"),
+    }
+
+    # partial: the valid items are created
+    response = client.post(
+        "/waste-logs/bulk", json={"items": bad_items, "atomic": False}, headers=employee
+    )
+    assert response.status_code == 201, response.text
+    assert len(response.json()["created_ids"]) == 2
+    assert len(response.json()["errors"]) == 2
+
+    response = client.post("/waste-logs/bulk", json={"items": items}, headers=employee)
+    assert response.status_code == 201, response.text
+    created_ids = response.json()["created_ids"]
+    assert response.json()["errors"] == []
+    # ids come back in item order
+    log = client.get(f"/waste-logs/{created_ids[41]}", headers=employee).json()
+    assert log["weight_kg"] == 42
+    assert log["team_id"] == team.id
+    assert log["created_by_id"] == members[UserRole.EMPLOYEE].id
+
+    summary = client.get(
+        "/analytics/team-summary", headers=auth_headers(UserRole.MANAGER)
+    ).json()
+    assert summary["total_entries"] == 502
+    assert summary["total_waste_kg"] == 3 + 500 * 501 / 2
+
+    # the team permission check still applies
+    response = client.post(
+        "/waste-logs/bulk",
+        params={"team_id": team.id + 1},
+        json={"items": items[:1]},
+        headers=employee,
+    )
+    assert response.status_code == 400
+
+    # items that aren't objects at all fail the request
+    response = client.post(
+        "/waste-logs/bulk", json={"items": items[:1] + [42]}, headers=employee
+    )
+    assert response.status_code == 422, response.text
+
+
+def test_bulk_items_are_documented_as_waste_logs(client):
+    schemas = client.get("/openapi.json").json()["components"]["schemas"]
+    assert schemas["WasteLogBulkCreate"]["properties"]["items"]["items"] == {
+        "$ref": "#/components/schemas/WasteLogCreate"
+    }
+    assert "waste_type" in schemas["WasteLogCreate"]["properties"]
+
+
+def test_concurrent_bulk_creates_dont_deadlock(client, team_members, auth_headers):
+    employee = auth_headers(UserRole.EMPLOYEE)
+    # each request spans several INSERTs, over the same rollup rows in
+    # opposite orders
+    paper = [{"waste_type": "paper", "weight_kg": 1}] * 1500
+    glass = [{"waste_type": "glass", "weight_kg": 2}] * 1500
+
+    def create(items):
+        return client.post("/waste-logs/bulk", json={"items": items}, headers=employee)
+
+    with ThreadPoolExecutor(2) as executor:
+        for _ in range(3):
+            responses = list(executor.map(create, [paper + glass, glass + paper]))
+            for response in responses:
+                assert response.status_code == 201, response.text
+
+    # ids still come back in item order
+    created_ids = responses[1].json()["created_ids"]
+    for index, waste_type in [(0, "glass"), (1499, "glass"), (1500, "paper")]:
+        log = client.get(f"/waste-logs/{created_ids[index]}", headers=employee).json()
+        assert log["waste_type"] == waste_type
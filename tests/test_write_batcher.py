@@ -0,0 +1,96 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlmodel import select
+
+from app.config import settings
+from app.helpers import utc_now
+from app.models.user import UserRole
+from app.models.waste import WasteLog
+from app.routers.waste_log import write_batcher
+
+
+def test_concurrent_creates_are_group_committed(
+    client, team_members, auth_headers, monkeypatch, query_budget
+):
+    team, members = team_members
+    monkeypatch.setattr(settings, "WRITE_BATCHING", True)
+    monkeypatch.setattr(write_batcher, "max_rows", 5)
+    # long enough for all the requests to be queued
+    monkeypatch.setattr(write_batcher, "max_delay_seconds", 1)
+    employee = auth_headers(UserRole.EMPLOYEE)
+    admin = auth_headers(UserRole.ADMIN)
+    before = write_batcher.stats()
+
+    def create(i):
+        if i == 0:
+            # a team that doesn't exist: only this request fails
+            return client.post(
+                "/waste-logs/",
+                params={"team_id": team.id + 1000},
+                json={"waste_type": "paper", "weight_kg": 1},
+                headers=admin,
+            )
+        return client.post(
+            "/waste-logs/",
+            json={"waste_type": "glass", "weight_kg": i},
+            headers=employee,
+        )
+
+    with query_budget(settings.QUERY_BUDGET) as requests:
+        with ThreadPoolExecutor(5) as executor:
+            responses = list(executor.map(create, range(5)))
+    # the batch's statements aren't any one request's
+    for _, _, queries in requests:
+        assert not any("INSERT" in statement for statement in queries.statements)
+
+    assert responses[0].status_code == 400
+    for i, response in enumerate(responses[1:], start=1):
+        assert response.status_code == 201, response.text
+        log = response.json()
+        assert log["weight_kg"] == i
+        assert log["team_id"] == team.id
+        assert log["created_by_id"] == members[UserRole.EMPLOYEE].id
+        assert client.get(f"/waste-logs/{log['id']}", headers=employee).json() == log
+
+    stats = client.get("/internal/stats", headers=admin).json()["write_batching"]
+    assert stats["rows"] - before["rows"] == 5
+    assert stats["batches"] - before["batches"] == 1
+    assert stats["retried_batches"] - before["retried_batches"] == 1
+    assert stats["failed_rows"] - before["failed_rows"] == 1
+    # the batch, then each row on its own
+    assert stats["commits"] - before["commits"] == 4
+    assert stats["queued"] == 0
+
+
+def test_rows_of_cancelled_callers_are_dropped(client, team_members, session):
+    team, members = team_members
+    now = utc_now()
+    row = {
+        "waste_type": "glass",
+        "weight_kg": 1,
+        "description": None,
+        "team_id": team.id,
+        "created_by_id": members[UserRole.EMPLOYEE].id,
+        "created_at": now,
+        "updated_at": now,
+    }
+    before = write_batcher.stats()
+
+    async def cancel_one():
+        cancelled = asyncio.create_task(write_batcher.add(row))
+        written = asyncio.create_task(write_batcher.add({**row, "weight_kg": 2}))
+        # both rows are queued
+        await asyncio.sleep(0)
+        cancelled.cancel()
+        await write_batcher.drain()
+        return await written
+
+    written = client.portal.call(cancel_one)
+    weights = session.exec(
+        select(WasteLog.weight_kg).where(WasteLog.team_id == team.id)
+    ).all()
+    assert weights == [written.weight_kg] == [2]
+    stats = write_batcher.stats()
+    assert stats["rows"] - before["rows"] == 1
+    assert stats["cancelled_rows"] - before["cancelled_rows"] == 1